@@ -0,0 +1,155 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import FL_AGGREGATION_WORKERS, FL_AGGREGATION_FILES_PER_TASK
+from FL_scripts.update_format import read_update_file
+
+# Older clients upload JSON, current ones the binary format of FL_scripts/update_format.py
+BINARY_UPDATE_EXTENSION = '.flup'
+CLIENT_UPDATE_EXTENSIONS = ('.json', BINARY_UPDATE_EXTENSION)
+
+
+class AggregationResult:
+    """
+    Outcome of aggregating one round.
+
+    Attributes:
+        mean (np.ndarray): float32 mean of the accepted updates.
+        accepted (int): Number of client updates that went into the mean.
+        rejected (dict): Client name -> reason, for every update that was skipped.
+    """
+
+    def __init__(self, mean: np.ndarray, accepted: int, rejected: Dict[str, str]):
+        self.mean = mean
+        self.accepted = accepted
+        self.rejected = rejected
+
+
+def list_client_updates(folder_path: str) -> List[str]:
+    """Paths of the client update files in a round folder, in a stable order."""
+    return sorted(
+        os.path.join(folder_path, f) for f in os.listdir(folder_path) if f.endswith(CLIENT_UPDATE_EXTENSIONS)
+    )
+
+
+def parse_client_update(file_path: str, expected_round: Optional[int] = None,
+                        expected_model_hash: Optional[bytes] = None) -> np.ndarray:
+    """
+    Read one client update into a flat float32 array.
+
+    Binary updates are checked against `expected_round` and `expected_model_hash` when given (JSON updates
+    carry neither).
+
+    Raises:
+        ValueError: If the file is not a valid update.
+    """
+    if file_path.endswith(BINARY_UPDATE_EXTENSION):
+        header, params = read_update_file(file_path)
+        if expected_round is not None and header.round_number != expected_round:
+            raise ValueError(f"update is for round {header.round_number}, not {expected_round}")
+        if expected_model_hash is not None and header.model_hash != expected_model_hash:
+            raise ValueError("update was trained on a different model checkpoint")
+        return params
+
+    with open(file_path, 'r') as file:
+        try:
+            json_data = json.load(file)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"invalid JSON: {e}")
+    if not isinstance(json_data, dict) or 'params' not in json_data:
+        raise ValueError("missing 'params'")
+    try:
+        return np.asarray(json_data['params'], dtype=np.float32)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"'params' is not a flat list of numbers: {e}")
+
+
+def _client_name(file_path: str) -> str:
+    return os.path.splitext(os.path.basename(file_path))[0]
+
+
+def _aggregate_files(file_paths: List[str], expected_size: int, expected_round: Optional[int] = None,
+                     expected_model_hash: Optional[bytes] = None) -> Tuple[Optional[np.ndarray], int, Dict[str, str]]:
+    """
+    Mean of a group of client files, computed in a worker process.
+
+    Returns the partial mean (None if nothing was accepted), how many updates it covers and the rejections.
+    Only one array per group crosses the process boundary.
+    """
+    mean = np.zeros(expected_size, dtype=np.float32)
+    count = 0
+    rejected = {}
+    for file_path in file_paths:
+        try:
+            params = parse_client_update(file_path, expected_round, expected_model_hash)
+        except (OSError, ValueError) as e:
+            rejected[_client_name(file_path)] = str(e)
+            continue
+        if params.ndim != 1 or params.shape[0] != expected_size:
+            rejected[_client_name(file_path)] = f"expected {expected_size} params, got shape {params.shape}"
+            continue
+        if not np.isfinite(params).all():
+            rejected[_client_name(file_path)] = "params contain NaN or infinity"
+            continue
+        # Welford update of the running mean, stays in float32 without a clients x params matrix
+        # (params may be a read-only view of a memory mapped file, so it is not updated in place)
+        count += 1
+        delta = params - mean
+        delta /= count
+        mean += delta
+    return (mean if count else None), count, rejected
+
+
+def aggregate_round(folder_path: str, expected_size: int, workers: int = FL_AGGREGATION_WORKERS,
+                    files_per_task: int = FL_AGGREGATION_FILES_PER_TASK, expected_round: Optional[int] = None,
+                    expected_model_hash: Optional[bytes] = None) -> AggregationResult:
+    """
+    Mean of every valid client update in a round folder.
+
+    Files are parsed in parallel in groups of `files_per_task`, each group is reduced to a partial mean
+    in its worker and the partial means are merged here in a preallocated float32 buffer, so memory is
+    O(params) per worker rather than O(clients x params). Malformed or wrongly sized updates are skipped
+    and reported in the result, as are binary updates for another round or model checkpoint.
+    With `workers` <= 1 everything runs in the calling process.
+
+    Raises:
+        ValueError: If no client update could be used.
+    """
+    file_paths = list_client_updates(folder_path)
+    print(f"Found {len(file_paths)} files in {folder_path}")
+    groups = [file_paths[i:i + files_per_task] for i in range(0, len(file_paths), files_per_task)]
+
+    mean = np.zeros(expected_size, dtype=np.float32)
+    accepted = 0
+    rejected = {}
+
+    def merge(partial_mean, count, partial_rejected):
+        nonlocal accepted
+        rejected.update(partial_rejected)
+        if count == 0:
+            return
+        # Combine two means weighted by their counts (Chan et al.)
+        accepted += count
+        partial_mean -= mean
+        partial_mean *= count / accepted
+        mean[:] += partial_mean
+
+    if workers <= 1 or len(groups) <= 1:
+        for group in groups:
+            merge(*_aggregate_files(group, expected_size, expected_round, expected_model_hash))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+            for partial in executor.map(_aggregate_files, groups, [expected_size] * len(groups),
+                                        [expected_round] * len(groups), [expected_model_hash] * len(groups)):
+                merge(*partial)
+
+    for client, reason in rejected.items():
+        print(f"Skipped client update {client}: {reason}")
+    if accepted == 0:
+        raise ValueError(f"No valid client updates in {folder_path}")
+    print(f"Aggregated {accepted} client updates, skipped {len(rejected)}")
+    return AggregationResult(mean, accepted, rejected)
@@ -1,12 +1,17 @@
 import os
 import shutil
 
+import numpy as np
 
 
-from FL_scripts.aggregator_helpers import load_json_files, mean_aggregate, set_torch_weights, export_to_onnx
+
+from FL_scripts.checkpoint_builder import CheckpointBuilder
+from FL_scripts.aggregation import aggregate_round, AggregationResult
+from FL_scripts.update_format import model_hash
 from FL_scripts.torch_helpers.models.mlp import MLP
 
 FL_FOLDER = "./FL/"
+CHECKPOINT_FILENAME = "train_mlp_checkpoint"
 
 def safe_key(folder):
     parts = folder.split('_')
@@ -18,7 +23,7 @@ def safe_key(folder):
 
 
 
-def create_global_checkpoint():
+def latest_round_folder() -> str:
     # List everything in the main folder
     all_items = os.listdir(FL_FOLDER)
 
@@ -32,9 +37,6 @@ def create_global_checkpoint():
     latest_subfolder = sorted_subfolders[-1]
     latest_minus_one_subfolder = sorted_subfolders[-2] if len(sorted_subfolders) > 1 else None
 
-    # Construct the path to the latest subfolder
-    latest_subfolder_path = os.path.join(FL_FOLDER, latest_subfolder)
-
     # reserved for possible future use
     #latest_minus_one_subfolder_path = os.path.join(FL_FOLDER,
     #                                               latest_minus_one_subfolder) if latest_minus_one_subfolder else None
@@ -42,41 +44,56 @@ def create_global_checkpoint():
     print(f"The latest subfolder is: {latest_subfolder}")
     print(f"The second latest subfolder is: {latest_minus_one_subfolder}")
 
-    data = load_json_files(latest_subfolder_path)
+    # Construct the path to the latest subfolder
+    return os.path.join(FL_FOLDER, latest_subfolder)
+
+
+def build_global_model() -> MLP:
+    return MLP(input_size=3, hidden_size=64, output_size=1)
 
-    mean_params = mean_aggregate(data)
 
-    model = MLP(input_size=3, hidden_size=64, output_size=1)
+checkpoint_builder = CheckpointBuilder(build_global_model, model_name='mlp', input_shape=3)
 
-    set_torch_weights(model, mean_params)
 
-    onnx_store_dir = "./FL/tmp/"
-    export_to_onnx(model, onnx_store_dir=onnx_store_dir)
+def aggregate_round_updates(round_folder: str) -> AggregationResult:
+    """Step 1: mean of the client updates of a round folder."""
+    expected_size = sum(param.numel() for param in build_global_model().parameters())
 
-    # Copy the file that ends with '_checkpoint' to 'round_X'
-    for file in os.listdir(onnx_store_dir):
-        if file.endswith('_checkpoint'):
-            shutil.copy(os.path.join(onnx_store_dir, file), latest_subfolder_path)
+    # Binary updates must have been trained on the checkpoint that is still being served for this round
+    main_checkpoint = os.path.join(FL_FOLDER, CHECKPOINT_FILENAME)
+    expected_model_hash = model_hash(main_checkpoint) if os.path.isfile(main_checkpoint) else None
 
-    # Delete all files in 'tmp' except 'README.md'
-    for file in os.listdir(onnx_store_dir):
-        if file != 'README.md':
-            os.remove(os.path.join(onnx_store_dir, file))
+    # Malformed or wrongly sized client updates are skipped and listed in the result
+    round_number = safe_key(os.path.basename(os.path.normpath(round_folder)))
+    return aggregate_round(round_folder, expected_size, expected_round=round_number,
+                           expected_model_hash=expected_model_hash)
 
-    latest_checkpoint_filename = "train_mlp_checkpoint"
-    latest_checkpoint_path = os.path.join(latest_subfolder_path, latest_checkpoint_filename)
 
-    parent_directory = os.path.abspath(os.path.join(latest_subfolder_path, os.pardir))
-    main_checkpoint_path = os.path.join(parent_directory, latest_checkpoint_filename)
+def export_round_checkpoint(round_folder: str, mean_params: np.ndarray) -> None:
+    """Step 2: write the aggregated weights as the round's ORT checkpoint (the training graphs are cached)."""
+    checkpoint_builder.write_checkpoint(mean_params, os.path.join(round_folder, CHECKPOINT_FILENAME))
 
+
+def publish_round_checkpoint(round_folder: str) -> None:
+    """Step 3: replace the checkpoint served to clients with the round's one."""
+    latest_checkpoint_path = os.path.join(round_folder, CHECKPOINT_FILENAME)
+    main_checkpoint_path = os.path.join(FL_FOLDER, CHECKPOINT_FILENAME)
+
+    if not os.path.isfile(latest_checkpoint_path):
+        raise FileNotFoundError(f"The file {latest_checkpoint_path} does not exist.")
+
+    # Copy next to the target and rename, so clients never download a half written checkpoint
+    tmp_path = main_checkpoint_path + ".tmp"
+    shutil.copy(latest_checkpoint_path, tmp_path)
+    os.replace(tmp_path, main_checkpoint_path)
+    print(f"Replaced {main_checkpoint_path} with {latest_checkpoint_path}")
+
+
+def create_global_checkpoint():
+    round_folder = latest_round_folder()
+    result = aggregate_round_updates(round_folder)
+    export_round_checkpoint(round_folder, result.mean)
     try:
-        # Ensure the source file exists
-        if os.path.isfile(latest_checkpoint_path):
-            # Replace the main checkpoint file with the latest one
-            shutil.copy(latest_checkpoint_path, main_checkpoint_path)
-            print(f"Replaced {main_checkpoint_path} with {latest_checkpoint_path}")
-        else:
-            print(f"The file {latest_checkpoint_path} does not exist.")
+        publish_round_checkpoint(round_folder)
     except Exception as e:
         print(f"An error occurred: {e}")
-
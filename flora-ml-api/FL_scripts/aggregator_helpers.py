@@ -1,3 +1,4 @@
+import inspect
 import io
 import json
 import os
@@ -129,6 +130,11 @@ def export_to_onnx(model: torch.nn.Module,
     print(onnx_optim)
     print(onnx_criterion)
 
+    export_kwargs = {}
+    # Newer torch versions default to the dynamo exporter, which needs onnxscript and has no training mode
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False
+
     torch.onnx.export(
         model,
         model_inputs,
@@ -140,7 +146,8 @@ def export_to_onnx(model: torch.nn.Module,
         dynamic_axes=dynamic_axes,
         export_params=True,  # store the trained parameter weights inside the model file
         keep_initializers_as_inputs=False,
-        verbose=False
+        verbose=False,
+        **export_kwargs
     )
     onnx_model = onnx.load_model_from_string(f.getvalue())
 
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Callable, Dict, List
+
+import numpy as np
+import onnx
+import onnxruntime
+import torch
+from onnx import numpy_helper
+from onnxruntime.training.api import CheckpointState
+from onnxruntime.training.onnxblock import save_checkpoint
+
+from FL_scripts.aggregator_helpers import export_to_onnx
+
+TEMPLATE_ROOT = "./FL/templates/"
+MANIFEST_FILENAME = "manifest.json"
+
+
+def model_version(model: torch.nn.Module, model_name: str, input_shape: int) -> str:
+    """
+    Identifies the training graphs of a model: its architecture, parameter names/shapes and the tool versions.
+
+    The weights are deliberately not part of it, they change every round while the graphs do not.
+    """
+    description = {
+        'model_name': model_name,
+        'input_shape': input_shape,
+        'architecture': str(model),
+        'parameters': [(name, list(param.shape), param.requires_grad) for name, param in model.named_parameters()],
+        'torch': torch.__version__,
+        'onnxruntime': onnxruntime.__version__,
+        'onnx': onnx.__version__,
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class CheckpointBuilder:
+    """
+    Writes the per-round ORT training checkpoint without re-exporting the model.
+
+    The training, eval and optimizer graphs only depend on the model version, so they are generated once
+    with `export_to_onnx` into `FL/templates/{version}/` together with a manifest of the parameters. A round
+    then only slices the aggregated flat vector into named tensors and saves them as a checkpoint, which
+    takes milliseconds instead of a torch trace plus artifact generation.
+    """
+
+    def __init__(self, model_factory: Callable[[], torch.nn.Module], model_name: str = 'mlp', input_shape: int = 3,
+                 template_root: str = TEMPLATE_ROOT):
+        self.model_factory = model_factory
+        self.model_name = model_name
+        self.input_shape = input_shape
+        self.template_root = template_root
+        self._manifests: Dict[str, dict] = {}
+
+    def template_dir(self, version: str) -> str:
+        return os.path.join(self.template_root, version)
+
+    def ensure_template(self) -> str:
+        """Return the template folder of the current model version, generating it on first use."""
+        model = self.model_factory()
+        version = model_version(model, self.model_name, self.input_shape)
+        template_dir = self.template_dir(version)
+        if os.path.isfile(os.path.join(template_dir, MANIFEST_FILENAME)):
+            return template_dir
+
+        os.makedirs(self.template_root, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=self.template_root)
+        try:
+            export_to_onnx(model, input_shape=self.input_shape, model_name=self.model_name,
+                           onnx_store_dir=build_dir + os.sep)
+            checkpoint = CheckpointState.load_checkpoint(os.path.join(build_dir, self.checkpoint_filename))
+            in_checkpoint = {name for name, _ in checkpoint.parameters}
+            manifest = {
+                'version': version,
+                # Flat update order, the same as set_torch_weights and the clients use
+                'parameters': [
+                    {'name': name, 'shape': list(param.shape), 'requires_grad': param.requires_grad}
+                    for name, param in model.named_parameters() if name in in_checkpoint
+                ],
+            }
+            if len(manifest['parameters']) != len(in_checkpoint):
+                raise RuntimeError(f"Checkpoint parameters {sorted(in_checkpoint)} do not match the model")
+            with open(os.path.join(build_dir, MANIFEST_FILENAME), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            try:
+                # Another process may have built the same version in the meantime, either copy is fine
+                os.rename(build_dir, template_dir)
+            except OSError:
+                shutil.rmtree(build_dir, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        print(f"Generated ONNX training graph template {template_dir}")
+        return template_dir
+
+    @property
+    def checkpoint_filename(self) -> str:
+        return f"train_{self.model_name}_checkpoint"
+
+    def manifest(self, template_dir: str) -> dict:
+        if template_dir not in self._manifests:
+            with open(os.path.join(template_dir, MANIFEST_FILENAME)) as f:
+                self._manifests[template_dir] = json.load(f)
+        return self._manifests[template_dir]
+
+    def parameters(self) -> List[dict]:
+        """Name, shape and requires_grad of every checkpoint parameter, in flat update order."""
+        return self.manifest(self.ensure_template())['parameters']
+
+    def read_checkpoint(self, checkpoint_path: str) -> np.ndarray:
+        """The parameters of an ORT training checkpoint as a flat float32 vector, the inverse of write_checkpoint."""
+        state = CheckpointState.load_checkpoint(checkpoint_path)
+        values = dict(state.parameters)
+        return np.concatenate([
+            np.asarray(values[parameter['name']].data, dtype=np.float32).ravel() for parameter in self.parameters()
+        ])
+
+    def write_checkpoint(self, params: np.ndarray, checkpoint_path: str) -> None:
+        """
+        Save a flat parameter vector (e.g. the aggregated mean) as an ORT training checkpoint.
+
+        Raises:
+            ValueError: If the vector does not hold exactly the model's parameters.
+        """
+        parameters = self.parameters()
+        expected_size = sum(int(np.prod(p['shape'])) for p in parameters)
+        params = np.asarray(params, dtype=np.float32).ravel()
+        if params.shape[0] != expected_size:
+            raise ValueError(f"Expected {expected_size} params, got {params.shape[0]}")
+
+        trainable, frozen = [], []
+        pointer = 0
+        for parameter in parameters:
+            size = int(np.prod(parameter['shape']))
+            tensor = numpy_helper.from_array(params[pointer:pointer + size].reshape(parameter['shape']),
+                                             parameter['name'])
+            (trainable if parameter['requires_grad'] else frozen).append(tensor)
+            pointer += size
+
+        # Write next to the target and rename, so the checkpoint is never seen half written
+        tmp_path = checkpoint_path + ".tmp"
+        save_checkpoint((trainable, frozen), tmp_path)
+        os.replace(tmp_path, checkpoint_path)
@@ -0,0 +1,105 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from config import FL_DELTA_MAX_ROUNDS, FL_DELTA_CACHE_SIZE
+from FL_scripts.aggregator import FL_FOLDER, CHECKPOINT_FILENAME, checkpoint_builder
+from FL_scripts.update_format import encode_update, DTYPE_NAMES, zstandard
+
+# Deltas are zstd compressed by default whenever it is installed
+COMPRESSION_AVAILABLE = zstandard is not None
+
+
+class DeltaUnavailable(Exception):
+    """Raised when no delta can be served from the requested round, the client should download the full checkpoint."""
+
+
+def round_checkpoint_path(round_number: int) -> str:
+    return os.path.join(FL_FOLDER, f"round_{round_number}", CHECKPOINT_FILENAME)
+
+
+def checkpoint_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class CheckpointDelta:
+    def __init__(self, data: bytes, from_round: int, to_round: int, base_sha256: str, target_sha256: str,
+                 dtype: str, compress: bool):
+        self.data = data
+        self.from_round = from_round
+        self.to_round = to_round
+        self.base_sha256 = base_sha256
+        self.target_sha256 = target_sha256
+        self.dtype = dtype
+        self.compress = compress
+
+    def etag(self) -> str:
+        return f'"{self.base_sha256[:16]}-{self.target_sha256[:16]}-{self.dtype}{"-zstd" if self.compress else ""}"'
+
+
+class CheckpointDeltas:
+    """
+    Weight deltas between the checkpoints published by two rounds.
+
+    A delta is `target - base` over the flat parameter vector, encoded with the client update format
+    (FL_scripts/update_format.py): its header carries the target round and the first 16 bytes of the base
+    checkpoint's SHA-256, so a client can check the delta applies to what it holds. float32 deltas are
+    exact up to float32 rounding; float16 and int8 deltas are smaller but lossy, and a client applying several lossy deltas in a row
+    drifts from the server's weights, so it should fetch the full checkpoint from time to time.
+    Only the last `max_rounds` rounds are kept as bases. Encoded deltas are cached by content hashes.
+    """
+
+    def __init__(self, max_rounds: int = FL_DELTA_MAX_ROUNDS, cache_size: int = FL_DELTA_CACHE_SIZE):
+        self.max_rounds = max_rounds
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[tuple, CheckpointDelta]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def segment_sizes(self):
+        return [int(np.prod(parameter['shape'])) for parameter in checkpoint_builder.parameters()]
+
+    def build(self, from_round: int, to_round: int, dtype: str = "float32", compress: bool = COMPRESSION_AVAILABLE,
+              target_sha256: Optional[str] = None) -> CheckpointDelta:
+        """
+        Encoded delta from the checkpoint published by `from_round` to the one published by `to_round`.
+
+        Raises:
+            DeltaUnavailable: If `from_round` is too old, not older than `to_round` or its checkpoint is gone.
+            ValueError: On an unknown dtype.
+        """
+        if dtype not in DTYPE_NAMES:
+            raise ValueError(f"Unknown dtype '{dtype}', expected one of {sorted(DTYPE_NAMES)}")
+        if from_round >= to_round:
+            raise DeltaUnavailable(f"Round {from_round} is not older than the latest round {to_round}")
+        if from_round < to_round - self.max_rounds:
+            raise DeltaUnavailable(f"Deltas are only kept for the last {self.max_rounds} rounds")
+        base_path = round_checkpoint_path(from_round)
+        target_path = round_checkpoint_path(to_round)
+        if not os.path.isfile(base_path) or not os.path.isfile(target_path):
+            raise DeltaUnavailable(f"No checkpoint for round {from_round}")
+
+        base_sha256 = checkpoint_sha256(base_path)
+        target_sha256 = target_sha256 or checkpoint_sha256(target_path)
+        key = (base_sha256, target_sha256, to_round, dtype, compress)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        delta = checkpoint_builder.read_checkpoint(target_path) - checkpoint_builder.read_checkpoint(base_path)
+        encoded = encode_update(delta, to_round, bytes.fromhex(base_sha256)[:16], dtype=dtype, compress=compress,
+                                segment_sizes=self.segment_sizes())
+        result = CheckpointDelta(encoded, from_round, to_round, base_sha256, target_sha256, dtype, compress)
+        with self._lock:
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return result
+
+
+checkpoint_deltas = CheckpointDeltas()
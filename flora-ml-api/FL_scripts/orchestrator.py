@@ -0,0 +1,193 @@
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+
+from redis.exceptions import WatchError
+
+from config import FL_ROUND_UPLOAD_DRAIN_SECONDS, FL_ROUND_STALE_SECONDS
+from executors import fl_pool
+from FL_scripts.aggregator import FL_FOLDER, aggregate_round_updates, export_round_checkpoint, publish_round_checkpoint
+from logger import logger
+from metrics import metrics
+
+CURRENT_ROUND_KEY = "global_FL_round"
+
+COLLECTING = "collecting"
+AGGREGATING = "aggregating"
+EXPORTING = "exporting"
+PUBLISHED = "published"
+
+
+def round_key(round_number: int) -> str:
+    return f"fl_round:{round_number}"
+
+
+def round_folder(round_number: int) -> str:
+    return os.path.join(FL_FOLDER, f"round_{round_number}")
+
+
+class RoundNotCollecting(Exception):
+    """Raised when a round no longer accepts uploads or cannot be aggregated because it is already in progress."""
+
+    def __init__(self, round_number: int, state: str):
+        super().__init__(f"Round {round_number} is {state}")
+        self.round_number = round_number
+        self.state = state
+
+
+class RoundOrchestrator:
+    """
+    Drives a federated round through collecting -> aggregating -> exporting -> published.
+
+    The state of every round lives in the Redis hash `fl_round:{n}`, so all API workers agree on it.
+    Aggregation, the ONNX export and publishing run one after the other in the `fl` process pool, the
+    event loop only awaits them. Uploads register themselves on the round while they write their file;
+    once a round leaves `collecting` new uploads are refused (the client retries against the next round)
+    and aggregation waits for the ones in flight, so no update lands in a round that is being aggregated.
+    `global_FL_round` moves to the next round in the same transaction that marks the round published.
+    The key is shared by all workers and never reset by one of them; if it is missing (e.g. Redis was
+    flushed) the round this worker was initialised with is used and seeded again.
+    """
+
+    def __init__(self, redis_client, pool=fl_pool, drain_seconds: float = FL_ROUND_UPLOAD_DRAIN_SECONDS,
+                 stale_seconds: float = FL_ROUND_STALE_SECONDS):
+        self.redis = redis_client
+        self.pool = pool
+        self.drain_seconds = drain_seconds
+        self.stale_seconds = stale_seconds
+        self.initial_round = 1
+        self._task: Optional[asyncio.Task] = None
+
+    async def init_round(self, round_number: int) -> None:
+        """
+        Seed the current round with `round_number` unless another worker already did (a running round is never
+        moved back by a restarting worker), and mark the current round as collecting unless it has a state.
+        """
+        self.initial_round = round_number
+        await self.redis.set(CURRENT_ROUND_KEY, round_number, nx=True)
+        await self.redis.hsetnx(round_key(await self.current_round()), "state", COLLECTING)
+
+    def _round_number(self, value: Optional[str]) -> int:
+        return self.initial_round if value is None else int(value)
+
+    async def current_round(self) -> int:
+        return self._round_number(await self.redis.get(CURRENT_ROUND_KEY))
+
+    async def status(self, round_number: Optional[int] = None) -> dict:
+        if round_number is None:
+            round_number = await self.current_round()
+        status = await self.redis.hgetall(round_key(round_number))
+        if not status:
+            return {}
+        status["round"] = round_number
+        if "rejected" in status:
+            status["rejected"] = json.loads(status["rejected"])
+        return status
+
+    async def begin_upload(self) -> int:
+        """Register an upload on the current round and return its number, raises RoundNotCollecting."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(CURRENT_ROUND_KEY)
+                    stored = await pipe.get(CURRENT_ROUND_KEY)
+                    round_number = self._round_number(stored)
+                    await pipe.watch(round_key(round_number))
+                    state = await pipe.hget(round_key(round_number), "state") or COLLECTING
+                    if state != COLLECTING:
+                        raise RoundNotCollecting(round_number, state)
+                    pipe.multi()
+                    if stored is None:
+                        pipe.set(CURRENT_ROUND_KEY, round_number)
+                    pipe.hincrby(round_key(round_number), "uploads_in_flight", 1)
+                    await pipe.execute()
+                    return round_number
+                except WatchError:
+                    continue
+
+    async def end_upload(self, round_number: int) -> None:
+        await self.redis.hincrby(round_key(round_number), "uploads_in_flight", -1)
+
+    async def _transition(self, round_number: int, state: str, **fields) -> None:
+        await self.redis.hset(round_key(round_number), mapping={"state": state, "updated_at": time.time(), **fields})
+        logger.info(f"FL round {round_number} is {state}")
+
+    async def start(self) -> int:
+        """Move the current round from collecting to aggregating and run it in the background."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(CURRENT_ROUND_KEY)
+                    stored = await pipe.get(CURRENT_ROUND_KEY)
+                    round_number = self._round_number(stored)
+                    key = round_key(round_number)
+                    await pipe.watch(key)
+                    state, updated_at = await pipe.hmget(key, "state", "updated_at")
+                    state = state or COLLECTING
+                    # A round stuck in progress (its worker died) may be taken over once it is stale
+                    stale = updated_at is not None and time.time() - float(updated_at) > self.stale_seconds
+                    if state != COLLECTING and not (state in (AGGREGATING, EXPORTING) and stale):
+                        raise RoundNotCollecting(round_number, state)
+                    now = time.time()
+                    pipe.multi()
+                    if stored is None:
+                        pipe.set(CURRENT_ROUND_KEY, round_number)
+                    pipe.hset(key, mapping={"state": AGGREGATING, "started_at": now, "updated_at": now})
+                    pipe.hdel(key, "error")
+                    await pipe.execute()
+                    break
+                except WatchError:
+                    continue
+
+        logger.info(f"FL round {round_number} is {AGGREGATING}")
+        self._task = asyncio.create_task(self._run(round_number))
+        return round_number
+
+    async def stop(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    async def _wait_for_uploads(self, round_number: int) -> None:
+        deadline = time.monotonic() + self.drain_seconds
+        while int(await self.redis.hget(round_key(round_number), "uploads_in_flight") or 0) > 0:
+            if time.monotonic() > deadline:
+                logger.warning(f"FL round {round_number}: uploads still in flight after {self.drain_seconds}s, aggregating anyway")
+                return
+            await asyncio.sleep(0.05)
+
+    async def _run(self, round_number: int) -> None:
+        folder = round_folder(round_number)
+        started = time.monotonic()
+        try:
+            await self._wait_for_uploads(round_number)
+
+            result = await self.pool.run(aggregate_round_updates, folder)
+            await self._transition(round_number, EXPORTING, accepted=result.accepted,
+                                   rejected=json.dumps(result.rejected))
+
+            await self.pool.run(export_round_checkpoint, folder, result.mean)
+            await self.pool.run(publish_round_checkpoint, folder)
+
+            # Uploads for the next round go to its folder, which also keeps get_latest_round right after a restart
+            next_round = round_number + 1
+            os.makedirs(round_folder(next_round), exist_ok=True)
+            now = time.time()
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hset(round_key(round_number), mapping={"state": PUBLISHED, "updated_at": now, "published_at": now})
+                pipe.hsetnx(round_key(next_round), "state", COLLECTING)
+                pipe.set(CURRENT_ROUND_KEY, next_round)
+                await pipe.execute()
+            logger.info(f"FL round {round_number} is {PUBLISHED}, collecting round {next_round}")
+            metrics.observe("fl_round_seconds", time.monotonic() - started)
+        except asyncio.CancelledError:
+            await self._transition(round_number, COLLECTING, error="interrupted by shutdown")
+            raise
+        except Exception as e:
+            # The round goes back to collecting so it can be retried, the checkpoint being served is unchanged
+            logger.error(f"FL round {round_number} failed: {e}")
+            metrics.inc("fl_round_failures_total")
+            await self._transition(round_number, COLLECTING, error=str(e))
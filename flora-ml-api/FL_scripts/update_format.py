@@ -0,0 +1,204 @@
+"""
+Binary format for federated client updates.
+
+Layout (all little-endian):
+
+    header   MAGIC "FLUP", version u8, dtype u8, flags u8, reserved u8,
+             round u32, length u32 (number of params), segments u32,
+             crc32 u32 of the stored payload (after decompression), model hash 16 bytes
+    scales   int8 only: `segments` x (numel u32, scale f32), one per model tensor in parameter order
+    payload  `length` values of the given dtype, zstd compressed when FLAG_ZSTD is set
+
+A float32 update is about a quarter of the size of the same update as JSON text, float16 an eighth and
+int8 a sixteenth; the server reads uncompressed payloads straight from a memory map without copying.
+"""
+
+import hashlib
+import mmap
+import struct
+import zlib
+from typing import List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for compressed updates
+    zstandard = None
+
+MAGIC = b"FLUP"
+VERSION = 1
+HEADER = struct.Struct("<4sBBBBIIII16s")
+SEGMENT = struct.Struct("<If")
+
+DTYPE_FLOAT32 = 0
+DTYPE_FLOAT16 = 1
+DTYPE_INT8 = 2
+DTYPES = {DTYPE_FLOAT32: np.dtype("<f4"), DTYPE_FLOAT16: np.dtype("<f2"), DTYPE_INT8: np.dtype("i1")}
+DTYPE_NAMES = {"float32": DTYPE_FLOAT32, "float16": DTYPE_FLOAT16, "int8": DTYPE_INT8}
+
+FLAG_ZSTD = 1
+
+
+class UpdateHeader:
+    def __init__(self, dtype: int, flags: int, round_number: int, length: int, segments: int, crc32: int,
+                 model_hash: bytes):
+        self.dtype = dtype
+        self.flags = flags
+        self.round_number = round_number
+        self.length = length
+        self.segments = segments
+        self.crc32 = crc32
+        self.model_hash = model_hash
+
+
+def model_hash(file_path: str) -> bytes:
+    """The 16 byte model hash clients put in the header: a truncated sha256 of the checkpoint they trained."""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.digest()[:16]
+
+
+def is_binary_update(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def quantize_int8(params: np.ndarray, segment_sizes: Sequence[int]):
+    """Symmetric per-tensor int8 quantization, returns the int8 values and one scale per tensor."""
+    values = np.empty(params.shape[0], dtype=np.int8)
+    scales = []
+    start = 0
+    for size in segment_sizes:
+        segment = params[start:start + size]
+        scale = float(np.abs(segment).max()) / 127.0 if size else 0.0
+        scale = scale or 1.0
+        values[start:start + size] = np.clip(np.rint(segment / scale), -127, 127)
+        scales.append(scale)
+        start += size
+    return values, scales
+
+
+def encode_update(params: np.ndarray, round_number: int, model_hash: bytes, dtype: str = "float32",
+                  compress: bool = False, segment_sizes: Optional[Sequence[int]] = None) -> bytes:
+    """
+    Serialise a flat parameter vector (what mobile clients do before uploading).
+
+    `segment_sizes` are the sizes of the model tensors, used for per-tensor int8 scales; without them the
+    whole vector shares one scale.
+    """
+    params = np.asarray(params, dtype=np.float32).ravel()
+    dtype_code = DTYPE_NAMES[dtype]
+    segments = b""
+    segment_count = 0
+    if dtype_code == DTYPE_INT8:
+        segment_sizes = list(segment_sizes) if segment_sizes is not None else [params.shape[0]]
+        if sum(segment_sizes) != params.shape[0]:
+            raise ValueError("segment_sizes must add up to the number of params")
+        values, scales = quantize_int8(params, segment_sizes)
+        segments = b"".join(SEGMENT.pack(size, scale) for size, scale in zip(segment_sizes, scales))
+        segment_count = len(segment_sizes)
+    else:
+        values = params.astype(DTYPES[dtype_code], copy=False)
+
+    payload = values.tobytes()
+    crc32 = zlib.crc32(payload)
+    flags = 0
+    if compress:
+        if zstandard is None:
+            raise RuntimeError("zstd compression needs the 'zstandard' package")
+        payload = zstandard.ZstdCompressor().compress(payload)
+        flags |= FLAG_ZSTD
+
+    header = HEADER.pack(MAGIC, VERSION, dtype_code, flags, 0, round_number, params.shape[0], segment_count,
+                         crc32, model_hash)
+    return header + segments + payload
+
+
+def decode_header(data) -> UpdateHeader:
+    """
+    Parse and sanity check the fixed size header.
+
+    Raises:
+        ValueError: If the data is not a supported binary update.
+    """
+    if len(data) < HEADER.size:
+        raise ValueError("binary update shorter than its header")
+    magic, version, dtype, flags, _, round_number, length, segments, crc32, hash_ = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("not a binary update")
+    if version != VERSION:
+        raise ValueError(f"unsupported binary update version {version}")
+    if dtype not in DTYPES:
+        raise ValueError(f"unknown dtype code {dtype}")
+    if flags & ~FLAG_ZSTD:
+        raise ValueError(f"unknown flags {flags:#x}")
+    if (dtype == DTYPE_INT8) != (segments > 0):
+        raise ValueError("int8 updates, and only those, carry per-tensor scales")
+    return UpdateHeader(dtype, flags, round_number, length, segments, crc32, hash_)
+
+
+def decode_update(data) -> np.ndarray:
+    """
+    Decode a binary update (bytes, memoryview or mmap) into a flat array of params.
+
+    Uncompressed float32 payloads are returned as a read-only view of `data`; float16 is widened to
+    float32 and int8 is dequantized with its per-tensor scales.
+
+    Raises:
+        ValueError: If the update is malformed or its checksum does not match.
+    """
+    header = decode_header(data)
+    offset = HEADER.size
+    scales: List[tuple] = []
+    for _ in range(header.segments):
+        if offset + SEGMENT.size > len(data):
+            raise ValueError("truncated scale table")
+        scales.append(SEGMENT.unpack_from(data, offset))
+        offset += SEGMENT.size
+
+    dtype = DTYPES[header.dtype]
+    expected_bytes = header.length * dtype.itemsize
+    if header.flags & FLAG_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstd compressed update but the 'zstandard' package is not installed")
+        try:
+            payload = zstandard.ZstdDecompressor().decompress(bytes(data[offset:]), max_output_size=expected_bytes)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"invalid zstd payload: {e}")
+        offset_in_payload = 0
+    else:
+        payload = data
+        offset_in_payload = offset
+
+    if len(payload) - offset_in_payload != expected_bytes:
+        raise ValueError(f"payload holds {len(payload) - offset_in_payload} bytes, expected {expected_bytes}")
+    values = np.frombuffer(payload, dtype=dtype, count=header.length, offset=offset_in_payload)
+    if zlib.crc32(values) != header.crc32:
+        raise ValueError("checksum mismatch")
+
+    if header.dtype == DTYPE_FLOAT32:
+        return values
+    if header.dtype == DTYPE_FLOAT16:
+        return values.astype(np.float32)
+
+    if sum(size for size, _ in scales) != header.length:
+        raise ValueError("scale table does not cover the payload")
+    params = np.empty(header.length, dtype=np.float32)
+    start = 0
+    for size, scale in scales:
+        np.multiply(values[start:start + size], np.float32(scale), out=params[start:start + size])
+        start += size
+    return params
+
+
+def read_update_file(file_path: str) -> tuple:
+    """Memory map a binary update file and return (header, params); params may be a view of the map."""
+    with open(file_path, 'rb') as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            raise ValueError("binary update shorter than its header")
+    return decode_header(mapped), decode_update(mapped)
@@ -1,16 +1,22 @@
 import joblib
 import numpy as np
 
+MODEL_PATH = "ML/models/LR/checkpoint/lr/logistic_regression_model.joblib"
 
-def make_prediction(input_features):
+
+def load_model():
+    return joblib.load(MODEL_PATH)
+
+
+def make_prediction(input_features, model=None):
     input_features = np.array(input_features)
     if len(input_features.shape) == 1:
         input_features = input_features.reshape(1, -1)
 
-    # Load the saved model
-    model = joblib.load("ML/models/LR/checkpoint/lr/logistic_regression_model.joblib")
+    # Load the saved model, unless a preloaded one is passed in (see ML/models/registry.py)
+    if model is None:
+        model = load_model()
 
     # Predict and return the result
     prediction = model.predict(input_features)
     return prediction
-
@@ -0,0 +1,140 @@
+import inspect
+import io
+import os
+
+import numpy as np
+
+from logger import logger
+
+
+class TorchBackend:
+    """Eager PyTorch execution of the MLP checkpoint."""
+
+    name = "torch"
+
+    def __init__(self, model_path: str, input_dim: int = 4):
+        import torch
+        from ML.models.MLP.models.mlp import MLP
+
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.model = MLP(input_dim=input_dim)
+        self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+        self.model.to(self.device)
+        self.model.eval()
+
+    def run(self, X: np.ndarray) -> np.ndarray:
+        import torch
+
+        X_tensor = torch.from_numpy(np.ascontiguousarray(X, dtype=np.float32)).to(self.device)
+        with torch.no_grad():
+            return self.model(X_tensor).cpu().numpy().reshape(-1)
+
+    def fold_input_affine(self, mean: np.ndarray, scale: np.ndarray) -> None:
+        """
+        Fuse a StandardScaler into the first Linear layer: W((x - mean) / scale) + b == (W / scale)x + (b - (W / scale)mean).
+
+        After this call `run` expects raw, unscaled features.
+        """
+        import torch
+
+        layer = self.model.layer1
+        with torch.no_grad():
+            weight = layer.weight / torch.as_tensor(scale, dtype=layer.weight.dtype, device=layer.weight.device)
+            bias = layer.bias - weight @ torch.as_tensor(mean, dtype=layer.weight.dtype, device=layer.weight.device)
+            layer.weight.copy_(weight)
+            layer.bias.copy_(bias)
+
+
+def export_mlp_to_onnx(model_path: str, onnx_path: str, input_dim: int = 4) -> None:
+    """Trace the torch checkpoint into an inference-only ONNX graph with a dynamic batch axis."""
+    import torch
+
+    backend = TorchBackend(model_path, input_dim=input_dim)
+    model = backend.model.to('cpu')
+
+    export_kwargs = {}
+    # Newer torch versions default to the dynamo exporter, which needs onnxscript
+    if 'dynamo' in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs['dynamo'] = False
+
+    f = io.BytesIO()
+    torch.onnx.export(
+        model,
+        (torch.zeros(1, input_dim),),
+        f,
+        input_names=['input'],
+        output_names=['output'],
+        dynamic_axes={'input': {0: 'batch_size'}, 'output': {0: 'batch_size'}},
+        do_constant_folding=True,
+        **export_kwargs
+    )
+    # Write next to the checkpoint atomically so a concurrent reader never sees a half written file
+    tmp_path = onnx_path + ".tmp"
+    with open(tmp_path, 'wb') as out:
+        out.write(f.getvalue())
+    os.replace(tmp_path, onnx_path)
+    logger.info(f"Exported {model_path} to {onnx_path}")
+
+
+def onnx_is_current(model_path: str, onnx_path: str) -> bool:
+    return os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(model_path)
+
+
+class OnnxBackend:
+    """
+    ONNX Runtime execution of the MLP.
+
+    The .onnx graph is exported at build time (python -m ML.models.MLP.export_onnx) and loaded directly, so
+    this backend neither imports torch nor builds the torch model. Only when the graph is missing or older than
+    the checkpoint is it exported here, which needs torch.
+    Inputs and outputs are bound through IO binding so batched arrays are handed to ORT without extra copies.
+    """
+
+    name = "onnx"
+
+    def __init__(self, model_path: str, onnx_path: str, input_dim: int = 4, intra_op_threads: int = 1,
+                 inter_op_threads: int = 1):
+        import onnxruntime as ort
+
+        if not onnx_is_current(model_path, onnx_path):
+            logger.warning(f"{onnx_path} is missing or older than {model_path}, exporting it now "
+                           f"(run python -m ML.models.MLP.export_onnx when deploying a checkpoint)")
+            export_mlp_to_onnx(model_path, onnx_path, input_dim=input_dim)
+
+        options = ort.SessionOptions()
+        # Requests are already parallelised by the inference pool, so keep each session small
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+
+        self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.output_name = self.session.get_outputs()[0].name
+
+    def run(self, X: np.ndarray) -> np.ndarray:
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        binding = self.session.io_binding()
+        binding.bind_cpu_input(self.input_name, X)
+        binding.bind_output(self.output_name, 'cpu')
+        self.session.run_with_iobinding(binding)
+        return binding.copy_outputs_to_cpu()[0].reshape(-1)
+
+
+def check_backend_parity(backend, model_path: str, input_dim: int = 4, atol: float = 1e-5) -> bool:
+    """Compare a backend against the torch checkpoint on a fixed probe batch."""
+    try:
+        reference = TorchBackend(model_path, input_dim=input_dim)
+    except ImportError:
+        logger.warning(f"torch is not installed, skipping the {backend.name} parity check")
+        return True
+
+    probe = np.random.default_rng(0).normal(size=(64, input_dim)).astype(np.float32)
+    expected = reference.run(probe)
+    actual = backend.run(probe)
+    max_diff = float(np.max(np.abs(expected - actual)))
+    if max_diff > atol:
+        logger.error(f"{backend.name} backend output differs from torch by {max_diff} (tolerance {atol})")
+        return False
+    logger.info(f"{backend.name} backend matches torch (max abs diff {max_diff})")
+    return True
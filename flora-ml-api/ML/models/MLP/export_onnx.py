@@ -0,0 +1,29 @@
+"""
+Export the MLP checkpoint to the ONNX graph served by the "onnx" inference backend and check it matches torch.
+
+Run from the flora-ml-api folder whenever model.pth changes (e.g. in the image build or the deploy step):
+    python -m ML.models.MLP.export_onnx
+"""
+
+import argparse
+import sys
+
+from ML.models.MLP.backends import OnnxBackend, export_mlp_to_onnx, check_backend_parity
+from ML.models.MLP.inference import MLP_MODEL_PATH, MLP_ONNX_PATH
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=MLP_MODEL_PATH)
+    parser.add_argument('--output', default=MLP_ONNX_PATH)
+    parser.add_argument('--atol', type=float, default=1e-5, help='largest accepted difference to torch')
+    args = parser.parse_args()
+
+    export_mlp_to_onnx(args.model, args.output)
+    if not check_backend_parity(OnnxBackend(args.model, args.output), args.model, atol=args.atol):
+        sys.exit(f"{args.output} does not match {args.model}")
+    print(f"Exported {args.model} to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,45 +1,84 @@
-import torch
 import joblib
 import numpy as np
 
-from ML.models.MLP.models.mlp import MLP
+from config import ONNX_PARITY_CHECK
+from logger import logger
+from ML.models.MLP.backends import TorchBackend, OnnxBackend, check_backend_parity
+
+MLP_MODEL_PATH = "ML/models/MLP/checkpoint/mlp/model.pth"
+MLP_ONNX_PATH = "ML/models/MLP/checkpoint/mlp/model.onnx"
+MLP_SCALER_PATH = "ML/models/MLP/checkpoint/mlp/scaler.pkl"
 
 
 class Inference:
-    def __init__(self, model_name):
+    def __init__(self, model_name, backend="torch", intra_op_threads=1, inter_op_threads=1):
         if model_name in ['MLP', 'mlp']:
-            self.model = MLP(input_dim=4)
-            self.model_path = "ML/models/MLP/checkpoint/mlp/model.pth"
-            self.scaler_path = "ML/models/MLP/checkpoint/mlp/scaler.pkl"
+            self.input_dim = 4
+            self.model_path = MLP_MODEL_PATH
+            self.onnx_path = MLP_ONNX_PATH
+            self.scaler_path = MLP_SCALER_PATH
         else:
             raise ValueError(f'{model_name} cannot be found!')
 
-        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.model.load_state_dict(torch.load(self.model_path, map_location=self.device))
-        self.model.to(self.device)
-        self.model.eval()
+        if backend == "onnx":
+            self.backend = OnnxBackend(self.model_path, self.onnx_path, input_dim=self.input_dim,
+                                       intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+            # The export command already checks parity, repeating it here loads torch on every (re)load
+            if ONNX_PARITY_CHECK and not check_backend_parity(self.backend, self.model_path, input_dim=self.input_dim):
+                logger.error(f"Falling back to the torch backend for {model_name}")
+                self.backend = TorchBackend(self.model_path, input_dim=self.input_dim)
+        elif backend == "torch":
+            self.backend = TorchBackend(self.model_path, input_dim=self.input_dim)
+        else:
+            raise ValueError(f'Unknown inference backend {backend}')
+
         self.scaler = joblib.load(self.scaler_path)
 
+        # StandardScaler as a plain affine, so the hot path never goes through sklearn's input validation
+        mean = self.scaler.mean_ if getattr(self.scaler, 'mean_', None) is not None else np.zeros(self.input_dim)
+        scale = self.scaler.scale_ if getattr(self.scaler, 'scale_', None) is not None else np.ones(self.input_dim)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.inv_scale = (1.0 / np.asarray(scale, dtype=np.float64)).astype(np.float32)
+        self.input_folded = hasattr(self.backend, 'fold_input_affine')
+        if self.input_folded:
+            self.backend.fold_input_affine(mean, scale)
+
     def preprocess(self, X):
         return self.scaler.transform(X)
 
-    def predict(self, X):
-        X = np.array(X)
-        if len(X.shape) == 1:
+    def predict_proba(self, X):
+        """
+        Vectorized prediction on raw (unscaled) features.
+
+        Returns (labels, probabilities_class_1) as NumPy arrays with one entry per row.
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
             X = X.reshape(1, -1)
+        if X.shape[1] != self.input_dim:
+            raise ValueError(f"X has {X.shape[1]} features, but the model is expecting {self.input_dim} features as input.")
+
+        if not self.input_folded:
+            X = (X - self.mean) * self.inv_scale
+        probabilities_class_1 = self.backend.run(X)
+        labels = (probabilities_class_1 > 0.5).astype(np.int64)
+        return labels, probabilities_class_1
+
+    def predict(self, X):
+        labels, probabilities_class_1 = self.predict_proba(X)
+        return labels.tolist(), probabilities_to_rows(probabilities_class_1)
+
+
+def round_columns(probabilities_class_1, decimals=3):
+    """Rounded class 0 / class 1 probability columns as Python lists."""
+    probabilities_class_1 = np.asarray(probabilities_class_1, dtype=np.float64)
+    return (np.round(1 - probabilities_class_1, decimals).tolist(),
+            np.round(probabilities_class_1, decimals).tolist())
+
 
-        X_scaled = self.preprocess(X)
-        X_tensor = torch.tensor(X_scaled, dtype=torch.float32).to(self.device)
-        with torch.no_grad():
-            probabilities_class_1 = self.model(X_tensor).cpu().numpy().flatten()
-        probabilities_class_0 = 1 - probabilities_class_1
-
-        labels = (probabilities_class_1 > 0.5).astype(int)
-        probabilities_class_0 = probabilities_class_0.tolist()
-        probabilities_class_1 = probabilities_class_1.tolist()
-        probabilities = [{'0': prob_0, '1': prob_1} for prob_0, prob_1 in
-                         zip(probabilities_class_0, probabilities_class_1)]
-        return list(labels), round_probabilities(probabilities)
+def probabilities_to_rows(probabilities_class_1, decimals=3):
+    probabilities_class_0, probabilities_class_1 = round_columns(probabilities_class_1, decimals)
+    return [{'0': prob_0, '1': prob_1} for prob_0, prob_1 in zip(probabilities_class_0, probabilities_class_1)]
 
 
 def round_probabilities(probabilities):
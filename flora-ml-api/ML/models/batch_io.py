@@ -0,0 +1,146 @@
+"""
+Feature matrices and prediction results for the batch prediction endpoint, as JSON, raw binary or Arrow IPC.
+
+Raw binary layout (all little-endian):
+
+    request   MAGIC "FLMX", version u8, 3 reserved bytes, rows u32, columns u32,
+              then rows x columns float32 in row-major order
+    response  MAGIC "FLPR", version u8, flags u8 (1 = probabilities present), 2 reserved bytes, rows u32,
+              then rows float32 probabilities of class 1 (if present), then rows int8 labels
+
+The request payload is wrapped with np.frombuffer, so no Python object is created per value.
+"""
+
+import json
+import struct
+from typing import Optional
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:  # optional, without it Arrow bodies are refused with 415
+    pyarrow = None
+
+MATRIX_MAGIC = b"FLMX"
+RESULT_MAGIC = b"FLPR"
+VERSION = 1
+MATRIX_HEADER = struct.Struct("<4sB3xII")
+RESULT_HEADER = struct.Struct("<4sBB2xI")
+FLAG_PROBABILITIES = 1
+
+JSON = "application/json"
+BINARY = "application/octet-stream"
+ARROW = "application/vnd.apache.arrow.stream"
+
+FEATURE_COLUMNS = ("feature1", "feature2", "feature3", "feature4")
+
+
+class UnsupportedFormat(Exception):
+    """Raised for a Content-Type the batch endpoint cannot decode."""
+
+
+def body_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or JSON).split(";")[0].strip().lower()
+    if media_type not in (JSON, BINARY, ARROW):
+        raise UnsupportedFormat(f"Unsupported Content-Type '{media_type}', use {JSON}, {BINARY} or {ARROW}")
+    if media_type == ARROW and pyarrow is None:
+        raise UnsupportedFormat("Arrow bodies need the 'pyarrow' package")
+    return media_type
+
+
+def encode_matrix(features: np.ndarray) -> bytes:
+    features = np.ascontiguousarray(features, dtype="<f4")
+    rows, columns = features.shape
+    return MATRIX_HEADER.pack(MATRIX_MAGIC, VERSION, rows, columns) + features.tobytes()
+
+
+def decode_matrix(data: bytes) -> np.ndarray:
+    """
+    A read-only rows x columns float32 view of a raw binary request body.
+
+    Raises:
+        ValueError: If the header is invalid or the payload size does not match it.
+    """
+    if len(data) < MATRIX_HEADER.size:
+        raise ValueError("Body is shorter than the matrix header")
+    magic, version, rows, columns = MATRIX_HEADER.unpack_from(data)
+    if magic != MATRIX_MAGIC or version != VERSION:
+        raise ValueError("Not a feature matrix (bad magic or version)")
+    if len(data) - MATRIX_HEADER.size != rows * columns * 4:
+        raise ValueError(f"Expected {rows} x {columns} float32 values, got {len(data) - MATRIX_HEADER.size} bytes")
+    return np.frombuffer(data, dtype="<f4", count=rows * columns, offset=MATRIX_HEADER.size).reshape(rows, columns)
+
+
+def decode_json_matrix(data: bytes) -> np.ndarray:
+    """{"features": [[...], ...]} (or a bare list of rows) as a float32 matrix, skipping pydantic validation."""
+    try:
+        document = json.loads(data)
+        features = document["features"] if isinstance(document, dict) else document
+        matrix = np.asarray(features, dtype=np.float32)
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Invalid JSON feature matrix: {e}")
+    if matrix.ndim == 1:
+        matrix = matrix.reshape(1, -1)
+    return matrix
+
+
+def decode_arrow_matrix(data: bytes) -> np.ndarray:
+    """
+    An Arrow IPC stream with the float columns feature1..feature4 as a float32 matrix.
+
+    Arrow is columnar, so the columns are read without conversion and stacked into rows once.
+    """
+    try:
+        table = pyarrow.ipc.open_stream(pyarrow.py_buffer(data)).read_all()
+        columns = [table.column(name).to_numpy() for name in FEATURE_COLUMNS]
+    except (pyarrow.ArrowException, KeyError) as e:
+        raise ValueError(f"Invalid Arrow feature table: {e}")
+    return np.column_stack(columns).astype(np.float32, copy=False)
+
+
+def decode_features(data: bytes, media_type: str) -> np.ndarray:
+    if media_type == BINARY:
+        matrix = decode_matrix(data)
+    elif media_type == ARROW:
+        matrix = decode_arrow_matrix(data)
+    else:
+        matrix = decode_json_matrix(data)
+    if matrix.ndim != 2 or matrix.shape[0] == 0:
+        raise ValueError(f"Expected a non-empty rows x columns matrix, got shape {matrix.shape}")
+    return matrix
+
+
+def encode_result(labels: np.ndarray, probabilities_class_1: Optional[np.ndarray]) -> bytes:
+    flags = FLAG_PROBABILITIES if probabilities_class_1 is not None else 0
+    parts = [RESULT_HEADER.pack(RESULT_MAGIC, VERSION, flags, len(labels))]
+    if probabilities_class_1 is not None:
+        parts.append(np.asarray(probabilities_class_1, dtype="<f4").tobytes())
+    parts.append(np.asarray(labels, dtype=np.int8).tobytes())
+    return b"".join(parts)
+
+
+def decode_result(data: bytes):
+    """(labels, probabilities_class_1 or None) from a raw binary response, the inverse of encode_result."""
+    magic, version, flags, rows = RESULT_HEADER.unpack_from(data)
+    if magic != RESULT_MAGIC or version != VERSION:
+        raise ValueError("Not a prediction result (bad magic or version)")
+    offset = RESULT_HEADER.size
+    probabilities_class_1 = None
+    if flags & FLAG_PROBABILITIES:
+        probabilities_class_1 = np.frombuffer(data, dtype="<f4", count=rows, offset=offset)
+        offset += rows * 4
+    labels = np.frombuffer(data, dtype=np.int8, count=rows, offset=offset)
+    return labels, probabilities_class_1
+
+
+def encode_arrow_result(labels: np.ndarray, probabilities_class_1: Optional[np.ndarray]) -> bytes:
+    columns = {"label": pyarrow.array(np.asarray(labels, dtype=np.int8))}
+    if probabilities_class_1 is not None:
+        columns["probability_1"] = pyarrow.array(np.asarray(probabilities_class_1, dtype=np.float32))
+    table = pyarrow.table(columns)
+    sink = pyarrow.BufferOutputStream()
+    with pyarrow.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,115 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from executors import PoolSaturated
+from logger import logger
+from metrics import metrics
+
+
+class MicroBatcher:
+    """
+    Gathers concurrent prediction requests for one model and runs them as a single batched call.
+
+    A batch is closed when it holds `max_batch_size` rows or when `max_wait_ms` has passed since its
+    first request arrived, whichever comes first. `run_batch` receives an (N, n_features) array and must
+    return `(labels, probabilities)` arrays with one entry per row (`probabilities` may be None). If an `executor`
+    (see executors.py) is given, `run_batch` runs on it instead of on the event loop.
+    """
+
+    def __init__(self, model_name: str, run_batch: Callable, max_batch_size: int = 64, max_wait_ms: float = 2.0,
+                 executor=None):
+        self.model_name = model_name
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._worker())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def submit(self, features) -> Tuple[list, Optional[list]]:
+        rows = np.array(features)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((rows, future, time.perf_counter()))
+        return await future
+
+    async def _collect(self) -> List[tuple]:
+        # Block until the first request of the next batch arrives, then fill the batch until it is full or the window closes
+        batch = [await self._queue.get()]
+        n_rows = len(batch[0][0])
+        deadline = time.perf_counter() + self.max_wait
+        while n_rows < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            batch.append(item)
+            n_rows += len(item[0])
+        return batch
+
+    async def _execute(self, X: np.ndarray):
+        if self.executor is None:
+            return self.run_batch(X)
+        return await self.executor.run(self.run_batch, X)
+
+    async def _worker(self) -> None:
+        while True:
+            batch = await self._collect()
+            started = time.perf_counter()
+            n_rows = sum(len(rows) for rows, _, _ in batch)
+
+            metrics.observe("prediction_batch_rows", n_rows, model=self.model_name)
+            metrics.observe("prediction_batch_requests", len(batch), model=self.model_name)
+            metrics.observe("prediction_batch_fill_ratio", min(1.0, n_rows / self.max_batch_size), model=self.model_name)
+            for _, _, enqueued in batch:
+                metrics.observe("prediction_batch_wait_seconds", started - enqueued, model=self.model_name)
+
+            try:
+                labels, probabilities = await self._execute(np.concatenate([rows for rows, _, _ in batch]))
+            except PoolSaturated as e:
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            except Exception as e:
+                # Rows of different widths or a bad input poison the whole batch, fall back to one call per request
+                logger.warning(f"Batched prediction for model '{self.model_name}' failed, retrying per request: {e}")
+                await self._run_individually(batch)
+                continue
+
+            offset = 0
+            for rows, future, _ in batch:
+                end = offset + len(rows)
+                if not future.done():
+                    future.set_result((labels[offset:end], probabilities[offset:end] if probabilities is not None else None))
+                offset = end
+            metrics.observe("prediction_batch_seconds", time.perf_counter() - started, model=self.model_name)
+
+    async def _run_individually(self, batch: List[tuple]) -> None:
+        for rows, future, _ in batch:
+            if future.done():
+                continue
+            try:
+                future.set_result(await self._execute(rows))
+            except Exception as e:
+                future.set_exception(e)
@@ -1,13 +1,38 @@
 from ML.models.LR.predict import *
 from ML.models.MLP.inference import *
+from ML.models.registry import model_registry
 from schemas.prediction_request import PredictionRequest
-from schemas.prediction_response import PredictionResponseLR, PredictionResponseMLP
+from schemas.prediction_response import PredictionResponseLR, PredictionResponseMLP, PredictionResponseMLPColumnar
 
-def execute_model(model: str, prediction_request: PredictionRequest):
+BATCHED_MODELS = ["MLP", "LR"]
+
+
+def predict_rows(model: str, features):
+    """
+    Run one vectorized model call over one or more rows of features.
+
+    Returns (labels, probabilities_class_1) as NumPy arrays with one entry per row,
+    probabilities_class_1 is None for models that only output labels.
+    """
     if model == "MLP":
-        result = Inference(model_name="mlp")
-        labels, probabilities = result.predict(prediction_request.features)
-        return PredictionResponseMLP(labels=labels, probabilities=probabilities)
+        return model_registry.get("MLP").predict_proba(features)
     elif model == "LR":
-        result = make_prediction(prediction_request.features)
-        return PredictionResponseLR(labels=result)
+        return np.asarray(make_prediction(features, model=model_registry.get("LR"))), None
+    raise ValueError(f"{model} cannot be found!")
+
+
+def build_response(model: str, labels, probabilities_class_1, columnar: bool = False):
+    if model == "MLP":
+        if columnar:
+            probabilities_0, probabilities_1 = round_columns(probabilities_class_1)
+            return PredictionResponseMLPColumnar(labels=labels.tolist(), probabilities_0=probabilities_0,
+                                                 probabilities_1=probabilities_1)
+        return PredictionResponseMLP(labels=labels.tolist(), probabilities=probabilities_to_rows(probabilities_class_1))
+    elif model == "LR":
+        return PredictionResponseLR(labels=labels.tolist())
+
+
+def execute_model(model: str, prediction_request: PredictionRequest, columnar: bool = False):
+    if model in BATCHED_MODELS:
+        labels, probabilities_class_1 = predict_rows(model, prediction_request.features)
+        return build_response(model, labels, probabilities_class_1, columnar=columnar)
@@ -0,0 +1,98 @@
+import json
+from typing import AsyncIterator
+
+import numpy as np
+from sqlalchemy.future import select
+
+from config import HISTORY_SCORING_CHUNK_SIZE, HISTORY_SCORING_CACHE_TTL, HISTORY_SCORING_CACHE_MAX_BYTES
+from database.db_config import SessionLocal
+from database.models.user_observations import UserObservation
+from executors import inference_pool
+from logger import logger
+from metrics import metrics
+from ML.models.execute_model import predict_rows
+from ML.models.registry import model_registry
+
+CACHE_PREFIX = "prediction_history"
+VERSION_PREFIX = "prediction_history_version"
+
+
+def history_version_key(user_id: int) -> str:
+    return f"{VERSION_PREFIX}:{user_id}"
+
+
+def history_cache_key(user_id: int, model: str, model_version: str, history_version: int) -> str:
+    return f"{CACHE_PREFIX}:{user_id}:{model}:{model_version}:{history_version}"
+
+
+async def invalidate_history_cache(redis_client, user_id: int) -> None:
+    """
+    Bump the user's history version after observations were committed or deleted. Cached results of older
+    versions are never read again and expire with HISTORY_SCORING_CACHE_TTL.
+    """
+    await redis_client.incr(history_version_key(user_id))
+
+
+def format_chunk(observation_ids, dates, labels, probabilities_class_1) -> str:
+    lines = []
+    if probabilities_class_1 is None:
+        for observation_id, date, label in zip(observation_ids, dates, labels.tolist()):
+            lines.append(json.dumps({"observation_id": observation_id, "date": date.isoformat(), "label": label}))
+    else:
+        probabilities = np.round(np.asarray(probabilities_class_1, dtype=np.float64), 3).tolist()
+        for observation_id, date, label, probability in zip(observation_ids, dates, labels.tolist(), probabilities):
+            lines.append(json.dumps({"observation_id": observation_id, "date": date.isoformat(), "label": label,
+                                     "probability": probability}))
+    return "\n".join(lines) + "\n"
+
+
+async def score_user_history(user_id: int, model: str, redis_client) -> AsyncIterator[str]:
+    """
+    Score every stored observation of a user and yield the results as NDJSON, one line per observation.
+
+    Observations are read from the database in chunks of HISTORY_SCORING_CHUNK_SIZE and each chunk is scored
+    with one vectorized model call. The full output is cached under (user_id, model version, history version),
+    so the cache key changes as soon as observations are uploaded or deleted or the model is reloaded.
+    """
+    # Read before the rows: a commit during scoring bumps the version and the result is cached under the old one
+    history_version = int(await redis_client.get(history_version_key(user_id)) or 0)
+    cache_key = history_cache_key(user_id, model, model_registry.loaded_version(model), history_version)
+
+    cached = await redis_client.get(cache_key)
+    if cached is not None:
+        metrics.inc("history_scoring_cache_hits_total", model=model)
+        yield cached
+        return
+    metrics.inc("history_scoring_cache_misses_total", model=model)
+
+    async with SessionLocal() as db:
+        stream = await db.stream(
+            select(UserObservation.observation_id, UserObservation.feature1, UserObservation.feature2,
+                   UserObservation.feature3, UserObservation.feature4, UserObservation.date)
+            .where(UserObservation.user_id == user_id)
+            .order_by(UserObservation.observation_id)
+            .execution_options(yield_per=HISTORY_SCORING_CHUNK_SIZE)
+        )
+
+        body = []
+        body_size = 0
+        async for rows in stream.partitions(HISTORY_SCORING_CHUNK_SIZE):
+            observation_ids = [row[0] for row in rows]
+            dates = [row[5] for row in rows]
+            features = np.array([row[1:5] for row in rows], dtype=np.float32)
+
+            labels, probabilities_class_1 = await inference_pool.run(predict_rows, model, features)
+            chunk = format_chunk(observation_ids, dates, labels, probabilities_class_1)
+            metrics.inc("history_scoring_rows_total", len(rows), model=model)
+
+            if body_size <= HISTORY_SCORING_CACHE_MAX_BYTES:
+                body.append(chunk)
+                body_size += len(chunk)
+            yield chunk
+
+    # Only cache complete, reasonably sized results
+    if body_size <= HISTORY_SCORING_CACHE_MAX_BYTES:
+        try:
+            await redis_client.set(cache_key, "".join(body), ex=HISTORY_SCORING_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Could not cache scored history for user {user_id}: {e}")
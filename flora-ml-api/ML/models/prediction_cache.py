@@ -0,0 +1,129 @@
+import threading
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+import numpy as np
+
+from config import PREDICTION_CACHE_SIZE, PREDICTION_CACHE_DECIMALS, PREDICTION_CACHE_REDIS_TTL
+from metrics import metrics
+from ML.models.registry import model_registry
+
+CACHE_PREFIX = "prediction_cache"
+
+
+class PredictionCache:
+    """
+    Per row cache of prediction results in front of the models, local LRU first, then optionally Redis.
+
+    Rows are keyed by (model, model version, features rounded to `decimals`) and the model scores the rounded
+    features, so every request that maps to a key gets the same answer whichever of them filled it. A request
+    only sends its missing rows to the model. When the registry loads a new checkpoint the model's local
+    entries are dropped; Redis entries carry the version in their key, so they simply stop being read and
+    expire after `redis_ttl` seconds (0 disables the Redis tier).
+    """
+
+    def __init__(self, redis_client=None, max_size: int = PREDICTION_CACHE_SIZE,
+                 decimals: int = PREDICTION_CACHE_DECIMALS, redis_ttl: int = PREDICTION_CACHE_REDIS_TTL):
+        self.redis = redis_client if redis_ttl > 0 else None
+        self.max_size = max_size
+        self.decimals = decimals
+        self.redis_ttl = redis_ttl
+        self._local: "OrderedDict[tuple, tuple]" = OrderedDict()
+        # Reload callbacks may run on an inference pool thread
+        self._lock = threading.Lock()
+        model_registry.on_reload(self.invalidate)
+
+    def invalidate(self, model: str, version: Optional[str] = None) -> None:
+        """Drop the local entries of `model`."""
+        with self._lock:
+            for key in [key for key in self._local if key[0] == model]:
+                del self._local[key]
+        metrics.inc("prediction_cache_invalidations_total", model=model)
+
+    def quantize(self, features) -> np.ndarray:
+        rows = np.asarray(features, dtype=np.float64)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        # + 0.0 turns -0.0 into 0.0 so both round to the same key
+        return np.round(rows, self.decimals) + 0.0
+
+    def row_keys(self, rows: np.ndarray) -> List[str]:
+        return [",".join(f"{value:.{self.decimals}f}" for value in row) for row in rows.tolist()]
+
+    @staticmethod
+    def redis_key(model: str, version: str, row_key: str) -> str:
+        return f"{CACHE_PREFIX}:{model}:{version}:{row_key}"
+
+    async def predict(self, model: str, features,
+                      score: Callable[[np.ndarray], Awaitable[Tuple[np.ndarray, Optional[np.ndarray]]]]):
+        """
+        (labels, probabilities_class_1) for the rows of `features`, like predict_rows.
+
+        `score` is awaited with the rows that were not cached and must return one result per row.
+        """
+        rows = self.quantize(features)
+        # Never the reloading accessor here: a reload runs on the calling thread, which is the event loop
+        version = model_registry.loaded_version(model)
+        if version is None:
+            return await score(rows.astype(np.float32))
+        keys = [(model, version, row_key) for row_key in self.row_keys(rows)]
+        results: List[Optional[tuple]] = [None] * len(keys)
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                result = self._local.get(key)
+                if result is not None:
+                    self._local.move_to_end(key)
+                    results[i] = result
+        local_hits = sum(result is not None for result in results)
+        if local_hits:
+            metrics.inc("prediction_cache_hits_total", local_hits, model=model, tier="local")
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing and self.redis is not None:
+            cached = await self.redis.mget([self.redis_key(*keys[i]) for i in missing])
+            redis_hits = 0
+            for i, value in zip(missing, cached):
+                if value is not None:
+                    label, probability = value.split(",")
+                    results[i] = (int(label), float(probability) if probability else None)
+                    redis_hits += 1
+            if redis_hits:
+                metrics.inc("prediction_cache_hits_total", redis_hits, model=model, tier="redis")
+                self._store_local([keys[i] for i in missing if results[i] is not None],
+                                  [results[i] for i in missing if results[i] is not None])
+            missing = [i for i in missing if results[i] is None]
+
+        if missing:
+            metrics.inc("prediction_cache_misses_total", len(missing), model=model)
+            labels, probabilities = await score(rows[missing].astype(np.float32))
+            labels = np.asarray(labels).tolist()
+            if probabilities is None:
+                scored = [(int(label), None) for label in labels]
+            else:
+                scored = [(int(label), float(probability))
+                          for label, probability in zip(labels, np.asarray(probabilities).tolist())]
+            for i, result in zip(missing, scored):
+                results[i] = result
+            # A reload while scoring would cache the new model's answer under the old version
+            if model_registry.loaded_version(model) == version:
+                self._store_local([keys[i] for i in missing], scored)
+                if self.redis is not None:
+                    async with self.redis.pipeline(transaction=False) as pipe:
+                        for i, (label, probability) in zip(missing, scored):
+                            pipe.set(self.redis_key(*keys[i]), f"{label},{'' if probability is None else probability!r}",
+                                     ex=self.redis_ttl)
+                        await pipe.execute()
+
+        labels = np.array([label for label, _ in results], dtype=np.int64)
+        if results[0][1] is None:
+            return labels, None
+        return labels, np.array([probability for _, probability in results], dtype=np.float32)
+
+    def _store_local(self, keys: List[tuple], results: List[tuple]) -> None:
+        with self._lock:
+            for key, result in zip(keys, results):
+                self._local[key] = result
+                self._local.move_to_end(key)
+            while len(self._local) > self.max_size:
+                self._local.popitem(last=False)
@@ -0,0 +1,143 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import logger
+from config import MODEL_RELOAD_CHECK_INTERVAL, INFERENCE_BACKENDS, ORT_INTRA_OP_THREADS, ORT_INTER_OP_THREADS
+
+
+class ModelEntry:
+    """
+    A loaded model together with the checkpoint files it was built from.
+
+    The object returned by the loader is shared between all requests, so callers must treat it as read-only.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], paths: List[str]):
+        self.name = name
+        self.loader = loader
+        self.paths = paths
+        self.model = None
+        self.version = None
+        self.mtimes = {}
+        self.last_checked = 0.0
+
+    def current_mtimes(self) -> Dict[str, int]:
+        return {path: os.stat(path).st_mtime_ns for path in self.paths}
+
+    def compute_version(self) -> str:
+        # Hash the checkpoint contents so the version is stable across restarts and processes
+        digest = hashlib.sha256()
+        for path in self.paths:
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    digest.update(block)
+        return digest.hexdigest()[:16]
+
+
+class ModelRegistry:
+    """
+    Process-wide registry that loads every model once and hands out the shared instance.
+
+    A checkpoint is reloaded when the mtime of any of its files changes. The mtimes are only
+    re-checked every `check_interval` seconds so the hot path does not stat the disk on every request.
+    Callbacks added with `on_reload` are called with (name, version) whenever a model's version changes.
+    """
+
+    def __init__(self, check_interval: float = MODEL_RELOAD_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._entries: Dict[str, ModelEntry] = {}
+        self._lock = threading.Lock()
+        self._reload_callbacks: List[Callable[[str, str], None]] = []
+
+    def register(self, name: str, loader: Callable[[], Any], paths: List[str]) -> None:
+        self._entries[name] = ModelEntry(name, loader, paths)
+
+    def on_reload(self, callback: Callable[[str, str], None]) -> None:
+        self._reload_callbacks.append(callback)
+
+    def names(self) -> List[str]:
+        return list(self._entries)
+
+    def load_all(self) -> None:
+        for entry in self._entries.values():
+            with self._lock:
+                self._load(entry)
+
+    def _load(self, entry: ModelEntry) -> None:
+        mtimes = entry.current_mtimes()
+        previous_version = entry.version
+        entry.model = entry.loader()
+        entry.version = entry.compute_version()
+        entry.mtimes = mtimes
+        entry.last_checked = time.monotonic()
+        logger.info(f"Model '{entry.name}' loaded (version {entry.version})")
+        if entry.version != previous_version:
+            for callback in self._reload_callbacks:
+                callback(entry.name, entry.version)
+
+    def _is_stale(self, entry: ModelEntry) -> bool:
+        try:
+            return entry.current_mtimes() != entry.mtimes
+        except OSError as e:
+            # Checkpoint is being replaced, keep serving the copy we already have
+            logger.warning(f"Could not stat checkpoint of model '{entry.name}': {e}")
+            return False
+
+    def get_entry(self, name: str) -> ModelEntry:
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model '{name}' is not registered")
+
+        now = time.monotonic()
+        if entry.model is not None and now - entry.last_checked < self.check_interval:
+            return entry
+
+        with self._lock:
+            if entry.model is None:
+                self._load(entry)
+            elif now - entry.last_checked >= self.check_interval:
+                entry.last_checked = now
+                if self._is_stale(entry):
+                    try:
+                        self._load(entry)
+                    except Exception as e:
+                        logger.error(f"Hot reload of model '{entry.name}' failed, keeping version {entry.version}: {e}")
+        return entry
+
+    def get(self, name: str) -> Any:
+        return self.get_entry(name).model
+
+    def version(self, name: str) -> Optional[str]:
+        return self.get_entry(name).version
+
+    def loaded_version(self, name: str) -> Optional[str]:
+        """
+        Version of the model currently loaded, without the staleness check of `get_entry`.
+
+        Safe to call on the event loop: it never stats the checkpoint or reloads the model, that only
+        happens on the threads that run inference.
+        """
+        entry = self._entries.get(name)
+        if entry is None:
+            raise KeyError(f"Model '{name}' is not registered")
+        return entry.version
+
+
+def _load_mlp():
+    from ML.models.MLP.inference import Inference
+    return Inference(model_name="mlp", backend=INFERENCE_BACKENDS.get("MLP", "torch"),
+                     intra_op_threads=ORT_INTRA_OP_THREADS, inter_op_threads=ORT_INTER_OP_THREADS)
+
+
+def _load_lr():
+    from ML.models.LR.predict import load_model
+    return load_model()
+
+
+model_registry = ModelRegistry()
+model_registry.register("MLP", _load_mlp, ["ML/models/MLP/checkpoint/mlp/model.pth",
+                                           "ML/models/MLP/checkpoint/mlp/scaler.pkl"])
+model_registry.register("LR", _load_lr, ["ML/models/LR/checkpoint/lr/logistic_regression_model.joblib"])
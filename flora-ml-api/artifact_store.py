@@ -0,0 +1,204 @@
+# artifact_store.py
+# Content-addressed copies of the downloadable ML/FL artifacts, served with strong ETags, Range and precompressed variants.
+
+import asyncio
+import gzip
+import hashlib
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from starlette.requests import Request
+from starlette.responses import FileResponse, Response
+
+from config import ARTIFACT_STORE_DIR
+from logger import logger
+from metrics import metrics
+
+try:
+    import zstandard
+except ImportError:  # optional, without it only gzip variants are produced
+    zstandard = None
+
+# Download name -> source file, the names are what the download endpoints have always sent as filename
+ARTIFACT_SOURCES = {
+    "model.onnx": "ML/model.onnx",
+    "train_mlp_optimizer_model.onnx": "ML/train_mlp_optimizer_model.onnx",
+    "train_mlp_training_model.onnx": "ML/train_mlp_training_model.onnx",
+    "train_mlp_eval_model.onnx": "ML/train_mlp_eval_model.onnx",
+    "train_mlp_checkpoint": "FL/train_mlp_checkpoint",
+}
+
+# Preferred first when the client accepts several
+ENCODINGS = ("zstd", "gzip")
+ENCODING_SUFFIXES = {"zstd": ".zst", "gzip": ".gz"}
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+
+
+class Artifact:
+    def __init__(self, name: str, sha256: str, size: int, object_path: str, variants: Dict[str, Tuple[str, int]],
+                 source_stat: Tuple[int, int]):
+        self.name = name
+        self.sha256 = sha256
+        self.size = size
+        self.object_path = object_path
+        # encoding -> (path, size), only kept when smaller than the original
+        self.variants = variants
+        self.source_stat = source_stat
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        # Strong ETags must differ between representations, so each encoding gets its own
+        return f'"{self.sha256}-{encoding}"' if encoding else f'"{self.sha256}"'
+
+    def to_manifest(self) -> dict:
+        return {
+            "sha256": self.sha256,
+            "size": self.size,
+            "encodings": {encoding: size for encoding, (_, size) in self.variants.items()},
+            "url": f"/artifacts/{self.sha256}",
+        }
+
+
+class ArtifactStore:
+    """
+    Indexes the downloadable artifacts by SHA-256.
+
+    Every version of an artifact is copied to `{root}/objects/{sha256}` (plus .gz/.zst variants), so a
+    download in progress is never affected by the source being replaced, e.g. when an FL round publishes
+    a new checkpoint. A request only stats the source file; hashing and compressing happen off the event
+    loop and only when the source's mtime or size changed.
+    """
+
+    def __init__(self, root: str = ARTIFACT_STORE_DIR, sources: Dict[str, str] = ARTIFACT_SOURCES):
+        self.objects_dir = os.path.join(root, "objects")
+        self.sources = sources
+        self._artifacts: Dict[str, Artifact] = {}
+        self._locks: Dict[str, asyncio.Lock] = {name: asyncio.Lock() for name in sources}
+
+    def object_path(self, sha256: str, encoding: Optional[str] = None) -> str:
+        return os.path.join(self.objects_dir, sha256 + (ENCODING_SUFFIXES[encoding] if encoding else ""))
+
+    async def get(self, name: str) -> Optional[Artifact]:
+        """The current version of an artifact, None if its source file does not exist."""
+        try:
+            stat = os.stat(self.sources[name])
+        except FileNotFoundError:
+            return None
+        source_stat = (stat.st_mtime_ns, stat.st_size)
+        artifact = self._artifacts.get(name)
+        if artifact is not None and artifact.source_stat == source_stat:
+            return artifact
+
+        async with self._locks[name]:
+            artifact = self._artifacts.get(name)
+            if artifact is None or artifact.source_stat != source_stat:
+                artifact = await asyncio.to_thread(self._index, name, source_stat)
+                self._artifacts[name] = artifact
+                logger.info(f"Indexed artifact {name} as {artifact.sha256}")
+        return artifact
+
+    async def manifest(self) -> Dict[str, dict]:
+        artifacts = await asyncio.gather(*(self.get(name) for name in self.sources))
+        return {artifact.name: artifact.to_manifest() for artifact in artifacts if artifact is not None}
+
+    def find_object(self, sha256: str) -> Optional[Artifact]:
+        """An indexed artifact version by hash (current or from earlier in this process)."""
+        if not SHA256_PATTERN.match(sha256):
+            return None
+        for artifact in self._artifacts.values():
+            if artifact.sha256 == sha256:
+                return artifact
+        if not os.path.isfile(self.object_path(sha256)):
+            return None
+        # An older version written by this or another worker, content addressed so it never changes
+        return Artifact(sha256, sha256, os.path.getsize(self.object_path(sha256)), self.object_path(sha256),
+                        self._existing_variants(sha256), (0, 0))
+
+    def _existing_variants(self, sha256: str) -> Dict[str, Tuple[str, int]]:
+        variants = {}
+        for encoding in ENCODINGS:
+            path = self.object_path(sha256, encoding)
+            if os.path.isfile(path):
+                variants[encoding] = (path, os.path.getsize(path))
+        return variants
+
+    def _write_once(self, path: str, data: bytes) -> None:
+        if os.path.exists(path):
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _index(self, name: str, source_stat: Tuple[int, int]) -> Artifact:
+        with open(self.sources[name], "rb") as f:
+            data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._write_once(self.object_path(sha256), data)
+
+        compressed = {"gzip": lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+        if zstandard is not None:
+            compressed["zstd"] = lambda: zstandard.ZstdCompressor(level=19).compress(data)
+        for encoding, compress in compressed.items():
+            path = self.object_path(sha256, encoding)
+            if not os.path.exists(path):
+                variant = compress()
+                # Incompressible artifacts (e.g. dense float weights) are only served as they are
+                if len(variant) < len(data):
+                    self._write_once(path, variant)
+        metrics.inc("artifact_index_total", artifact=name)
+        return Artifact(name, sha256, len(data), self.object_path(sha256), self._existing_variants(sha256),
+                        source_stat)
+
+
+def accepted_encodings(request: Request) -> List[str]:
+    accepted = set()
+    for item in request.headers.get("accept-encoding", "").split(","):
+        token, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    return [encoding for encoding in ENCODINGS if encoding in accepted]
+
+
+def artifact_response(request: Request, artifact: Artifact, filename: str, immutable: bool = False,
+                      headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Conditional response for an artifact.
+
+    `If-None-Match` with any of the artifact's ETags gives a 304. Otherwise the zstd or gzip variant is
+    sent when the client accepts it, except for Range requests (resumed downloads), which always get the plain
+    bytes so offsets stay meaningful across attempts. Range itself is handled by FileResponse.
+    """
+    all_etags = {artifact.etag()} | {artifact.etag(encoding) for encoding in artifact.variants}
+    response_headers = {
+        "Cache-Control": "public, max-age=31536000, immutable" if immutable else "no-cache",
+        "Vary": "Accept-Encoding",
+        "X-Content-SHA256": artifact.sha256,
+        **(headers or {}),
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if "*" in tags or tags & all_etags:
+            metrics.inc("artifact_responses_total", result="not_modified")
+            return Response(status_code=304, headers={"ETag": artifact.etag(), **response_headers})
+
+    encoding = None
+    if "range" not in request.headers:
+        encoding = next((e for e in accepted_encodings(request) if e in artifact.variants), None)
+
+    if encoding:
+        path = artifact.variants[encoding][0]
+        response_headers["Content-Encoding"] = encoding
+    else:
+        path = artifact.object_path
+    response_headers["ETag"] = artifact.etag(encoding)
+    metrics.inc("artifact_responses_total", result="sent", encoding=encoding or "identity")
+    return FileResponse(path=path, filename=filename, media_type="application/octet-stream", headers=response_headers)
+
+
+artifact_store = ArtifactStore()
@@ -0,0 +1,126 @@
+"""
+End-to-end benchmarks of API requests through the in-process ASGI client (Starlette's TestClient), so routing,
+validation, dependencies, serialisation and the database/Redis round trips are all included.
+Registered with benchmarks/suite.py and run by benchmarks/run.py against SQLite and a fake Redis.
+
+Every benchmark starts the app with its lifespan and logs in its own user, outside of the timed calls.
+"""
+
+import contextlib
+import uuid
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks.bench_hot_paths import features, observations
+from benchmarks.suite import benchmark
+from database.db_config import SessionLocal, engine
+from ingestion.csv_stream import insert_observations_chunk
+from ML.models.batch_io import encode_matrix, BINARY
+
+PASSWORD = "correct horse battery staple"
+
+
+def register(client: TestClient) -> str:
+    username = f"bench_{uuid.uuid4().hex[:12]}"
+    response = client.post("/register", json={"username": username, "password": PASSWORD,
+                                              "email": f"{username}@example.com"})
+    response.raise_for_status()
+    return username
+
+
+def login(client: TestClient, username: str) -> dict:
+    response = client.post("/login", data={"username": username, "password": PASSWORD})
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@contextlib.contextmanager
+def api_session():
+    """A started app and the Authorization header of a freshly registered user, logged out afterwards."""
+    with TestClient(main.app) as client:
+        username = register(client)
+        headers = login(client, username)
+        try:
+            yield client, username, headers
+        finally:
+            client.post("/logout", headers=headers)
+            # The pooled connections are bound to the client's event loop, which ends with it
+            client.portal.call(engine.dispose)
+
+
+def checked(response):
+    response.raise_for_status()
+    return response
+
+
+@benchmark("api.login_logout", "api", rounds=5, min_round_time=0)
+def login_logout():
+    with TestClient(main.app) as client:
+        username = register(client)
+
+        def call():
+            headers = login(client, username)
+            checked(client.post("/logout", headers=headers))
+
+        try:
+            yield call
+        finally:
+            client.portal.call(engine.dispose)
+
+
+@benchmark("api.verify_token", "api")
+def verify_token():
+    with api_session() as (client, _, headers):
+        yield lambda: checked(client.post("/verifyToken", headers=headers))
+
+
+@benchmark("api.make_prediction_mlp[1]", "api")
+def make_prediction_one():
+    rng = np.random.default_rng(0)
+    with api_session() as (client, _, headers):
+        # New rows on every call, so the prediction cache never answers
+        yield lambda: checked(client.post("/make_prediction/MLP", headers=headers,
+                                          json={"features": rng.standard_normal((1, 4)).tolist()}))
+
+
+@benchmark("api.make_prediction_mlp[100]", "api")
+def make_prediction_batch():
+    rng = np.random.default_rng(0)
+    with api_session() as (client, _, headers):
+        yield lambda: checked(client.post("/make_prediction/MLP", headers=headers,
+                                          json={"features": rng.standard_normal((100, 4)).tolist()}))
+
+
+@benchmark("api.make_prediction_mlp_repeated[100]", "api")
+def make_prediction_repeated():
+    body = {"features": features(100).tolist()}
+    with api_session() as (client, _, headers):
+        # The same rows on every call, served by the prediction cache when it is enabled
+        yield lambda: checked(client.post("/make_prediction/MLP", headers=headers, json=body))
+
+
+@benchmark("api.batch_prediction_binary[10000]", "api")
+def batch_prediction_binary():
+    body = encode_matrix(features(10000))
+    with api_session() as (client, _, headers):
+        yield lambda: checked(client.post("/make_prediction/MLP/batch", content=body,
+                                          headers={**headers, "Content-Type": BINARY}))
+
+
+@benchmark("api.retrieve_data_per_user[1000]", "api")
+def retrieve_data_per_user():
+    async def insert(username: str):
+        async with SessionLocal() as db:
+            await insert_observations_chunk(observations(1000), username, db)
+
+    with api_session() as (client, username, headers):
+        client.portal.call(insert, username)
+        yield lambda: checked(client.post("/retrieve-data-per-user", headers=headers))
+
+
+@benchmark("api.download_fl_checkpoint", "api")
+def download_fl_checkpoint():
+    with api_session() as (client, _, headers):
+        yield lambda: checked(client.get("/download-FL-checkpoint", headers=headers))
@@ -0,0 +1,85 @@
+"""
+Benchmark of the federated aggregation of one round with many synthetic clients.
+
+Compares the original load_json_files + mean_aggregate path with FL_scripts.aggregation.aggregate_round
+(in process and with a process pool) on wall time and peak Python heap of the aggregating process.
+
+Run from the flora-ml-api folder:
+    python -m benchmarks.bench_fl_aggregation --clients 10000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from FL_scripts.aggregation import aggregate_round
+from FL_scripts.aggregator_helpers import load_json_files, mean_aggregate
+
+# MLP(input_size=3, hidden_size=64, output_size=1) as built in FL_scripts/aggregator.py
+MLP_PARAMS = 3 * 64 + 64 + 64 * 1 + 1
+
+
+def write_clients(folder: str, clients: int, params: int, seed: int = 0) -> None:
+    rng = np.random.default_rng(seed)
+    for i in range(clients):
+        with open(os.path.join(folder, f"round_1_client{i}.json"), 'w') as f:
+            json.dump({'params': rng.standard_normal(params).tolist()}, f)
+
+
+def write_bad_clients(folder: str, params: int) -> None:
+    bad = {
+        'truncated': '{"params": [1.0, 2.',
+        'no_params': json.dumps({'weights': [0.0] * params}),
+        'wrong_size': json.dumps({'params': [0.0] * (params - 1)}),
+        'not_numbers': json.dumps({'params': ['a'] * params}),
+        'nan': json.dumps({'params': [float('nan')] * params}),
+    }
+    for name, body in bad.items():
+        with open(os.path.join(folder, f"round_1_{name}.json"), 'w') as f:
+            f.write(body)
+
+
+def measure(label: str, fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<32} {elapsed:8.3f} s   peak heap {peak / 1e6:8.1f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=10000)
+    parser.add_argument('--params', type=int, default=MLP_PARAMS)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"Writing {args.clients} synthetic clients with {args.params} params each...")
+        write_clients(folder, args.clients, args.params)
+
+        legacy = measure("load_json_files + mean_aggregate",
+                         lambda: mean_aggregate(load_json_files(folder)))
+        inline = measure("aggregate_round (in process)",
+                         lambda: aggregate_round(folder, args.params, workers=1))
+        pooled = measure(f"aggregate_round ({args.workers} workers)",
+                         lambda: aggregate_round(folder, args.params, workers=args.workers))
+        print(f"max |legacy - in process| = {np.abs(legacy - inline.mean).max():.2e}")
+        print(f"max |legacy - pooled|     = {np.abs(legacy - pooled.mean).max():.2e}")
+
+        write_bad_clients(folder, args.params)
+        result = measure("aggregate_round with bad updates",
+                         lambda: aggregate_round(folder, args.params, workers=args.workers))
+        print(f"accepted {result.accepted}, rejected {sorted(result.rejected)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark of the per-round checkpoint generation.
+
+Compares the full export (torch.onnx.export + generate_artifacts via export_to_onnx) with writing the ORT
+checkpoint from the aggregated array through the cached training graph template.
+
+Run from the flora-ml-api folder:
+    python -m benchmarks.bench_fl_checkpoint --rounds 5
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from FL_scripts.aggregator_helpers import export_to_onnx, set_torch_weights
+from FL_scripts.checkpoint_builder import CheckpointBuilder
+from FL_scripts.torch_helpers.models.mlp import MLP
+
+
+def build_model() -> MLP:
+    return MLP(input_size=3, hidden_size=64, output_size=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    params = sum(p.numel() for p in build_model().parameters())
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as folder:
+        os.makedirs(os.path.join(folder, 'full'))
+        full = []
+        for _ in range(args.rounds):
+            model = build_model()
+            start = time.perf_counter()
+            set_torch_weights(model, rng.standard_normal(params).astype(np.float32))
+            export_to_onnx(model, onnx_store_dir=os.path.join(folder, 'full') + os.sep)
+            full.append(time.perf_counter() - start)
+
+        builder = CheckpointBuilder(build_model, template_root=os.path.join(folder, 'templates'))
+        start = time.perf_counter()
+        builder.ensure_template()
+        template_seconds = time.perf_counter() - start
+
+        cached = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            builder.write_checkpoint(rng.standard_normal(params).astype(np.float32),
+                                     os.path.join(folder, 'train_mlp_checkpoint'))
+            cached.append(time.perf_counter() - start)
+
+    print(f"full export per round         {np.median(full) * 1000:9.1f} ms (median of {args.rounds})")
+    print(f"template, once per version    {template_seconds * 1000:9.1f} ms")
+    print(f"cached template per round     {np.median(cached) * 1000:9.1f} ms (median of {args.rounds})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark of the client update formats: bytes per round and aggregation time per round.
+
+Writes the same synthetic clients once per format (JSON, float32, float16, int8, each binary format with
+and without zstd) and aggregates each round with FL_scripts.aggregation.aggregate_round.
+
+Run from the flora-ml-api folder:
+    python -m benchmarks.bench_fl_update_format --clients 2000
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from FL_scripts.aggregation import aggregate_round, BINARY_UPDATE_EXTENSION
+from FL_scripts.update_format import encode_update
+
+# Tensor sizes of MLP(input_size=3, hidden_size=64, output_size=1) in parameter order
+MLP_SEGMENTS = [3 * 64, 64, 64 * 1, 1]
+
+FORMATS = [
+    ("json", None, False),
+    ("float32", "float32", False),
+    ("float32+zstd", "float32", True),
+    ("float16", "float16", False),
+    ("float16+zstd", "float16", True),
+    ("int8", "int8", False),
+    ("int8+zstd", "int8", True),
+]
+
+
+def write_round(folder: str, updates: np.ndarray, dtype, compress: bool, round_number: int, model_hash: bytes) -> int:
+    total_bytes = 0
+    for i, params in enumerate(updates):
+        if dtype is None:
+            body = json.dumps({'params': params.tolist()}).encode('utf-8')
+            file_name = f"round_{round_number}_client{i}.json"
+        else:
+            body = encode_update(params, round_number, model_hash, dtype=dtype, compress=compress,
+                                 segment_sizes=MLP_SEGMENTS)
+            file_name = f"round_{round_number}_client{i}{BINARY_UPDATE_EXTENSION}"
+        with open(os.path.join(folder, file_name), 'wb') as f:
+            f.write(body)
+        total_bytes += len(body)
+    return total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=1)
+    args = parser.parse_args()
+
+    params = sum(MLP_SEGMENTS)
+    rng = np.random.default_rng(0)
+    updates = (rng.standard_normal((args.clients, params)) * 0.1).astype(np.float32)
+    exact_mean = updates.astype(np.float64).mean(axis=0)
+    model_hash = os.urandom(16)
+
+    print(f"{args.clients} clients x {params} params")
+    print(f"{'format':<14} {'bytes/client':>12} {'vs json':>8} {'aggregate s':>12} {'max abs error':>14}")
+    json_bytes = None
+    for name, dtype, compress in FORMATS:
+        with tempfile.TemporaryDirectory() as folder:
+            total_bytes = write_round(folder, updates, dtype, compress, 1, model_hash)
+            start = time.perf_counter()
+            result = aggregate_round(folder, params, workers=args.workers, expected_round=1,
+                                     expected_model_hash=model_hash)
+            elapsed = time.perf_counter() - start
+        json_bytes = json_bytes or total_bytes
+        error = np.abs(result.mean - exact_mean).max()
+        print(f"{name:<14} {total_bytes / args.clients:12.0f} {json_bytes / total_bytes:7.1f}x {elapsed:12.3f} {error:14.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Micro-benchmarks of the functions behind the hot API paths: inference, CSV ingestion, FL round aggregation,
+FL checkpoint writing, JWT and bcrypt. Registered with benchmarks/suite.py and run by benchmarks/run.py.
+
+Imported by benchmarks/run.py once it has pointed the app at SQLite and a fake Redis, the database
+benchmarks need the tables and the "bench" user it creates.
+"""
+
+import asyncio
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.bench_fl_aggregation import write_clients
+from benchmarks.suite import benchmark
+from database.db_config import SessionLocal, engine
+from FL_scripts.aggregation import aggregate_round
+from FL_scripts.checkpoint_builder import CheckpointBuilder
+from FL_scripts.torch_helpers.models.mlp import MLP
+from ingestion.csv_stream import insert_observations_chunk, process_csv, FEATURE_COLUMNS
+from main import create_access_token, decode_token, hash_password, verify_password
+from ML.models.execute_model import execute_model
+from ML.models.LR.predict import make_prediction
+from ML.models.registry import model_registry
+from schemas.prediction_request import PredictionRequest
+
+BENCH_USER = "bench"
+
+# MLP(input_size=3, hidden_size=64, output_size=1) as built in FL_scripts/aggregator.py
+FL_INPUT_SIZE = 3
+FL_CLIENTS = 100
+
+CSV_ROWS = 1000
+
+
+def features(rows: int, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((rows, 4)).astype(np.float32)
+
+
+def observations(rows: int, seed: int = 0) -> pd.DataFrame:
+    frame = pd.DataFrame(features(rows, seed).astype(np.float64), columns=FEATURE_COLUMNS)
+    frame["date"] = pd.date_range("2024-01-01", periods=rows, freq="h", tz="UTC").strftime("%Y-%m-%dT%H:%M:%S%z")
+    return frame
+
+
+@contextlib.contextmanager
+def event_loop():
+    """A private loop for async code under test; the pooled connections are bound to it and closed with it."""
+    loop = asyncio.new_event_loop()
+    try:
+        yield loop
+    finally:
+        loop.run_until_complete(engine.dispose())
+        loop.close()
+
+
+# Inference
+
+@benchmark("inference.mlp_predict[1]", "inference")
+def mlp_predict_one():
+    model_registry.load_all()
+    model, X = model_registry.get("MLP"), features(1)
+    yield lambda: model.predict(X)
+
+
+@benchmark("inference.mlp_predict[1000]", "inference")
+def mlp_predict_batch():
+    model_registry.load_all()
+    model, X = model_registry.get("MLP"), features(1000)
+    yield lambda: model.predict(X)
+
+
+@benchmark("inference.lr_make_prediction[1000]", "inference")
+def lr_make_prediction():
+    model_registry.load_all()
+    model, X = model_registry.get("LR"), features(1000)
+    yield lambda: make_prediction(X, model=model)
+
+
+@benchmark("inference.execute_model_mlp[1]", "inference")
+def execute_model_mlp():
+    model_registry.load_all()
+    request = PredictionRequest(features=features(1).tolist())
+    yield lambda: execute_model("MLP", request)
+
+
+@benchmark("inference.execute_model_mlp[100]", "inference")
+def execute_model_mlp_batch():
+    model_registry.load_all()
+    request = PredictionRequest(features=features(100).tolist())
+    yield lambda: execute_model("MLP", request)
+
+
+# Ingestion
+
+@benchmark(f"ingestion.insert_observations_chunk[{CSV_ROWS}]", "ingestion", rounds=10)
+def insert_chunk():
+    chunk = observations(CSV_ROWS)
+
+    async def insert():
+        async with SessionLocal() as db:
+            await insert_observations_chunk(chunk, BENCH_USER, db)
+
+    with event_loop() as loop:
+        yield lambda: loop.run_until_complete(insert())
+
+
+@benchmark(f"ingestion.process_csv[{CSV_ROWS}]", "ingestion", rounds=10)
+def process_csv_file():
+    folder = tempfile.mkdtemp(prefix="bench_csv_")
+    template = os.path.join(folder, "template.csv")
+    observations(CSV_ROWS).to_csv(template, index=False)
+    upload = os.path.join(folder, "upload.csv")
+
+    async def ingest():
+        # process_csv deletes the file it was given, a hard link makes a fresh one for free
+        os.link(template, upload)
+        async with SessionLocal() as db:
+            await process_csv(upload, BENCH_USER, db)
+
+    try:
+        with event_loop() as loop:
+            yield lambda: loop.run_until_complete(ingest())
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# Federated learning, the paths FL_scripts/aggregator.py runs every round
+
+@benchmark(f"fl.aggregate_round[{FL_CLIENTS}]", "fl", rounds=10)
+def fl_aggregate_round():
+    params = sum(p.numel() for p in MLP(FL_INPUT_SIZE, 64, 1).parameters())
+    folder = tempfile.mkdtemp(prefix="bench_fl_round_")
+    write_clients(folder, FL_CLIENTS, params)
+
+    def aggregate():
+        # aggregate_round prints the number of client files; in process, as the pool's start-up would dominate
+        with contextlib.redirect_stdout(io.StringIO()):
+            aggregate_round(folder, params, workers=1)
+
+    try:
+        yield aggregate
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+@benchmark("fl.write_checkpoint", "fl")
+def fl_write_checkpoint():
+    folder = tempfile.mkdtemp(prefix="bench_fl_checkpoint_")
+    builder = CheckpointBuilder(lambda: MLP(FL_INPUT_SIZE, 64, 1), input_shape=FL_INPUT_SIZE,
+                                template_root=os.path.join(folder, "templates"))
+    # The training graph template is generated once per model version, outside of the timed calls
+    with contextlib.redirect_stdout(io.StringIO()):
+        builder.ensure_template()
+    params = np.random.default_rng(0).standard_normal(sum(p.numel() for p in builder.model_factory().parameters()))
+    checkpoint = os.path.join(folder, builder.checkpoint_filename)
+
+    try:
+        yield lambda: builder.write_checkpoint(params, checkpoint)
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# Authentication
+
+@benchmark("auth.jwt_encode", "auth")
+def jwt_encode():
+    yield lambda: create_access_token({"sub": BENCH_USER, "role": "user", "sid": "0" * 32})
+
+
+@benchmark("auth.jwt_decode", "auth")
+def jwt_decode():
+    token = create_access_token({"sub": BENCH_USER, "role": "user", "sid": "0" * 32})
+    yield lambda: decode_token(token)
+
+
+@benchmark("auth.bcrypt_hash", "auth", rounds=5, min_round_time=0)
+def bcrypt_hash():
+    yield lambda: hash_password("correct horse battery staple")
+
+
+@benchmark("auth.bcrypt_verify", "auth", rounds=5, min_round_time=0)
+def bcrypt_verify():
+    hashed = hash_password("correct horse battery staple")
+    yield lambda: verify_password("correct horse battery staple", hashed)
@@ -0,0 +1,118 @@
+"""
+Benchmark suite of the API hot paths, self-contained: the app runs against a temporary SQLite database and an
+in-memory fake Redis, so no Postgres, Redis or running server is needed (unlike the locust files).
+
+    benchmarks/bench_hot_paths.py   micro-benchmarks (inference, ingestion, FL aggregation and checkpoint, JWT, bcrypt)
+    benchmarks/bench_api.py         end-to-end requests through the in-process ASGI client
+
+Results are written as JSON (median, mean, min, stdev and ops/s per benchmark, plus the machine, git commit and
+library versions). Pass an earlier result with --compare to see the change per benchmark; the exit code is 1
+when a median got slower by more than --max-regression.
+
+Run from the flora-ml-api folder:
+    python -m benchmarks.run
+    python -m benchmarks.run --group inference --group api --compare benchmarks/results/baseline.json
+"""
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import warnings
+from datetime import datetime
+
+# The app reads its configuration on import, so the stand-ins are set up before anything of it is imported
+WORK_DIR = tempfile.mkdtemp(prefix="flora_bench_")
+os.environ["DB_URL"] = f"sqlite+aiosqlite:///{os.path.join(WORK_DIR, 'flora.db')}"
+os.environ["ARTIFACT_STORE_DIR"] = os.path.join(WORK_DIR, "artifact_store")
+os.environ.setdefault("SECRET_KEY", "benchmark-secret-key-of-at-least-32-bytes")
+
+try:
+    import fakeredis
+except ImportError:
+    sys.exit("The benchmark suite needs the 'fakeredis' and 'aiosqlite' packages: pip install fakeredis aiosqlite")
+import redis.asyncio
+
+FAKE_REDIS_SERVER = fakeredis.FakeServer()
+
+
+async def fake_redis_from_url(*args, **kwargs):
+    return fakeredis.FakeAsyncRedis(server=FAKE_REDIS_SERVER, decode_responses=True)
+
+
+redis.asyncio.Redis.from_url = staticmethod(fake_redis_from_url)
+
+from logger import logger
+
+# Keep the console for the results, the log file still gets everything. The fake Redis has no CONFIG command,
+# so presence tracking warns on every app start
+logger.remove(0)
+logger.add(sys.stderr, level="ERROR")
+warnings.filterwarnings("ignore")
+
+from benchmarks import bench_hot_paths, bench_api  # noqa: F401, registers the benchmarks
+from benchmarks.suite import select, measure, write_report, compare, format_time
+from database.db_config import SessionLocal, engine
+from database.models import user, blacklisted_tokens, user_observations, user_observations_encrypted
+from database.models.user import User
+from main import hash_password
+
+
+async def create_database():
+    async with engine.begin() as conn:
+        for module in (user, blacklisted_tokens, user_observations, user_observations_encrypted):
+            await conn.run_sync(module.Base.metadata.create_all)
+    async with SessionLocal() as db:
+        db.add(User(username=bench_hot_paths.BENCH_USER, password=hash_password("bench"),
+                    email="bench@example.com", role="user", access_type="free", salt="bench"))
+        await db.commit()
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', action='append', default=[], metavar='TEXT',
+                        help='run the benchmarks whose name contains TEXT (repeatable)')
+    parser.add_argument('--group', action='append', default=[],
+                        choices=['inference', 'ingestion', 'fl', 'auth', 'api'], help='run one group (repeatable)')
+    parser.add_argument('--rounds', type=int, default=None, help='rounds per benchmark, overrides the defaults')
+    parser.add_argument('--output', default=None,
+                        help='JSON result file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', default=None, metavar='JSON', help='earlier result file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='slowdown of a median that fails --compare (default: 0.2 = 20%%)')
+    args = parser.parse_args()
+
+    benchmarks = select(args.only, args.group)
+    if not benchmarks:
+        sys.exit("No benchmark matches the selection")
+    output = args.output or os.path.join("benchmarks", "results", f"{datetime.now():%Y%m%d-%H%M%S}.json")
+
+    try:
+        asyncio.run(create_database())
+        results = {}
+        print(f"{'benchmark':<44} {'median':>12} {'min':>12} {'stdev':>12} {'ops/s':>12}")
+        started = time.perf_counter()
+        for bench in benchmarks:
+            result = measure(bench, args.rounds)
+            results[bench.name] = result
+            print(f"{bench.name:<44} {format_time(result['median']):>12} {format_time(result['min']):>12} "
+                  f"{format_time(result['stdev']):>12} {result['ops_per_second']:>12.1f}")
+        write_report(results, output)
+        print(f"\n{len(results)} benchmarks in {time.perf_counter() - started:.1f} s, results written to {output}")
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower than the baseline by more than "
+                  f"{args.max_regression:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Registry, timer, JSON report and run comparison of the benchmark suite, see benchmarks/run.py.
+
+A benchmark is a context manager function decorated with @benchmark: the code before `yield` is the setup,
+the yielded zero argument callable is what gets timed and the code after `yield` is the teardown.
+"""
+
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+# name -> Benchmark, in registration order
+BENCHMARKS: Dict[str, "Benchmark"] = {}
+
+
+class Benchmark:
+    def __init__(self, name: str, group: str, setup: Callable, rounds: int, min_round_time: float):
+        self.name = name
+        self.group = group
+        self.setup = setup
+        self.rounds = rounds
+        self.min_round_time = min_round_time
+
+
+def benchmark(name: str, group: str, rounds: int = 20, min_round_time: float = 0.005):
+    """
+    Register a benchmark. Fast calls are repeated inside a round until it lasts `min_round_time`
+    seconds, so timer resolution does not dominate; slow ones (bcrypt, login) run once per round.
+    """
+    def decorator(fn):
+        BENCHMARKS[name] = Benchmark(name, group, contextlib.contextmanager(fn), rounds, min_round_time)
+        return fn
+    return decorator
+
+
+def calibrate(fn: Callable, min_round_time: float) -> int:
+    """Calls per round, doubled until a round lasts at least `min_round_time` (like timeit's autorange)."""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - start >= min_round_time or number >= 1 << 20:
+            return number
+        number *= 2
+
+
+def measure(bench: Benchmark, rounds: Optional[int] = None) -> dict:
+    rounds = rounds or bench.rounds
+    with bench.setup() as fn:
+        # The calibration also serves as warm-up (lazy imports, caches, JIT paths in torch/ORT)
+        number = calibrate(fn, bench.min_round_time)
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            timings.append((time.perf_counter() - start) / number)
+    return {
+        "group": bench.group,
+        "rounds": rounds,
+        "calls_per_round": number,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.fmean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "ops_per_second": 1 / statistics.median(timings),
+    }
+
+
+def select(patterns: List[str], groups: List[str]) -> List[Benchmark]:
+    selected = []
+    for bench in BENCHMARKS.values():
+        if groups and bench.group not in groups:
+            continue
+        if patterns and not any(pattern in bench.name for pattern in patterns):
+            continue
+        selected.append(bench)
+    return selected
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    versions = {}
+    for module in ("numpy", "torch", "onnxruntime", "sqlalchemy", "fastapi"):
+        try:
+            versions[module] = __import__(module).__version__
+        except ImportError:
+            versions[module] = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit or None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "versions": versions,
+    }
+
+
+def write_report(results: Dict[str, dict], path: str) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+def compare(results: Dict[str, dict], baseline_path: str, max_regression: float) -> List[str]:
+    """
+    Print the median of every benchmark next to the baseline run's and return the names of those that
+    got slower by more than `max_regression` (0.2 = 20%).
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)["results"]
+    regressions = []
+    print(f"\n{'benchmark':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"{name:<44} {'-':>12} {format_time(result['median']):>12} {'new':>8}")
+            continue
+        change = result["median"] / baseline[name]["median"] - 1
+        flag = ""
+        if change > max_regression:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<44} {format_time(baseline[name]['median']):>12} {format_time(result['median']):>12} "
+              f"{change:>+7.1%}{flag}")
+    return regressions
+
+
+def format_time(seconds: float) -> str:
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
@@ -0,0 +1,98 @@
+# config.py
+# Central place for tunables that are read from the environment (.env) at import time.
+
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Model registry: how often (in seconds) a checkpoint's mtime is re-checked for hot reload
+MODEL_RELOAD_CHECK_INTERVAL = float(os.getenv("MODEL_RELOAD_CHECK_INTERVAL", "5"))
+
+# Prediction micro-batching: a batch is flushed when it holds this many rows or after this many milliseconds
+PREDICTION_BATCHING_ENABLED = os.getenv("PREDICTION_BATCHING_ENABLED", "true").lower() == "true"
+PREDICTION_BATCH_MAX_SIZE = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "64"))
+PREDICTION_BATCH_MAX_WAIT_MS = float(os.getenv("PREDICTION_BATCH_MAX_WAIT_MS", "2"))
+
+# Executor pools for CPU-bound work ("thread" or "process"), calls beyond workers + max queue get a 503
+INFERENCE_POOL_KIND = os.getenv("INFERENCE_POOL_KIND", "thread")
+INFERENCE_POOL_WORKERS = int(os.getenv("INFERENCE_POOL_WORKERS", "4"))
+INFERENCE_POOL_MAX_QUEUE = int(os.getenv("INFERENCE_POOL_MAX_QUEUE", "256"))
+PASSWORD_POOL_KIND = os.getenv("PASSWORD_POOL_KIND", "thread")
+PASSWORD_POOL_WORKERS = int(os.getenv("PASSWORD_POOL_WORKERS", "4"))
+PASSWORD_POOL_MAX_QUEUE = int(os.getenv("PASSWORD_POOL_MAX_QUEUE", "64"))
+
+# Inference backend per model, e.g. "MLP=onnx" ("torch" is used for models that are not listed)
+INFERENCE_BACKENDS = dict(
+    item.split("=", 1) for item in os.getenv("INFERENCE_BACKENDS", "MLP=torch").split(",") if "=" in item
+)
+# Compare the ONNX graph against the torch checkpoint on every model load, needs torch at runtime
+ONNX_PARITY_CHECK = os.getenv("ONNX_PARITY_CHECK", "false").lower() == "true"
+ORT_INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "1"))
+ORT_INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "1"))
+
+# Server-side scoring of a user's stored observations
+HISTORY_SCORING_CHUNK_SIZE = int(os.getenv("HISTORY_SCORING_CHUNK_SIZE", "5000"))
+HISTORY_SCORING_CACHE_TTL = int(os.getenv("HISTORY_SCORING_CACHE_TTL", "86400"))
+HISTORY_SCORING_CACHE_MAX_BYTES = int(os.getenv("HISTORY_SCORING_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+# CSV ingestion jobs
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_CHUNK_SIZE = int(os.getenv("INGESTION_CHUNK_SIZE", "10000"))
+INGESTION_JOB_LEASE_SECONDS = float(os.getenv("INGESTION_JOB_LEASE_SECONDS", "60"))
+INGESTION_JOB_TTL = int(os.getenv("INGESTION_JOB_TTL", str(7 * 24 * 3600)))
+
+# Authenticated user context cache: per-process LRU in front of a shared Redis copy
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_LOCAL_TTL = float(os.getenv("USER_CACHE_LOCAL_TTL", "30"))
+USER_CACHE_REDIS_TTL = int(os.getenv("USER_CACHE_REDIS_TTL", "600"))
+
+# Token revocation: in-process Bloom filter size (bits, hash functions) and how often (in seconds) it is rebuilt
+TOKEN_REVOCATION_BLOOM_BITS = int(os.getenv("TOKEN_REVOCATION_BLOOM_BITS", str(1 << 20)))
+TOKEN_REVOCATION_BLOOM_HASHES = int(os.getenv("TOKEN_REVOCATION_BLOOM_HASHES", "7"))
+TOKEN_REVOCATION_REBUILD_INTERVAL = float(os.getenv("TOKEN_REVOCATION_REBUILD_INTERVAL", "600"))
+
+# Registration uniqueness index: users copied into the Redis sets per database round trip
+REGISTRATION_INDEX_BATCH_SIZE = int(os.getenv("REGISTRATION_INDEX_BATCH_SIZE", "5000"))
+
+# Federated aggregation: processes parsing client updates and how many files each task reduces to a partial mean
+FL_AGGREGATION_WORKERS = int(os.getenv("FL_AGGREGATION_WORKERS", str(os.cpu_count() or 1)))
+FL_AGGREGATION_FILES_PER_TASK = int(os.getenv("FL_AGGREGATION_FILES_PER_TASK", "256"))
+
+# Federated round orchestration: pool for aggregation/export, how long aggregation waits for uploads in
+# flight and after how many seconds a round stuck in progress (its worker died) may be started again
+FL_POOL_KIND = os.getenv("FL_POOL_KIND", "process")
+FL_ROUND_UPLOAD_DRAIN_SECONDS = float(os.getenv("FL_ROUND_UPLOAD_DRAIN_SECONDS", "30"))
+FL_ROUND_STALE_SECONDS = float(os.getenv("FL_ROUND_STALE_SECONDS", "3600"))
+
+# Content-addressed copies (and gzip/zstd variants) of the downloadable model artifacts
+ARTIFACT_STORE_DIR = os.getenv("ARTIFACT_STORE_DIR", "artifact_store")
+
+# Delta checkpoint downloads: how many rounds back a client may be and how many encoded deltas are cached per worker
+FL_DELTA_MAX_ROUNDS = int(os.getenv("FL_DELTA_MAX_ROUNDS", "5"))
+FL_DELTA_CACHE_SIZE = int(os.getenv("FL_DELTA_CACHE_SIZE", "32"))
+
+# Websocket fan-out: seconds a single send may take before the socket is closed, share of clients a round trigger goes to
+WS_FANOUT_SEND_TIMEOUT = float(os.getenv("WS_FANOUT_SEND_TIMEOUT", "5"))
+WS_FANOUT_SAMPLE_FRACTION = float(os.getenv("WS_FANOUT_SAMPLE_FRACTION", "0.5"))
+# Seconds after which the websocket clients of a worker that stopped refreshing its alive key are dropped
+WS_FANOUT_WORKER_TTL = int(os.getenv("WS_FANOUT_WORKER_TTL", "30"))
+
+# Presence: seconds a session stays online without activity, how often expired sessions are swept from the online index
+PRESENCE_TTL = int(os.getenv("PRESENCE_TTL", "300"))
+PRESENCE_SWEEP_INTERVAL = float(os.getenv("PRESENCE_SWEEP_INTERVAL", "60"))
+
+# Encrypted blobs: size of the bytea chunks a ciphertext is stored in and the largest blob accepted
+ENCRYPTED_BLOB_CHUNK_SIZE = int(os.getenv("ENCRYPTED_BLOB_CHUNK_SIZE", str(1024 * 1024)))
+ENCRYPTED_BLOB_MAX_BYTES = int(os.getenv("ENCRYPTED_BLOB_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Batch prediction: largest request body accepted and how many rows go to the inference pool per call
+PREDICTION_BATCH_MAX_BYTES = int(os.getenv("PREDICTION_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+PREDICTION_BATCH_CHUNK_ROWS = int(os.getenv("PREDICTION_BATCH_CHUNK_ROWS", "65536"))
+
+# Prediction cache: rows kept per worker, decimals features are rounded to for the key, TTL of the shared Redis tier (0 disables it)
+PREDICTION_CACHE_ENABLED = os.getenv("PREDICTION_CACHE_ENABLED", "true").lower() == "true"
+PREDICTION_CACHE_SIZE = int(os.getenv("PREDICTION_CACHE_SIZE", "100000"))
+PREDICTION_CACHE_DECIMALS = int(os.getenv("PREDICTION_CACHE_DECIMALS", "4"))
+PREDICTION_CACHE_REDIS_TTL = int(os.getenv("PREDICTION_CACHE_REDIS_TTL", "3600"))
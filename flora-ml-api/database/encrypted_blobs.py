@@ -0,0 +1,225 @@
+import base64
+import json
+from datetime import datetime, timezone
+from typing import AsyncIterator, Optional
+
+from sqlalchemy import func, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from config import ENCRYPTED_BLOB_CHUNK_SIZE, ENCRYPTED_BLOB_MAX_BYTES
+from database.db_config import SessionLocal
+from database.models.user_observations_encrypted import UserObservationsEncrypted, UserObservationsEncryptedChunk
+from streaming import encode_cursor, decode_cursor
+
+# Concurrent completions of the same user's blobs race for the next seq, the loser retries
+SEQ_ATTEMPTS = 5
+
+
+class BlobTooLarge(Exception):
+    """Raised when an upload would make a blob larger than ENCRYPTED_BLOB_MAX_BYTES."""
+
+
+class BlobConflict(Exception):
+    """Raised when an append does not continue the blob where it ends, or the blob is already complete."""
+
+
+def seq_from_cursor(cursor: Optional[str]) -> int:
+    """The seq a sync cursor points after, 0 for a full download. Raises ValueError on an invalid cursor."""
+    if cursor is None:
+        return 0
+    values = decode_cursor(cursor)
+    # The seq must also fit the INTEGER column, the driver rejects larger values with a database error
+    if len(values) != 1 or type(values[0]) is not int or not 0 <= values[0] < 2 ** 31:
+        raise ValueError("Invalid cursor")
+    return values[0]
+
+
+async def create_blob(db: AsyncSession, user_id: int, iv: str, encrypted_data: Optional[str] = None,
+                      commit: bool = True) -> UserObservationsEncrypted:
+    """
+    Add a pending blob. With commit=False it is only flushed, so the append_to_blob that follows stores the row
+    and its first chunks in one transaction and a rejected or broken upload leaves nothing behind.
+    """
+    blob = UserObservationsEncrypted(user_id=user_id, iv=iv, encrypted_data=encrypted_data,
+                                     size=len(encrypted_data or ""), created_at=datetime.now(timezone.utc))
+    db.add(blob)
+    if commit:
+        await db.commit()
+    else:
+        await db.flush()
+    return blob
+
+
+async def get_pending_blob(db: AsyncSession, user_id: int, blob_id: int) -> Optional[UserObservationsEncrypted]:
+    result = await db.execute(
+        select(UserObservationsEncrypted)
+        .where(UserObservationsEncrypted.id == blob_id, UserObservationsEncrypted.user_id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def append_to_blob(db: AsyncSession, blob: UserObservationsEncrypted, body: AsyncIterator[bytes],
+                         offset: Optional[int] = None, chunk_size: int = ENCRYPTED_BLOB_CHUNK_SIZE,
+                         max_bytes: int = ENCRYPTED_BLOB_MAX_BYTES) -> int:
+    """
+    Append a request body to a pending blob as bytea chunks of at most `chunk_size` bytes, returns the new size.
+
+    Only one chunk is held in memory. `offset` must equal the current size when given, so a client retrying
+    an append after a lost response does not store the same bytes twice.
+
+    Raises:
+        BlobConflict: If the blob is complete or `offset` is not where the blob ends.
+        BlobTooLarge: If the blob would exceed `max_bytes`, nothing of this append is kept.
+    """
+    if blob.seq is not None:
+        raise BlobConflict("Blob is already complete")
+    if offset is not None and offset != blob.size:
+        raise BlobConflict(f"Blob has {blob.size} bytes, append at offset {blob.size}")
+
+    result = await db.execute(
+        select(func.max(UserObservationsEncryptedChunk.chunk_index))
+        .where(UserObservationsEncryptedChunk.blob_id == blob.id)
+    )
+    last_index = result.scalar()
+    chunk_index = 0 if last_index is None else last_index + 1
+    size = blob.size
+    buffer = bytearray()
+
+    async def flush(data: bytes):
+        nonlocal chunk_index
+        db.add(UserObservationsEncryptedChunk(blob_id=blob.id, chunk_index=chunk_index, data=data))
+        await db.flush()
+        chunk_index += 1
+
+    try:
+        async for piece in body:
+            size += len(piece)
+            if size > max_bytes:
+                raise BlobTooLarge(f"Blobs are limited to {max_bytes} bytes")
+            buffer += piece
+            while len(buffer) >= chunk_size:
+                await flush(bytes(buffer[:chunk_size]))
+                del buffer[:chunk_size]
+        if buffer:
+            await flush(bytes(buffer))
+        # Guarded by the size read above, a concurrent append to the same blob updates nothing and is rolled back
+        updated = await db.execute(
+            update(UserObservationsEncrypted)
+            .where(UserObservationsEncrypted.id == blob.id, UserObservationsEncrypted.size == blob.size,
+                   UserObservationsEncrypted.seq.is_(None))
+            .values(size=size)
+        )
+        if updated.rowcount != 1:
+            raise BlobConflict("Blob was changed by a concurrent upload")
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise BlobConflict("Blob was changed by a concurrent upload")
+    except Exception:
+        await db.rollback()
+        raise
+    return size
+
+
+async def complete_blob(db: AsyncSession, user_id: int, blob_id: int) -> int:
+    """
+    Give a blob the user's next seq, which makes it visible to downloads, and return it.
+
+    The seq is MAX(seq) + 1 under the unique (user_id, seq) index: a concurrent completion blocks on the
+    index until the first commits and then retries, so seqs become visible in increasing order and a sync
+    cursor never skips a blob.
+
+    Raises:
+        BlobConflict: If the blob does not exist or is already complete.
+    """
+    next_seq = (
+        select(func.coalesce(func.max(UserObservationsEncrypted.seq), 0) + 1)
+        .where(UserObservationsEncrypted.user_id == user_id)
+        .scalar_subquery()
+    )
+    for attempt in range(SEQ_ATTEMPTS):
+        try:
+            result = await db.execute(
+                update(UserObservationsEncrypted)
+                .where(UserObservationsEncrypted.id == blob_id, UserObservationsEncrypted.user_id == user_id,
+                       UserObservationsEncrypted.seq.is_(None))
+                .values(seq=next_seq)
+                .returning(UserObservationsEncrypted.seq)
+            )
+            seq = result.scalar_one_or_none()
+            if seq is None:
+                await db.rollback()
+                raise BlobConflict("Blob does not exist or is already complete")
+            await db.commit()
+            return seq
+        except IntegrityError:
+            await db.rollback()
+            if attempt == SEQ_ATTEMPTS - 1:
+                raise
+    raise RuntimeError("unreachable")
+
+
+def blobs_query(user_id: int, after_seq: int = 0):
+    """Complete blobs after `after_seq` with their chunks, ordered by (seq, chunk_index), served by the (user_id, seq) index."""
+    return (
+        select(UserObservationsEncrypted.seq, UserObservationsEncrypted.iv, UserObservationsEncrypted.size,
+               UserObservationsEncrypted.encrypted_data, UserObservationsEncryptedChunk.data)
+        .outerjoin(UserObservationsEncryptedChunk, UserObservationsEncryptedChunk.blob_id == UserObservationsEncrypted.id)
+        .where(UserObservationsEncrypted.user_id == user_id, UserObservationsEncrypted.seq > after_seq)
+        .order_by(UserObservationsEncrypted.seq, UserObservationsEncryptedChunk.chunk_index)
+    )
+
+
+async def stream_blobs_json(user_id: int, after_seq: int = 0, array: bool = False,
+                            rows_per_fetch: int = 16) -> AsyncIterator[str]:
+    """
+    Serialise a user's blobs as NDJSON (or a JSON array of {"iv", "encryptedData"} with `array`) chunk by chunk.
+
+    Each NDJSON line also carries the blob's seq, size and the cursor to resume after it. Chunked blobs are
+    base64 encoded on the fly, carrying the last 1-2 bytes of a chunk over to the next one, so no blob is
+    ever held in memory as a whole.
+    """
+    # Own session: the request scoped one may be closed before a streamed response finishes
+    async with SessionLocal() as db:
+        stream = await db.stream(blobs_query(user_id, after_seq).execution_options(yield_per=rows_per_fetch))
+        if array:
+            yield "["
+        current_seq = None
+        carry = b""
+        async for row in stream:
+            if row.seq != current_seq:
+                if current_seq is not None:
+                    yield base64.b64encode(carry).decode("ascii") + '"}' + ("" if array else "\n")
+                    carry = b""
+                header = {"iv": row.iv}
+                if not array:
+                    header.update(seq=row.seq, size=row.size, cursor=encode_cursor(row.seq))
+                prefix = "," if array and current_seq is not None else ""
+                # The ciphertext is the last key so it can be written piece by piece. Legacy values are any string
+                # and are escaped (the closing quote is cut off), the base64 of chunks that follows needs no escaping
+                yield (prefix + json.dumps(header)[:-1] + ', "encryptedData": '
+                       + json.dumps(row.encrypted_data or "")[:-1])
+                current_seq = row.seq
+            if row.data:
+                data = carry + row.data
+                whole = len(data) - len(data) % 3
+                yield base64.b64encode(data[:whole]).decode("ascii")
+                carry = data[whole:]
+        if current_seq is not None:
+            yield base64.b64encode(carry).decode("ascii") + '"}' + ("" if array else "\n")
+        if array:
+            yield "]"
+
+
+async def stream_blob_bytes(user_id: int, seq: int) -> AsyncIterator[bytes]:
+    """The raw ciphertext of one complete blob, chunk by chunk."""
+    async with SessionLocal() as db:
+        stream = await db.stream(blobs_query(user_id, seq - 1).where(UserObservationsEncrypted.seq == seq)
+                                 .execution_options(yield_per=1))
+        async for row in stream:
+            if row.encrypted_data:
+                yield base64.b64decode(row.encrypted_data)
+            if row.data:
+                yield row.data
@@ -1,6 +1,6 @@
 # models/user_observations.py
 
-from sqlalchemy import Column, Integer, Float, TIMESTAMP
+from sqlalchemy import Column, Integer, Float, TIMESTAMP, Index
 from sqlalchemy.ext.declarative import declarative_base
 
 Base = declarative_base()
@@ -17,4 +17,11 @@ class UserObservation(Base):
     feature4 = Column(Float, nullable=False)
     date = Column(TIMESTAMP(timezone=True), nullable=False)
 
+    __table_args__ = (
+        # Serves MAX(observation_id) per user and lookups by observation
+        Index('ix_user_observations_user_id_observation_id', 'user_id', 'observation_id'),
+        # Serves a user's history ordered by date, id is the keyset pagination tie breaker
+        Index('ix_user_observations_user_id_date', 'user_id', 'date', 'id'),
+    )
+
 
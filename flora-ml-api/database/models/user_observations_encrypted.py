@@ -1,5 +1,6 @@
-from sqlalchemy import Column, Integer, Text
+from sqlalchemy import Column, Integer, BigInteger, Text, LargeBinary, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.types import TIMESTAMP
 
 Base = declarative_base()
 
@@ -7,8 +8,25 @@ class UserObservationsEncrypted(Base):
     __tablename__ = 'user_observations_encrypted'
 
     id = Column(Integer, primary_key=True, autoincrement=True)
-    user_id = Column(Integer)
+    user_id = Column(Integer, nullable=False)
+    # Per user insertion sequence, assigned when the blob is complete; NULL while a chunked upload is in progress
+    seq = Column(Integer, nullable=True)
+    # Base64 ciphertext of blobs uploaded through /upload-encrypted-data, newer blobs are stored as chunks
     encrypted_data = Column(Text)
     iv = Column(Text)
+    # Bytes of ciphertext (characters for the base64 `encrypted_data` of older blobs)
+    size = Column(BigInteger, nullable=False, default=0)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=True)
 
+    __table_args__ = (
+        # Serves incremental sync (seq > cursor) and keeps the sequence unique per user
+        Index('ix_user_observations_encrypted_user_id_seq', 'user_id', 'seq', unique=True),
+    )
 
+
+class UserObservationsEncryptedChunk(Base):
+    __tablename__ = 'user_observations_encrypted_chunks'
+
+    blob_id = Column(Integer, ForeignKey('user_observations_encrypted.id', ondelete='CASCADE'), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    data = Column(LargeBinary, nullable=False)
@@ -0,0 +1,79 @@
+from datetime import datetime
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database.db_config import SessionLocal
+from database.models.user_observations import UserObservation
+from streaming import encode_cursor, decode_cursor
+
+OBSERVATION_COLUMNS = (UserObservation.id, UserObservation.feature1, UserObservation.feature2,
+                       UserObservation.feature3, UserObservation.feature4, UserObservation.date)
+
+
+def observation_to_dict(row) -> dict:
+    return {
+        'feature1': row.feature1,
+        'feature2': row.feature2,
+        'feature3': row.feature3,
+        'feature4': row.feature4,
+        'date': row.date.isoformat(),
+    }
+
+
+def decode_observation_cursor(cursor: str) -> Tuple[datetime, int]:
+    """The (date, id) of the last row of a page. Raises ValueError on an invalid or tampered cursor."""
+    values = decode_cursor(cursor)
+    # The id must also fit the INTEGER column, the driver rejects larger values with a database error
+    if (len(values) != 2 or not isinstance(values[0], str) or type(values[1]) is not int
+            or not 0 <= values[1] < 2 ** 31):
+        raise ValueError("Invalid cursor")
+    last_date, last_id = values
+    return datetime.fromisoformat(last_date), last_id
+
+
+def observations_query(user_id: int, cursor: Optional[str] = None, start_date: Optional[datetime] = None,
+                       end_date: Optional[datetime] = None):
+    """
+    Plain column select of a user's observations ordered by (date, id), served by the (user_id, date, id) index.
+
+    `cursor` continues after the last row of a previous page (keyset pagination, no OFFSET scans).
+    """
+    query = select(*OBSERVATION_COLUMNS).where(UserObservation.user_id == user_id)
+    if start_date is not None:
+        query = query.where(UserObservation.date >= start_date)
+    if end_date is not None:
+        query = query.where(UserObservation.date < end_date)
+    if cursor is not None:
+        last_date, last_id = decode_observation_cursor(cursor)
+        query = query.where(or_(UserObservation.date > last_date,
+                                and_(UserObservation.date == last_date, UserObservation.id > last_id)))
+    return query.order_by(UserObservation.date, UserObservation.id)
+
+
+async def fetch_observations_page(db: AsyncSession, user_id: int, limit: int, cursor: Optional[str] = None,
+                                  start_date: Optional[datetime] = None,
+                                  end_date: Optional[datetime] = None) -> Tuple[List[dict], Optional[str]]:
+    """Return one page of observations and the cursor of the next page (None on the last page)."""
+    result = await db.execute(observations_query(user_id, cursor, start_date, end_date).limit(limit + 1))
+    rows = result.all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].date.isoformat(), rows[-1].id)
+    return [observation_to_dict(row) for row in rows], next_cursor
+
+
+async def stream_observations(user_id: int, start_date: Optional[datetime] = None,
+                              end_date: Optional[datetime] = None, chunk_size: int = 5000) -> AsyncIterator[List[dict]]:
+    """Yield a user's observations in batches straight from a server side cursor."""
+    # Own session: the request scoped one may be closed before a streamed response finishes
+    async with SessionLocal() as db:
+        stream = await db.stream(
+            observations_query(user_id, start_date=start_date, end_date=end_date)
+            .execution_options(yield_per=chunk_size)
+        )
+        async for rows in stream.partitions(chunk_size):
+            yield [observation_to_dict(row) for row in rows]
@@ -0,0 +1,91 @@
+# executors.py
+# Managed worker pools that keep CPU-bound work (model inference, bcrypt) off the event loop.
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Optional
+
+from config import (INFERENCE_POOL_KIND, INFERENCE_POOL_WORKERS, INFERENCE_POOL_MAX_QUEUE,
+                    PASSWORD_POOL_KIND, PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE, FL_POOL_KIND)
+from logger import logger
+from metrics import metrics
+
+
+class PoolSaturated(Exception):
+    """Raised when a pool already has `max_workers + max_queue` calls in flight."""
+
+    def __init__(self, pool_name: str):
+        super().__init__(f"Executor pool '{pool_name}' is saturated")
+        self.pool_name = pool_name
+
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict):
+    # Runs inside the worker, wall clock time so the start can be compared across processes
+    return time.time(), fn(*args, **kwargs)
+
+
+class ExecutorPool:
+    """
+    A bounded thread or process pool.
+
+    With kind="process" the submitted callable and its arguments must be picklable, i.e. module level
+    functions (or functools.partial of them), not lambdas or bound methods.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, kind: str = "thread"):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown executor kind '{kind}'")
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self._executor: Optional[Executor] = None
+        self._in_flight = 0
+
+    def start(self) -> None:
+        if self._executor is not None:
+            return
+        if self.kind == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        logger.info(f"Started {self.kind} pool '{self.name}' with {self.max_workers} workers")
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    async def run(self, fn: Callable, *args, **kwargs):
+        if self._executor is None:
+            self.start()
+        # Back-pressure: reject instead of letting the backlog (and every caller's latency) grow without bound
+        if self._in_flight >= self.max_workers + self.max_queue:
+            metrics.inc("executor_rejected_total", pool=self.name)
+            raise PoolSaturated(self.name)
+
+        self._in_flight += 1
+        metrics.set_gauge("executor_in_flight", self._in_flight, pool=self.name)
+        metrics.set_gauge("executor_queue_depth", self.queue_depth, pool=self.name)
+        submitted = time.time()
+        try:
+            loop = asyncio.get_running_loop()
+            started, result = await loop.run_in_executor(self._executor, _timed_call, fn, args, kwargs)
+            metrics.observe("executor_wait_seconds", max(0.0, started - submitted), pool=self.name)
+            metrics.observe("executor_run_seconds", time.time() - started, pool=self.name)
+            return result
+        finally:
+            self._in_flight -= 1
+            metrics.set_gauge("executor_in_flight", self._in_flight, pool=self.name)
+            metrics.set_gauge("executor_queue_depth", self.queue_depth, pool=self.name)
+
+
+inference_pool = ExecutorPool("inference", INFERENCE_POOL_WORKERS, INFERENCE_POOL_MAX_QUEUE, INFERENCE_POOL_KIND)
+password_pool = ExecutorPool("password", PASSWORD_POOL_WORKERS, PASSWORD_POOL_MAX_QUEUE, PASSWORD_POOL_KIND)
+# Federated rounds run their steps one at a time, the round state machine never submits more than one
+fl_pool = ExecutorPool("fl", 1, 0, FL_POOL_KIND)
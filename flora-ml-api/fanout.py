@@ -0,0 +1,247 @@
+# fanout.py
+# Delivers FL round triggers to websocket clients connected to any API worker.
+
+import asyncio
+import json
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from redis.exceptions import WatchError
+from starlette.websockets import WebSocket
+
+from config import WS_FANOUT_SEND_TIMEOUT, WS_FANOUT_SAMPLE_FRACTION, WS_FANOUT_WORKER_TTL
+from logger import logger
+from metrics import metrics
+
+CONNECTED_USERS_KEY = "connected_users"
+# client_id -> id of the worker holding its socket
+CONNECTION_OWNERS_KEY = "connected_users:worker"
+CHANNEL_PREFIX = "websocket_fanout"
+# Expiring key per worker, refreshed while the worker runs
+ALIVE_PREFIX = "websocket_fanout:alive"
+# Ids of the running workers, and per worker the set of clients it holds
+WORKERS_KEY = "websocket_fanout:workers"
+CLIENTS_PREFIX = "websocket_fanout:clients"
+
+
+def worker_channel(worker_id: str) -> str:
+    return f"{CHANNEL_PREFIX}:{worker_id}"
+
+
+def worker_alive_key(worker_id: str) -> str:
+    return f"{ALIVE_PREFIX}:{worker_id}"
+
+
+def worker_clients_key(worker_id: str) -> str:
+    return f"{CLIENTS_PREFIX}:{worker_id}"
+
+
+class WebSocketFanout:
+    """
+    Sends messages to a random share of the connected websocket clients, whichever worker they are on.
+
+    Every worker subscribes to its own channel `websocket_fanout:{worker_id}` and records which clients it
+    holds in `connected_users:worker` and in its own set `websocket_fanout:clients:{worker_id}`. A broadcast samples the recipients inside Redis (SRANDMEMBER, the
+    membership is never pulled), groups them by owner and publishes one message per worker naming its
+    clients; that worker sends to them concurrently, each send bounded by `send_timeout`.
+
+    The shared sets outlive any single worker: a stopping worker only removes its own clients. A worker that
+    crashed is noticed when a publish to it has no receiver, or when its `websocket_fanout:alive:{worker_id}`
+    key (refreshed every `worker_ttl` / 3 seconds) expires; the heartbeat of the others then removes its clients,
+    found through its own client set, so the cost of a sweep does not grow with the clients of live workers.
+    """
+
+    def __init__(self, redis_client, send_timeout: float = WS_FANOUT_SEND_TIMEOUT,
+                 sample_fraction: float = WS_FANOUT_SAMPLE_FRACTION, worker_ttl: int = WS_FANOUT_WORKER_TTL):
+        self.redis = redis_client
+        self.send_timeout = send_timeout
+        self.sample_fraction = sample_fraction
+        self.worker_ttl = worker_ttl
+        self.worker_id = uuid.uuid4().hex
+        self.sockets: Dict[str, WebSocket] = {}
+        self._pubsub = None
+        self._tasks: List[asyncio.Task] = []
+        self._deliveries = set()
+
+    async def start(self) -> None:
+        await self.redis.set(worker_alive_key(self.worker_id), "1", ex=self.worker_ttl)
+        await self.redis.sadd(WORKERS_KEY, self.worker_id)
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.subscribe(worker_channel(self.worker_id))
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._heartbeat())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await asyncio.gather(*self._deliveries, return_exceptions=True)
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe()
+            await self._pubsub.aclose()
+            self._pubsub = None
+        # Sockets of this worker die with it, other workers must not route to them any more
+        for client_id in list(self.sockets):
+            await self._forget(client_id)
+        self.sockets.clear()
+        await self._remove_worker(self.worker_id)
+        await self.redis.delete(worker_alive_key(self.worker_id))
+
+    async def register(self, client_id: str, websocket: WebSocket) -> None:
+        self.sockets[client_id] = websocket
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(CONNECTION_OWNERS_KEY, client_id, self.worker_id)
+            pipe.sadd(CONNECTED_USERS_KEY, client_id)
+            pipe.sadd(worker_clients_key(self.worker_id), client_id)
+            # Again in case a sweep took this worker for dead after a missed heartbeat
+            pipe.sadd(WORKERS_KEY, self.worker_id)
+            await pipe.execute()
+
+    async def unregister(self, client_id: str, websocket: WebSocket) -> None:
+        # The same user may have reconnected in the meantime, only the socket being closed is removed
+        if self.sockets.get(client_id) is not websocket:
+            return
+        del self.sockets[client_id]
+        await self._forget(client_id)
+
+    async def _forget(self, client_id: str, worker_id: Optional[str] = None) -> bool:
+        """
+        Remove a client owned by `worker_id` (default this worker) from the shared sets, unless it moved on.
+        Returns whether it was removed.
+        """
+        worker_id = worker_id or self.worker_id
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(CONNECTION_OWNERS_KEY)
+                    owner = await pipe.hget(CONNECTION_OWNERS_KEY, client_id)
+                    pipe.multi()
+                    # A client that reconnected to another worker only leaves this worker's set
+                    if owner == worker_id:
+                        pipe.hdel(CONNECTION_OWNERS_KEY, client_id)
+                        pipe.srem(CONNECTED_USERS_KEY, client_id)
+                    pipe.srem(worker_clients_key(worker_id), client_id)
+                    await pipe.execute()
+                    return owner == worker_id
+                except WatchError:
+                    continue
+
+    async def _remove_worker(self, worker_id: str) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.srem(WORKERS_KEY, worker_id)
+            pipe.delete(worker_clients_key(worker_id))
+            await pipe.execute()
+
+    async def sample_clients(self) -> List[str]:
+        connected = await self.redis.scard(CONNECTED_USERS_KEY)
+        if connected == 0:
+            return []
+        count = max(1, int(connected * self.sample_fraction))
+        # A positive count returns distinct members, picked by Redis
+        return await self.redis.srandmember(CONNECTED_USERS_KEY, count)
+
+    async def broadcast(self, message: str) -> int:
+        """Send `message` to a sample of the connected clients, returns how many were routed to a live worker."""
+        clients = await self.sample_clients()
+        if not clients:
+            return 0
+        owners = await self.redis.hmget(CONNECTION_OWNERS_KEY, clients)
+        by_worker: Dict[str, List[str]] = {}
+        for client_id, worker_id in zip(clients, owners):
+            if worker_id is not None:
+                by_worker.setdefault(worker_id, []).append(client_id)
+
+        routed = 0
+        for worker_id, worker_clients in by_worker.items():
+            payload = json.dumps({"message": message, "clients": worker_clients})
+            receivers = await self.redis.publish(worker_channel(worker_id), payload)
+            if receivers == 0:
+                await self._drop_worker_clients(worker_id, worker_clients)
+                continue
+            routed += len(worker_clients)
+        metrics.inc("ws_fanout_routed_total", routed)
+        return routed
+
+    async def _drop_worker_clients(self, worker_id: str, client_ids: List[str]) -> int:
+        logger.warning(f"Websocket worker {worker_id} is gone, dropping {len(client_ids)} of its clients")
+        removed = 0
+        for client_id in client_ids:
+            removed += await self._forget(client_id, worker_id)
+        return removed
+
+    async def sweep_dead_workers(self) -> int:
+        """Remove the clients of workers whose alive key expired, returns how many were removed."""
+        worker_ids = [worker_id for worker_id in await self.redis.smembers(WORKERS_KEY) if worker_id != self.worker_id]
+        if not worker_ids:
+            return 0
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for worker_id in worker_ids:
+                pipe.exists(worker_alive_key(worker_id))
+            alive = await pipe.execute()
+        removed = 0
+        for worker_id, is_alive in zip(worker_ids, alive):
+            if is_alive:
+                continue
+            client_ids = list(await self.redis.smembers(worker_clients_key(worker_id)))
+            if client_ids:
+                removed += await self._drop_worker_clients(worker_id, client_ids)
+            await self._remove_worker(worker_id)
+        return removed
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.worker_ttl / 3)
+            try:
+                await self.redis.set(worker_alive_key(self.worker_id), "1", ex=self.worker_ttl)
+                await self.sweep_dead_workers()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Websocket fan-out heartbeat failed: {e}")
+
+    async def _send(self, client_id: str, message: str) -> bool:
+        websocket = self.sockets.get(client_id)
+        if websocket is None:
+            metrics.inc("ws_fanout_sends_total", result="gone")
+            return False
+        try:
+            await asyncio.wait_for(websocket.send_text(message), self.send_timeout)
+        except Exception as e:
+            # A slow or broken socket is closed rather than holding up the next round trigger
+            result = "timeout" if isinstance(e, asyncio.TimeoutError) else "error"
+            metrics.inc("ws_fanout_sends_total", result=result)
+            logger.warning(f"Sending to websocket {client_id} failed ({result}), closing it")
+            await self.unregister(client_id, websocket)
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+            return False
+        metrics.inc("ws_fanout_sends_total", result="sent")
+        return True
+
+    async def deliver(self, message: str, client_ids: List[str]) -> int:
+        """Send to the given clients of this worker concurrently, returns how many sends succeeded."""
+        started = time.monotonic()
+        results = await asyncio.gather(*(self._send(client_id, message) for client_id in client_ids))
+        metrics.observe("ws_fanout_deliver_seconds", time.monotonic() - started)
+        return sum(results)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                # Blocks until a message arrives, no polling
+                async for message in self._pubsub.listen():
+                    if message["type"] != "message":
+                        continue
+                    payload = json.loads(message["data"])
+                    # Delivered in the background so one slow batch does not delay the next message
+                    delivery = asyncio.create_task(self.deliver(payload["message"], payload["clients"]))
+                    self._deliveries.add(delivery)
+                    delivery.add_done_callback(self._deliveries.discard)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Websocket fan-out subscription failed: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,115 @@
+import asyncio
+import os
+from datetime import datetime
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from sqlalchemy import func, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database.models.user import User
+from database.models.user_observations import UserObservation
+from logger import logger
+
+FEATURE_COLUMNS = ['feature1', 'feature2', 'feature3', 'feature4']
+CSV_COLUMNS = FEATURE_COLUMNS + ['date']
+COPY_COLUMNS = ['user_id', 'observation_id'] + CSV_COLUMNS
+
+
+async def get_user_id_and_max_observation_id(username: str, db: AsyncSession):
+    query = (
+        select(User.id, func.coalesce(func.max(UserObservation.observation_id), 0))
+        .join(UserObservation, User.id == UserObservation.user_id, isouter=True)
+        .where(User.username == username)
+        .group_by(User.id)
+    )
+    result = await db.execute(query)
+    user_id, max_observation_id = result.one()
+    return user_id, max_observation_id
+
+
+def chunk_to_records(chunk: pd.DataFrame, user_id: int, first_observation_id: int) -> list:
+    """Convert a parsed CSV chunk to COPY records column by column, without iterating rows in pandas."""
+    try:
+        # Dates are parsed for the whole column at once
+        dates = list(pd.to_datetime(chunk['date'], format='ISO8601').dt.to_pydatetime())
+    except (ValueError, TypeError, AttributeError):
+        # Mixed UTC offsets cannot be held in one datetime column, parse them one by one as before
+        dates = [datetime.fromisoformat(date_str) for date_str in chunk['date']]
+
+    observation_ids = np.arange(first_observation_id, first_observation_id + len(chunk)).tolist()
+    features = [chunk[column].astype(np.float64).tolist() for column in FEATURE_COLUMNS]
+    return list(zip(repeat(user_id), observation_ids, *features, dates))
+
+
+async def bulk_insert_records(records: list, db: AsyncSession) -> None:
+    """
+    Write observation records with asyncpg's binary COPY when the session runs on asyncpg,
+    otherwise with a batched multi-row INSERT ... VALUES.
+    """
+    connection = await db.connection()
+    if connection.dialect.driver == 'asyncpg':
+        raw_connection = await connection.get_raw_connection()
+        await raw_connection.driver_connection.copy_records_to_table(
+            UserObservation.__tablename__, records=records, columns=COPY_COLUMNS
+        )
+    else:
+        await db.execute(insert(UserObservation), [dict(zip(COPY_COLUMNS, record)) for record in records])
+
+
+async def get_user_id(username: str, db: AsyncSession) -> int:
+    result = await db.execute(select(User.id).where(User.username == username))
+    return result.scalar_one()
+
+
+async def insert_observations_chunk(chunk, current_user_username: str, db: AsyncSession, id_allocator=None):
+    if chunk.empty:
+        return 0
+
+    if id_allocator is not None:
+        # O(1) block reservation, see ingestion/id_allocator.py
+        user_id = await get_user_id(current_user_username, db)
+        first_observation_id = await id_allocator.reserve(user_id, len(chunk), db)
+    else:
+        user_id, max_observation_id = await get_user_id_and_max_observation_id(current_user_username, db)
+        first_observation_id = max_observation_id + 1
+    records = chunk_to_records(chunk, user_id, first_observation_id)
+
+    try:
+        await bulk_insert_records(records, db)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(status_code=500, detail=f"Error inserting observations: {str(e)}")
+    return len(records)
+
+
+def read_csv_chunks(file_path: str, chunk_size: int):
+    # The C parser reads the file incrementally, so memory stays bounded by chunk_size whatever the file size
+    return pd.read_csv(
+        file_path,
+        usecols=CSV_COLUMNS,
+        dtype={column: np.float64 for column in FEATURE_COLUMNS},
+        chunksize=chunk_size,
+    )
+
+
+async def process_csv(file_path: str, current_user_username: str, db: AsyncSession, chunk_size: int = 10000):
+    try:
+        reader = read_csv_chunks(file_path, chunk_size)
+        try:
+            while True:
+                # Parse the next chunk off the event loop
+                chunk = await asyncio.to_thread(next, reader, None)
+                if chunk is None:
+                    break
+                await insert_observations_chunk(chunk, current_user_username, db)
+        finally:
+            reader.close()
+    except Exception as e:
+        logger.error(f"Error processing CSV: {e}")
+    finally:
+        os.remove(file_path)
@@ -0,0 +1,40 @@
+from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from database.models.user_observations import UserObservation
+
+COUNTER_PREFIX = "observation_id_counter"
+
+
+class ObservationIdAllocator:
+    """
+    Hands out contiguous blocks of per-user observation ids with a Redis INCRBY counter.
+
+    The counter is seeded once from MAX(observation_id) (an index lookup on (user_id, observation_id))
+    with SET NX, so concurrent uploads for the same user both seed and reserve atomically. After that,
+    reserving a block is a single O(1) round trip no matter how long the user's history is.
+    Ids are never reused, so deleting observations leaves gaps rather than duplicates.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    @staticmethod
+    def counter_key(user_id: int) -> str:
+        return f"{COUNTER_PREFIX}:{user_id}"
+
+    async def _seed(self, user_id: int, db: AsyncSession) -> None:
+        result = await db.execute(
+            select(func.coalesce(func.max(UserObservation.observation_id), 0)).where(UserObservation.user_id == user_id)
+        )
+        # NX: if another upload seeded the counter in the meantime, its value (and reservations) win
+        await self.redis.set(self.counter_key(user_id), result.scalar(), nx=True)
+
+    async def reserve(self, user_id: int, count: int, db: AsyncSession) -> int:
+        """Reserve `count` consecutive ids for `user_id` and return the first one."""
+        key = self.counter_key(user_id)
+        if not await self.redis.exists(key):
+            await self._seed(user_id, db)
+        last_id = await self.redis.incrby(key, count)
+        return last_id - count + 1
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import os
+import time
+import uuid
+from typing import Optional
+
+from redis.exceptions import WatchError
+
+from config import INGESTION_WORKERS, INGESTION_CHUNK_SIZE, INGESTION_JOB_LEASE_SECONDS, INGESTION_JOB_TTL
+from database.db_config import SessionLocal
+from ingestion.csv_stream import read_csv_chunks, insert_observations_chunk, get_user_id
+from ingestion.id_allocator import ObservationIdAllocator
+from logger import logger
+from metrics import metrics
+from ML.models.history import invalidate_history_cache
+
+QUEUE_KEY = "ingestion_jobs:queue"
+PROCESSING_KEY = "ingestion_jobs:processing"
+
+
+def job_key(job_id: str) -> str:
+    return f"ingestion_job:{job_id}"
+
+
+class IngestionJobs:
+    """
+    Durable CSV ingestion queue backed by Redis.
+
+    Jobs are moved from the queue list to a processing list while a worker owns them, in the same transaction
+    that writes their first heartbeat. Each job keeps its progress in a Redis hash (rows parsed/inserted,
+    committed chunks, errors) and a heartbeat, refreshed every lease / 3 seconds while the job runs however
+    long a chunk takes. A job whose heartbeat is older than the lease (worker crashed or the app was stopped)
+    is put back on the queue and resumes after its last committed chunk. Progress is recorded right after each chunk's
+    commit, so a crash in between those two steps re-inserts at most that one chunk.
+    """
+
+    def __init__(self, redis_client, workers: int = INGESTION_WORKERS, chunk_size: int = INGESTION_CHUNK_SIZE,
+                 lease_seconds: float = INGESTION_JOB_LEASE_SECONDS):
+        self.redis = redis_client
+        self.id_allocator = ObservationIdAllocator(redis_client)
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.lease_seconds = lease_seconds
+        self._tasks = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._stopping = False
+        await self.requeue_stale()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._reaper()))
+
+    async def stop(self) -> None:
+        # Interrupted jobs stay in the processing list and are resumed once their lease expires
+        self._stopping = True
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def enqueue(self, file_path: str, username: str) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        await self.redis.hset(job_key(job_id), mapping={
+            "job_id": job_id,
+            "status": "queued",
+            "file_path": file_path,
+            "username": username,
+            "rows_parsed": 0,
+            "rows_inserted": 0,
+            "chunks_committed": 0,
+            "errors": "[]",
+            "created_at": now,
+            "heartbeat": now,
+        })
+        await self.redis.lpush(QUEUE_KEY, job_id)
+        metrics.inc("ingestion_jobs_enqueued_total")
+        return job_id
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = await self.redis.hgetall(job_key(job_id))
+        if not job:
+            return None
+        job["errors"] = json.loads(job.get("errors") or "[]")
+        for field in ("rows_parsed", "rows_inserted", "chunks_committed"):
+            job[field] = int(job.get(field, 0))
+        job.pop("heartbeat", None)
+        return job
+
+    async def queue_depth(self) -> int:
+        return await self.redis.llen(QUEUE_KEY)
+
+    async def requeue_stale(self) -> None:
+        deadline = time.time() - self.lease_seconds
+        for job_id in await self.redis.lrange(PROCESSING_KEY, 0, -1):
+            heartbeat = await self.redis.hget(job_key(job_id), "heartbeat")
+            if heartbeat is not None and float(heartbeat) >= deadline:
+                continue
+            # LREM tells us whether we won the race against another process doing the same
+            if await self.redis.lrem(PROCESSING_KEY, 1, job_id):
+                if heartbeat is None:
+                    continue
+                logger.warning(f"Ingestion job {job_id} lost its worker, resuming it")
+                await self.redis.hset(job_key(job_id), "status", "queued")
+                await self.redis.rpush(QUEUE_KEY, job_id)
+
+    async def _reaper(self) -> None:
+        while not self._stopping:
+            await asyncio.sleep(self.lease_seconds / 2)
+            try:
+                await self.requeue_stale()
+            except Exception as e:
+                logger.error(f"Ingestion job reaper failed: {e}")
+
+    async def _claim(self) -> Optional[str]:
+        """Move the oldest queued job to the processing list together with its heartbeat, None if there is none."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(QUEUE_KEY)
+                    job_id = await pipe.lindex(QUEUE_KEY, -1)
+                    if job_id is None:
+                        return None
+                    # The reaper never sees the job in the processing list with the heartbeat of its enqueue
+                    pipe.multi()
+                    pipe.lmove(QUEUE_KEY, PROCESSING_KEY, src="RIGHT", dest="LEFT")
+                    pipe.hset(job_key(job_id), "heartbeat", time.time())
+                    await pipe.execute()
+                    return job_id
+                except WatchError:
+                    continue
+
+    async def _refresh_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await self.redis.hset(job_key(job_id), "heartbeat", time.time())
+            except Exception as e:
+                logger.error(f"Could not refresh the lease of ingestion job {job_id}: {e}")
+
+    async def _worker(self) -> None:
+        while not self._stopping:
+            # Blocks until a job is queued without taking it: popping and pushing back on the same end
+            # leaves the queue as it was
+            if await self.redis.blmove(QUEUE_KEY, QUEUE_KEY, 5, src="RIGHT", dest="RIGHT") is None:
+                continue
+            job_id = await self._claim()
+            if job_id is None or self._stopping:
+                continue
+            lease = asyncio.create_task(self._refresh_lease(job_id))
+            try:
+                await self._run_job(job_id)
+            except Exception as e:
+                logger.error(f"Ingestion job {job_id} crashed: {e}")
+            finally:
+                lease.cancel()
+            await self.redis.lrem(PROCESSING_KEY, 1, job_id)
+            metrics.set_gauge("ingestion_queue_depth", await self.queue_depth())
+
+    async def _run_job(self, job_id: str) -> None:
+        key = job_key(job_id)
+        job = await self.redis.hgetall(key)
+        if not job:
+            return
+        file_path = job["file_path"]
+        username = job["username"]
+        chunks_committed = int(job.get("chunks_committed", 0))
+        await self.redis.hset(key, "status", "running")
+        started = time.perf_counter()
+
+        rows_parsed = 0
+        rows_inserted = int(job.get("rows_inserted", 0))
+        status = "completed"
+        try:
+            reader = read_csv_chunks(file_path, self.chunk_size)
+            try:
+                # Each job gets its own session, it must not depend on the request that enqueued it
+                async with SessionLocal() as db:
+                    user_id = await get_user_id(username, db)
+                    chunk_index = 0
+                    while True:
+                        chunk = await asyncio.to_thread(next, reader, None)
+                        if chunk is None:
+                            break
+                        rows_parsed += len(chunk)
+                        if chunk_index < chunks_committed:
+                            # Already inserted before the job was interrupted
+                            chunk_index += 1
+                            continue
+
+                        await self.redis.hset(key, "rows_parsed", rows_parsed)
+                        rows_inserted += await insert_observations_chunk(chunk, username, db, self.id_allocator)
+                        await invalidate_history_cache(self.redis, user_id)
+                        chunk_index += 1
+                        await self.redis.hset(key, mapping={
+                            "rows_inserted": rows_inserted,
+                            "chunks_committed": chunk_index,
+                        })
+                        metrics.inc("ingestion_rows_inserted_total", len(chunk))
+            finally:
+                reader.close()
+        except Exception as e:
+            status = "failed"
+            detail = getattr(e, "detail", None) or str(e)
+            logger.error(f"Error processing CSV for job {job_id}: {detail}")
+            errors = json.loads(await self.redis.hget(key, "errors") or "[]")
+            errors.append(detail)
+            await self.redis.hset(key, "errors", json.dumps(errors))
+
+        await self.redis.hset(key, mapping={"status": status, "rows_parsed": rows_parsed, "finished_at": time.time()})
+        await self.redis.expire(key, INGESTION_JOB_TTL)
+        metrics.inc("ingestion_jobs_finished_total", status=status)
+        metrics.observe("ingestion_job_seconds", time.perf_counter() - started)
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
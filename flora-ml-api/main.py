@@ -4,12 +4,15 @@ import re
 from logger import logger
 from datetime import datetime, timedelta, timezone
 import secrets
-from fastapi import FastAPI, HTTPException, Depends, status, Request, UploadFile, File, WebSocket, WebSocketDisconnect, BackgroundTasks, Response
+import uuid
+import time
+from fastapi import FastAPI, HTTPException, Depends, status, Request, UploadFile, File, WebSocket, WebSocketDisconnect, BackgroundTasks, Response, Query
+from fastapi import Path as PathParam
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import func
 from sqlalchemy.future import select
+from sqlalchemy.exc import IntegrityError
 
 from database.db_config import SessionLocal
 from database.models.user import User
@@ -28,22 +31,48 @@ import logging
 import shutil
 from passlib.hash import bcrypt
 from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import HTTPConnection
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from contextlib import asynccontextmanager
-from ML.models.execute_model import execute_model
+from ML.models.execute_model import execute_model, predict_rows, build_response, BATCHED_MODELS
+from ML.models.registry import model_registry
+from ML.models.batcher import MicroBatcher
+from ML.models.prediction_cache import PredictionCache
+from ML.models.batch_io import (body_format, decode_features, encode_result, encode_arrow_result, UnsupportedFormat,
+                                BINARY, ARROW)
+from ML.models.history import score_user_history, invalidate_history_cache
+from ingestion.jobs import IngestionJobs
+from database.observation_queries import fetch_observations_page, stream_observations
+from database.encrypted_blobs import (create_blob, get_pending_blob, append_to_blob, complete_blob, seq_from_cursor,
+                                      stream_blobs_json, stream_blob_bytes, BlobConflict, BlobTooLarge)
+from streaming import json_array, ndjson_lines, encode_cursor
+from user_cache import UserContextCache
+from token_revocation import TokenRevocationStore, token_id
+from registration_index import RegistrationIndex
+from fanout import WebSocketFanout
+from presence import PresenceTracker
+from schemas.user import UserSnapshot
+from metrics import metrics
+from config import PREDICTION_BATCHING_ENABLED, PREDICTION_BATCH_MAX_SIZE, PREDICTION_BATCH_MAX_WAIT_MS
+from config import PREDICTION_BATCH_MAX_BYTES, PREDICTION_BATCH_CHUNK_ROWS, PREDICTION_CACHE_ENABLED
+from executors import inference_pool, password_pool, fl_pool, PoolSaturated
+from functools import partial
 from fastapi.responses import FileResponse
 import os
 import websockets
 import aiofiles
-from typing import Set, List, Dict
+from typing import Set, List, Dict, Optional
 import pandas as pd
+import numpy as np
 import base64
 from redis.asyncio import Redis
-from io import StringIO
 from dotenv import load_dotenv
 import asyncio
-from FL_scripts.aggregator import create_global_checkpoint
-import random
+from FL_scripts.orchestrator import RoundOrchestrator, RoundNotCollecting
+from FL_scripts.aggregation import BINARY_UPDATE_EXTENSION
+from FL_scripts.update_format import is_binary_update, decode_header, decode_update
+from FL_scripts.deltas import checkpoint_deltas, DeltaUnavailable, COMPRESSION_AVAILABLE
+from artifact_store import artifact_store, artifact_response
 
 # Load environment variables from .env file
 load_dotenv()
@@ -59,6 +88,39 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 redis_client = None
 
+# One micro-batcher per model, started in lifespan
+prediction_batchers: Dict[str, MicroBatcher] = {}
+
+# Cached prediction results per feature row, created in lifespan unless disabled
+prediction_cache: Optional[PredictionCache] = None
+
+# CSV ingestion queue, created in lifespan once Redis is connected
+ingestion_jobs: IngestionJobs = None
+
+# Cached user snapshots for authenticated requests, created in lifespan once Redis is connected
+user_cache: UserContextCache = None
+
+# Revoked JWTs, created in lifespan once Redis is connected
+token_revocations: TokenRevocationStore = None
+
+# Username/email uniqueness checks, created in lifespan once Redis is connected
+registration_index: RegistrationIndex = None
+
+# Federated round state machine, created in lifespan once Redis is connected
+fl_rounds: RoundOrchestrator = None
+
+# Websocket connections of this worker and the cross-worker fan-out, created in lifespan
+websocket_fanout: WebSocketFanout = None
+
+# Online users with expiring sessions, created in lifespan
+presence: PresenceTracker = None
+
+# Keys that only describe the state of the running application and are reset on shutdown.
+# Ingestion jobs, the registration index and presence sessions (they expire by themselves) are deliberately
+# not in here so they survive restarts. "online_users" is the set presence tracking replaced. The websocket
+# routing sets and the current FL round are shared by all workers, so one worker stopping must not reset them.
+EPHEMERAL_REDIS_KEYS = ["online_users"]
+
 
 
 
@@ -71,21 +133,51 @@ app = FastAPI()
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("Application starting...")
-    global redis_client
+    global redis_client, ingestion_jobs, user_cache, token_revocations, registration_index, fl_rounds, websocket_fanout, presence, prediction_cache
     redis_client = await Redis.from_url("redis://localhost", encoding="utf-8", decode_responses=True)
-    async with SessionLocal() as db:
-        # Using select to get usernames and emails
-        result = await db.execute(select(User.username, User.email))
-        users = result.all()
-
-        for username, email in users:
-            await redis_client.sadd("registered_usernames", username)
-            await redis_client.sadd("registered_emails", email)
-    await redis_client.set('global_FL_round', str(get_latest_round()))
-    asyncio.create_task(listen_for_messages())
+    # Picks up users registered since the last run in the background, a cold index falls back to the database
+    registration_index = RegistrationIndex(redis_client)
+    registration_index.start()
+    # Only seeds the round when no other worker has, a restarting worker joins the round in progress
+    fl_rounds = RoundOrchestrator(redis_client)
+    await fl_rounds.init_round(get_latest_round())
+    # Load every model and scaler once, requests share the loaded instances
+    model_registry.load_all()
+    inference_pool.start()
+    password_pool.start()
+    fl_pool.start()
+    if PREDICTION_BATCHING_ENABLED:
+        for model_name in BATCHED_MODELS:
+            batcher = MicroBatcher(model_name, partial(predict_rows, model_name),
+                                   max_batch_size=PREDICTION_BATCH_MAX_SIZE, max_wait_ms=PREDICTION_BATCH_MAX_WAIT_MS,
+                                   executor=inference_pool)
+            batcher.start()
+            prediction_batchers[model_name] = batcher
+    user_cache = UserContextCache(redis_client)
+    if PREDICTION_CACHE_ENABLED:
+        prediction_cache = PredictionCache(redis_client)
+    token_revocations = TokenRevocationStore(redis_client, timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    await token_revocations.start()
+    ingestion_jobs = IngestionJobs(redis_client)
+    await ingestion_jobs.start()
+    websocket_fanout = WebSocketFanout(redis_client)
+    await websocket_fanout.start()
+    presence = PresenceTracker(redis_client)
+    await presence.start()
     #scheduler.start()
     yield
-    await redis_client.flushall()
+    await presence.stop()
+    await websocket_fanout.stop()
+    await ingestion_jobs.stop()
+    await token_revocations.stop()
+    await registration_index.stop()
+    await fl_rounds.stop()
+    for batcher in prediction_batchers.values():
+        await batcher.stop()
+    inference_pool.shutdown()
+    password_pool.shutdown()
+    fl_pool.shutdown()
+    await redis_client.delete(*EPHEMERAL_REDIS_KEYS)
     #scheduler.shutdown()
     print("Application shutting down...")
 
@@ -106,6 +198,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow methods from any origin (change as needed) e.g. GET,POST,PUT etc
     allow_headers=["*"],  # Allow headers from any origin (change as needed) e.g. Content-Type: application/x-www-form-urlencoded
+    expose_headers=["X-Next-Cursor"],  # Response headers the browser is allowed to read
 )
 
 
@@ -116,6 +209,14 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 logging.disable(logging.INFO)
 
 
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    logger.warning(f"{exc}, rejecting {request.url.path}")
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        content={"detail": "Server is busy, please retry later"},
+                        headers={"Retry-After": "1"})
+
+
 
 
 # Dependency to get the async database session
@@ -128,24 +229,19 @@ async def get_db():
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+# Function to hash password
+def hash_password(plain_password):
+    return pwd_context.hash(plain_password)
+
 # Function to create access token
 def create_access_token(data: dict):
     to_encode = data.copy()
+    # Unique id used to revoke this token
+    to_encode.setdefault("jti", uuid.uuid4().hex)
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username: str = payload.get("sub")
-        if username is None:
-            raise HTTPException(status_code=401, detail="Could not validate credentials")
-        return username
-    except jwt.PyJWTError:
-        raise HTTPException(status_code=401, detail="Could not validate credentials")
-
-
 async def get_current_user_role(token: str = Depends(oauth2_scheme)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -159,19 +255,59 @@ async def get_current_user_role(token: str = Depends(oauth2_scheme)):
 
 
 
-async def check_token_in_blacklist(token: str) -> bool:
-    # Check if the token exists in the "blacklisted_tokens" hash in Redis
-    exists = await redis_client.hexists("blacklisted_tokens", token)
-    return bool(exists)
+def decode_token(token: str) -> dict:
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except jwt.PyJWTError:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
 
-async def verify_token_not_blacklisted(request: Request, token: str = Depends(oauth2_scheme)) -> None:
-    if await check_token_in_blacklist(token):
+
+async def check_token_in_blacklist(token: str, payload: dict) -> bool:
+    # Check the token's jti against the revocation store (usually answered by the in-process filter)
+    return await token_revocations.is_revoked(token_id(token, payload))
+
+# Request or WebSocket, only the client address is used
+async def verify_token_not_blacklisted(request: HTTPConnection, token: str = Depends(oauth2_scheme)) -> dict:
+    payload = decode_token(token)
+    if await check_token_in_blacklist(token, payload):
         logger.critical(f"The following IP Address: {request.client.host} tried to access an endpoint using this blacklisted token: {token}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token is blacklisted",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    return payload
+
+
+async def revoke_token(token: str, payload: dict) -> None:
+    expires_at = datetime.fromtimestamp(payload["exp"], timezone.utc)
+    await token_revocations.revoke(token_id(token, payload), expires_at)
+
+
+class AuthContext:
+    """The caller of an authenticated endpoint: the raw token, its decoded claims and a cached user snapshot."""
+
+    def __init__(self, token: str, payload: dict, user: UserSnapshot):
+        self.token = token
+        self.payload = payload
+        self.user = user
+
+    @property
+    def username(self) -> str:
+        return self.user.username
+
+
+# Dependency for authenticated endpoints: one revocation check, one JWT decode and a cached user lookup
+async def get_user_context(request: HTTPConnection, token: str = Depends(oauth2_scheme)) -> AuthContext:
+    payload = await verify_token_not_blacklisted(request, token)
+    username = payload.get("sub")
+    if username is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+
+    user = await user_cache.get(username)
+    if user is None:
+        raise HTTPException(status_code=401, detail="Could not validate credentials")
+    return AuthContext(token, payload, user)
 
 
 
@@ -179,21 +315,25 @@ async def verify_token_not_blacklisted(request: Request, token: str = Depends(oa
 @app.post("/register", tags=["General Post Methods"])
 async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     # Check if username already exists
-    if await redis_client.sismember("registered_usernames", user.username):
+    if await registration_index.is_taken("username", user.username):
         raise HTTPException(status_code=400, detail="Username is already in use")
 
     # Check if email already exists
-    if await redis_client.sismember("registered_emails", user.email):
+    if await registration_index.is_taken("email", user.email):
         raise HTTPException(status_code=400, detail="Email is already in use")
 
     # If username and email are unique, proceed to create the user
-    hashed_password = pwd_context.hash(user.password)
+    hashed_password = await password_pool.run(hash_password, user.password)
     salt = base64.urlsafe_b64encode(os.urandom(32)).decode('utf-8')
     db_user = User(username=user.username, password=hashed_password, email=user.email, role="user", access_type="free", salt=salt)
     db.add(db_user)
-    await db.commit()
-    await redis_client.sadd("registered_usernames", user.username)
-    await redis_client.sadd("registered_emails", user.email)
+    try:
+        await db.commit()
+    except IntegrityError:
+        # A concurrent registration won the race, the unique constraints are the final word
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Username or email is already in use")
+    await registration_index.add(user.username, user.email)
     return {"Message": f"User {user.username} successfully registered"}
 
 # Endpoint to login and generate JWT token
@@ -201,7 +341,7 @@ async def register_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
 async def login_access_token(request: Request, form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_db), ):
 
     # Check if the user is already online
-    if await redis_client.sismember("online_users", form_data.username):
+    if await presence.is_online(form_data.username):
         raise HTTPException(status_code=400, detail="User already online")
 
     # Query database to find user by username
@@ -209,18 +349,18 @@ async def login_access_token(request: Request, form_data: OAuth2PasswordRequestF
     user = db_user.scalar()
 
     # Verify user exists and password matches
-    if not user or not verify_password(form_data.password, user.password):
+    if not user or not await password_pool.run(verify_password, form_data.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect username or password")
 
 
-    # Add user to online users
-    await redis_client.sadd("online_users", form_data.username)
-
-
+    # Add user to online users, a concurrent login may have claimed the session since the check above
+    session_id = uuid.uuid4().hex
+    if not await presence.claim(user.username, session_id):
+        raise HTTPException(status_code=400, detail="User already online")
 
     # Create JWT token with user's data
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token({"sub": user.username, "role": user.role, "exp": datetime.now(timezone.utc) + access_token_expires})
+    access_token = create_access_token({"sub": user.username, "role": user.role, "sid": session_id, "exp": datetime.now(timezone.utc) + access_token_expires})
     logger.info(f"User {user.username} logged in at {datetime.now()} from the IP {request.client.host}")
     return {"access_token": access_token, "token_type": "bearer"}
 
@@ -231,101 +371,22 @@ async def logout_user(token: str = Depends(oauth2_scheme)):
     if token is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="No token provided")
 
-    # Insert blacklisted token to list
-    await redis_client.hset("blacklisted_tokens", token, datetime.now(timezone.utc).isoformat())
+    # Revoke the token for the rest of its lifetime
+    payload = decode_token(token)
+    await revoke_token(token, payload)
 
-    # Remove the user from the current_online_users table
-    current_user_username = await get_current_user(token)
-    await redis_client.srem("online_users", current_user_username)
+    # End the user's presence session
+    current_user_username = payload.get("sub")
+    await presence.release(current_user_username, payload.get("sid"))
 
     logger.info(f"User {current_user_username} logged out.")
     return {"Message": "Logout Successful"}
 
 
-
-
-async def get_max_observation_id(db: AsyncSession, user_id: int) -> int:
-    result = await db.execute(
-        select(func.max(UserObservation.observation_id)).where(UserObservation.user_id == user_id)
-    )
-    max_observation_id = result.scalar() or 0  # If no records found, start from 0
-    return max_observation_id
-
-
-
-async def get_user_id_by_username(username: str, db: AsyncSession) -> int:
-    query = select(User.id).filter(User.username == username)
-    result = await db.execute(query)
-    user_id = result.scalar_one_or_none()
-
-    if user_id is None:
-        raise ValueError(f"User with username '{username}' not found")
-
-    return user_id
-
-
-async def get_user_id_and_max_observation_id(username: str, db: AsyncSession):
-    query = (
-        select(User.id, func.coalesce(func.max(UserObservation.observation_id), 0))
-        .join(UserObservation, User.id == UserObservation.user_id, isouter=True)
-        .where(User.username == username)
-        .group_by(User.id)
-    )
-    result = await db.execute(query)
-    user_id, max_observation_id = result.one()
-    return user_id, max_observation_id
-
-
-async def insert_observations_chunk(chunk, current_user_username: str, db: AsyncSession):
-    if chunk.empty:
-        return
-
-    user_id, max_observation_id = await get_user_id_and_max_observation_id(current_user_username, db)
-    current_observation_id = max_observation_id + 1
-
-    observations = []
-    for index, row in chunk.iterrows():
-        date_str = row['date']
-        date_obj = datetime.fromisoformat(date_str)
-
-        observation = UserObservation(
-            user_id=user_id,
-            observation_id=current_observation_id,
-            feature1=row['feature1'],
-            feature2=row['feature2'],
-            feature3=row['feature3'],
-            feature4=row['feature4'],
-            date=date_obj
-        )
-        observations.append(observation)
-        current_observation_id += 1
-
-    try:
-        db.add_all(observations)
-        await db.commit()
-    except Exception as e:
-        await db.rollback()
-        raise HTTPException(status_code=500, detail=f"Error inserting observations: {str(e)}")
-
-
-async def process_csv(file_path: str, current_user_username: str, db: AsyncSession, chunk_size: int = 10000):
-    try:
-        async with aiofiles.open(file_path, mode='r') as f:
-            content = await f.read()  # Read the entire content
-            # Use StringIO to convert the string into a file-like object for pandas
-            reader = pd.read_csv(StringIO(content), chunksize=chunk_size)
-            for chunk in reader:
-                await insert_observations_chunk(chunk, current_user_username, db)
-    except Exception as e:
-        logger.error(f"Error processing CSV: {e}")
-    finally:
-        os.remove(file_path)
-
-
 async def save_file(upload_file: UploadFile, destination: Path):
     try:
         async with aiofiles.open(destination, 'wb') as out_file:
-            while content := await upload_file.read(1024):
+            while content := await upload_file.read(1024 * 1024):
                 await out_file.write(content)
     except Exception as e:
         logger.error(f"Error saving file {upload_file.filename}: {str(e)}")
@@ -340,14 +401,10 @@ async def save_file(upload_file: UploadFile, destination: Path):
 @app.post("/upload", tags=["Upload Methods"])
 async def upload_file_route(
         request: Request,
-        background_tasks: BackgroundTasks,
         files: list[UploadFile] = File(...),
-        token: str = Depends(oauth2_scheme),
-        db: AsyncSession = Depends(get_db)
-
+        context: AuthContext = Depends(get_user_context)
 ):
-    await verify_token_not_blacklisted(request, token)
-    current_user_username = await get_current_user(token)
+    current_user_username = context.username
 
     allowed_extensions = {'.zip', '.csv'}
     user_folder = Path(f"uploads/{current_user_username}")
@@ -355,6 +412,7 @@ async def upload_file_route(
 
     # List to keep track of processed files
     uploaded_files_info = []
+    jobs = []
 
     for file in files:
         file_extension = Path(file.filename).suffix.lower()
@@ -365,9 +423,10 @@ async def upload_file_route(
         await save_file(file, file_location)
 
         if file_extension == ".csv":
-            background_tasks.add_task(process_csv, str(file_location), current_user_username, db)
+            job_id = await ingestion_jobs.enqueue(str(file_location), current_user_username)
+            jobs.append({"file": file.filename, "job_id": job_id})
             logger.info(
-                f"{current_user_username} successfully uploaded and started processing the file {file.filename}")
+                f"{current_user_username} successfully uploaded the file {file.filename}, ingestion job {job_id} queued")
             uploaded_files_info.append(f"file '{file.filename}' saved at '{file_location}' and processing started")
         elif file_extension == ".zip":
             logger.info(
@@ -375,88 +434,197 @@ async def upload_file_route(
             uploaded_files_info.append(f"file '{file.filename}' saved at '{file_location}'")
 
     return {"message": "Data was successfully inserted and/or files were successfully uploaded",
-            "files": uploaded_files_info}
+            "files": uploaded_files_info,
+            "jobs": jobs}
+
+
+# Status of a CSV ingestion job started by /upload
+@app.get("/upload/jobs/{job_id}", tags=["Upload Methods"])
+async def get_upload_job(job_id: str, context: AuthContext = Depends(get_user_context)):
+    current_user_username = context.username
+
+    job = await ingestion_jobs.get(job_id)
+    # Jobs of other users are reported as missing rather than forbidden
+    if job is None or job["username"] != current_user_username:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job.pop("file_path", None)
+    return job
 
 
 # Prediction endpoint, with model parameter
 @app.post("/make_prediction/{model}", tags=["Predict Post Methods"])
-async def make_prediction(request: Request, predictionrequest: PredictionRequest, model: str, token: str = Depends(oauth2_scheme)):
+async def make_prediction(request: Request, predictionrequest: PredictionRequest, model: str, format: str = "rows", token: str = Depends(oauth2_scheme)):
     await verify_token_not_blacklisted(request, token)
-    return execute_model(model, predictionrequest)
+    # format=columnar returns parallel label/probability arrays instead of one dict per row
+    columnar = format == "columnar"
+    batcher = prediction_batchers.get(model)
 
+    async def score(rows):
+        if batcher is None:
+            return await inference_pool.run(predict_rows, model, rows)
+        # Concurrent requests for the same model are scored together in one batched call
+        return await batcher.submit(rows)
 
-# Endpoint to check token validity
-@app.post("/verifyToken")
-async def verify_token(request: Request, token: str = Depends(oauth2_scheme)):
-    # Verify the token is not blacklisted
+    # Rows of the wrong width (or an unknown model) are the client's mistake, answered with 400 like /batch
+    try:
+        if model not in BATCHED_MODELS or (batcher is None and prediction_cache is None):
+            return await inference_pool.run(execute_model, model, predictionrequest, columnar)
+        if prediction_cache is None:
+            labels, probabilities = await score(predictionrequest.features)
+        else:
+            # Rows scored before (e.g. the same observations re-posted on every app start) come from the cache
+            labels, probabilities = await prediction_cache.predict(model, predictionrequest.features, score)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return build_response(model, labels, probabilities, columnar=columnar)
+
+
+@app.post("/make_prediction/{model}/batch", tags=["Predict Post Methods"])
+async def make_batch_prediction(request: Request, model: str, token: str = Depends(oauth2_scheme)):
+    """
+    Score an N x 4 feature matrix, answered in the format of the request body (see ML/models/batch_io.py).
+
+    - application/json: {"features": [[...], ...]}, answered with the columnar JSON of /make_prediction
+    - application/octet-stream: raw float32 matrix with a shape header, answered with raw float32/int8 columns
+    - application/vnd.apache.arrow.stream: columns feature1..feature4, answered with label/probability_1 columns
+    """
     await verify_token_not_blacklisted(request, token)
+    if model not in BATCHED_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'")
+    try:
+        media_type = body_format(request.headers.get("content-type"))
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE, detail=str(e))
 
-    # Get the current user from the token
-    current_user = await get_current_user(token)  # Ensure get_current_user is async
+    body = await read_body_limited(request, PREDICTION_BATCH_MAX_BYTES)
+    try:
+        features = decode_features(body, media_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Large matrices are scored in slices so one request never holds an inference worker for long
+    results = []
+    for start in range(0, features.shape[0], PREDICTION_BATCH_CHUNK_ROWS):
+        try:
+            results.append(await inference_pool.run(predict_rows, model,
+                                                    features[start:start + PREDICTION_BATCH_CHUNK_ROWS]))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    labels = np.concatenate([chunk_labels for chunk_labels, _ in results])
+    probabilities = None if results[0][1] is None else np.concatenate([chunk for _, chunk in results])
+    metrics.inc("batch_prediction_rows_total", int(labels.size), model=model, format=media_type)
+
+    if media_type == BINARY:
+        return Response(content=encode_result(labels, probabilities), media_type=BINARY)
+    if media_type == ARROW:
+        return Response(content=encode_arrow_result(labels, probabilities), media_type=ARROW)
+    return build_response(model, labels, probabilities, columnar=True)
+
+
+async def read_body_limited(request: Request, max_bytes: int) -> bytearray:
+    """The request body, refused with 413 as soon as it passes `max_bytes`, also for chunked bodies without Content-Length."""
+    too_large = HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                              detail=f"Bodies are limited to {max_bytes} bytes")
+    if int(request.headers.get("content-length") or 0) > max_bytes:
+        raise too_large
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > max_bytes:
+            raise too_large
+    return body
+
+
+# Score every stored observation of the current user, results are streamed back as NDJSON
+@app.post("/predict-user-history/{model}", tags=["Predict Post Methods"])
+async def predict_user_history(model: str, context: AuthContext = Depends(get_user_context)):
+    if model not in BATCHED_MODELS:
+        raise HTTPException(status_code=400, detail=f"Unknown model '{model}'")
+    return StreamingResponse(score_user_history(context.user.id, model, redis_client), media_type="application/x-ndjson")
+
+
+@app.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
 
-    if not current_user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token is not valid")
+
+# Endpoint to check token validity
+@app.post("/verifyToken")
+async def verify_token(context: AuthContext = Depends(get_user_context)):
+    # Clients verify their token periodically, which keeps them online
+    await presence.touch(context.username, context.payload.get("sid"))
 
     return {"Message": "Token is valid"}
 
 
-@app.post("/download-onnx-file")
+# Serve the current version of an artifact: strong ETag (304 on If-None-Match), Range and gzip/zstd variants
+async def serve_artifact(request: Request, name: str, filename: str):
+    artifact = await artifact_store.get(name)
+    if artifact is None:
+        return {"error": "File not found"}
+    return artifact_response(request, artifact, filename=filename)
+
+
+@app.get("/artifacts/manifest")
+async def get_artifact_manifest(request: Request, token: str = Depends(oauth2_scheme)):
+    # Current SHA-256 of every downloadable artifact, clients fetch only the ones whose hash changed
+    await verify_token_not_blacklisted(request, token)
+    return await artifact_store.manifest()
+
+
+@app.get("/artifacts/{sha256}")
+async def get_artifact_by_hash(sha256: str, request: Request, token: str = Depends(oauth2_scheme)):
+    await verify_token_not_blacklisted(request, token)
+    artifact = artifact_store.find_object(sha256)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    return artifact_response(request, artifact, filename=sha256, immutable=True)
+
+
+@app.api_route("/download-onnx-file", methods=["GET", "POST"])
 async def download_onnx_file(request: Request, token: str = Depends(oauth2_scheme)):
     # Verify the token is not blacklisted
     await verify_token_not_blacklisted(request, token)
 
-    file_path = "ML/model.onnx"
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename="model.onnx", media_type='application/octet-stream')
-    else:
-        return {"error": "File not found"}
+    return await serve_artifact(request, "model.onnx", filename="model.onnx")
 
 
 @app.post("/upload-onnx-file")
-async def upload_onnx_file(request: Request, token: str = Depends(oauth2_scheme), file: UploadFile = File(...)):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
+async def upload_onnx_file(request: Request, context: AuthContext = Depends(get_user_context), file: UploadFile = File(...)):
     upload_folder = Path("uploads/")
     upload_folder.mkdir(parents=True, exist_ok=True)
     file_path = upload_folder / file.filename
     with open(file_path, "wb") as f:
         shutil.copyfileobj(file.file, f)
-    current_user = await get_current_user(token)
 
-    logger.info(f"User '{current_user}' successfully uploaded the file '{file.filename}' to '/uploads'. User IP Address: {request.client.host}. User Token: '{token}'")
+    logger.info(f"User '{context.username}' successfully uploaded the file '{file.filename}' to '/uploads'. User IP Address: {request.client.host}. User Token: '{context.token}'")
 
     return {"Message": "The .onnx file was successfully uploaded"}
 
 
 @app.post("/refreshToken")
-async def refresh_token(request: Request, token: str = Depends(oauth2_scheme)):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-
-    # Insert blacklisted token to list
-    await redis_client.hset("blacklisted_tokens", token, datetime.now(timezone.utc).isoformat())
+async def refresh_token(context: AuthContext = Depends(get_user_context)):
+    # Revoke the old token for the rest of its lifetime
+    await revoke_token(context.token, context.payload)
+    current_username = context.username
 
-    # Extract current user data from the token
-    current_username = await get_current_user(token)
+    # The new token continues the same presence session
+    session_id = context.payload.get("sid")
+    await presence.touch(current_username, session_id)
 
     # Create JWT token with user's data
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        {"sub": current_username, "role": "user", "exp": datetime.now(timezone.utc) + access_token_expires})
+    claims = {"sub": current_username, "role": "user", "exp": datetime.now(timezone.utc) + access_token_expires}
+    if session_id:
+        claims["sid"] = session_id
+    access_token = create_access_token(claims)
     logger.info(f"User {current_username} refreshed JWT Token")
     return {"access_token": access_token, "token_type": "bearer"}
 
 
 @app.post("/get_user_data")
-async def get_user_data(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db) ):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-    username = await get_current_user(token)
-
-    result = await db.execute(select(User).filter(User.username == username))
-    user = result.scalar_one_or_none()
-    if not user:
-        raise HTTPException(status_code=404, detail="User was not found")
+async def get_user_data(context: AuthContext = Depends(get_user_context)):
+    user = context.user
 
     return UserDataResponse(
         username=user.username,
@@ -468,12 +636,9 @@ async def get_user_data(request: Request, token: str = Depends(oauth2_scheme), d
 
 
 @app.post("/update_user_preferences/{preference_type}/{boolean_preference}")
-async def update_user_preferences(preference_type: str, boolean_preference: bool, request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db) ):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-    username = await get_current_user(token)
-    # Fetch user from database based on username
-    result = await db.execute(select(User).filter(User.username == username))
+async def update_user_preferences(preference_type: str, boolean_preference: bool, context: AuthContext = Depends(get_user_context), db: AsyncSession = Depends(get_db) ):
+    # Fetch user from database based on id
+    result = await db.execute(select(User).filter(User.id == context.user.id))
     user = result.scalar_one_or_none()
 
     if not user:
@@ -488,46 +653,59 @@ async def update_user_preferences(preference_type: str, boolean_preference: bool
 
     # Commit changes to database
     await db.commit()
+    await user_cache.invalidate(context.username)
 
     return {"message": f"{preference_type.capitalize()} preference updated successfully."}
 
 
 
 @app.post("/update_user_info")
-async def update_user_info(update_request: UpdateUserRequest, request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db) ):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-    current_username = await get_current_user(token)
-    # Fetch user from database based on username
-    result = await db.execute(select(User).filter(User.username == current_username))
+async def update_user_info(update_request: UpdateUserRequest, context: AuthContext = Depends(get_user_context), db: AsyncSession = Depends(get_db) ):
+    # Fetch user from database based on id, the password hash is not part of the cached snapshot
+    result = await db.execute(select(User).filter(User.id == context.user.id))
     user = result.scalar_one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    if not user or not pwd_context.verify(update_request.current_password, user.password):
+    if not user or not await password_pool.run(verify_password, update_request.current_password, user.password):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Current password is incorrect")
 
-    if update_request.new_email:
+    old_email = user.email
+    if update_request.new_email and update_request.new_email != old_email:
+        if await registration_index.is_taken("email", update_request.new_email):
+            raise HTTPException(status_code=400, detail="Email is already in use")
         user.email = update_request.new_email
 
     if update_request.new_password:
-        user.password = pwd_context.hash(update_request.new_password)
+        user.password = await password_pool.run(hash_password, update_request.new_password)
 
-    await db.commit()
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Email is already in use")
+    if user.email != old_email:
+        await registration_index.replace_email(old_email, user.email)
+    await user_cache.invalidate(context.username)
     return {"detail": "User updated successfully"}
 
 
 
 @app.post("/get_user_preference/{preference}")
-async def get_user_preference(request: Request, preference: str, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db) ):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-    current_username = await get_current_user(token)
+async def get_user_preference(preference: str, context: AuthContext = Depends(get_user_context), db: AsyncSession = Depends(get_db) ):
+    current_username = context.username
     # Ensure the preference is a valid column in the User model
     if not hasattr(User, preference):
         raise HTTPException(status_code=400, detail="Invalid preference name")
 
+    # Preferences held in the cached snapshot need no database round trip
+    if preference in ("federated_learning", "sharing4good", "access_type", "role"):
+        preference_value = getattr(context.user, preference)
+        if preference_value is None:
+            raise HTTPException(status_code=404, detail="Preference not found")
+        return {preference: preference_value}
+
     # Dynamically select the column based on the preference name
     preference_column = getattr(User, preference)
 
@@ -545,52 +723,48 @@ async def get_user_preference(request: Request, preference: str, token: str = De
 
 
 @app.post("/retrieve-data-per-user")
-async def retrieve_data_per_user(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db) ) -> List[Dict]:
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-    # Get the current user's username from the token
-    current_username = await get_current_user(token)
-
-    # Get the user's ID from the username
-    user_id = await get_user_id_by_username(current_username, db)
-
-    # Query the database for observations by user_id
-    result = await db.execute(select(UserObservation).where(UserObservation.user_id == user_id))
-    user_observations = result.scalars().all()
-
-    # Convert the result to a list of dictionaries with specified fields
-    observations_list = [
-        {
-            'feature1': observation.feature1,
-            'feature2': observation.feature2,
-            'feature3': observation.feature3,
-            'feature4': observation.feature4,
-            'date': observation.date
-        }
-        for observation in user_observations
-    ]
+async def retrieve_data_per_user(
+        request: Request,
+        limit: Optional[int] = Query(None, ge=1, le=10000),
+        cursor: Optional[str] = None,
+        start_date: Optional[datetime] = None,
+        end_date: Optional[datetime] = None,
+        format: str = "json",
+        context: AuthContext = Depends(get_user_context),
+        db: AsyncSession = Depends(get_db)
+):
+    user_id = context.user.id
 
-    # Sort the list by date before returning
-    sorted_observations_list = sorted(observations_list, key=lambda x: x['date'])
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
 
-    return sorted_observations_list
+    # Paginated: one page ordered by date, the cursor of the next page is returned in the X-Next-Cursor header
+    if limit is not None:
+        try:
+            observations, next_cursor = await fetch_observations_page(db, user_id, limit, cursor, start_date, end_date)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+        if format == "ndjson":
+            body = "".join(json.dumps(observation) + "\n" for observation in observations)
+        else:
+            body = json.dumps(observations)
+        return Response(content=body, media_type=media_type, headers=headers)
+
+    # Whole history, sorted by the database and streamed without building the list in memory
+    batches = stream_observations(user_id, start_date, end_date)
+    body = ndjson_lines(batches) if format == "ndjson" else json_array(batches)
+    return StreamingResponse(body, media_type=media_type)
 
 
 @app.post("/delete_user_files")
-async def delete_user_files(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-
-    # Get the current user's username from the token
-    current_username = await get_current_user(token)
-
-    # Get the user's ID from the username
-    user_id = await get_user_id_by_username(current_username, db)
+async def delete_user_files(context: AuthContext = Depends(get_user_context), db: AsyncSession = Depends(get_db)):
+    user_id = context.user.id
 
     # Delete entries from Observations table based on user_id
     try:
         await db.execute(UserObservation.__table__.delete().where(UserObservation.user_id == user_id))
         await db.commit()
+        await invalidate_history_cache(redis_client, user_id)
         return {"message": "User files deleted successfully"}
     except Exception as e:
         return {"error": f"Failed to delete user files: {str(e)}"}
@@ -601,139 +775,243 @@ async def delete_user_files(request: Request, token: str = Depends(oauth2_scheme
 @app.post("/upload-encrypted-data", tags=["Encryption Methods"])
 async def upload_encrypted_data(
     data: EncryptedData,
-    request: Request,
-    token: str = Depends(oauth2_scheme),
+    context: AuthContext = Depends(get_user_context),
     db: AsyncSession = Depends(get_db)
 ):
-    await verify_token_not_blacklisted(request, token)
-    current_user_username = await get_current_user(token)
-    current_user_id = await get_user_id_by_username(current_user_username, db)
+    current_user_id = context.user.id
 
+    # Create a new record with the encrypted data, visible to downloads once it has its seq
+    blob = await create_blob(db, current_user_id, data.iv, encrypted_data=data.encryptedData)
+    await complete_blob(db, current_user_id, blob.id)
 
-    # Create a new record with the encrypted data
-    new_record = UserObservationsEncrypted(
-        user_id=current_user_id,
-        encrypted_data=data.encryptedData,
-        iv=data.iv
-    )
+    return {"message": "Encrypted Data uploaded successfully"}
 
-    # Add to the database session
-    db.add(new_record)
 
-    # Commit the transaction
-    await db.commit()
 
-    return {"message": "Encrypted Data uploaded successfully"}
+@app.get("/download-encrypted-data", tags=["Encryption Methods"])
+async def download_encrypted_data(context: AuthContext = Depends(get_user_context)):
+    current_user_id = context.user.id
 
+    # The same [{"iv", "encryptedData"}] array as before, streamed blob by blob in upload order
+    return StreamingResponse(stream_blobs_json(current_user_id, array=True), media_type="application/json")
 
 
-@app.get("/download-encrypted-data", tags=["Encryption Methods"])
-async def download_encrypted_data(request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
-    await verify_token_not_blacklisted(request, token)
-    current_user_username = await get_current_user(token)
-    current_user_id = await get_user_id_by_username(current_user_username, db)
+@app.post("/encrypted-blobs", tags=["Encryption Methods"])
+async def upload_encrypted_blob(
+    request: Request,
+    iv: str,
+    complete: bool = True,
+    context: AuthContext = Depends(get_user_context),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Store a ciphertext sent as the raw request body (application/octet-stream, no base64).
+
+    With complete=false the blob stays pending and more data is appended through
+    /encrypted-blobs/{blob_id}/append before /encrypted-blobs/{blob_id}/complete makes it visible.
+    """
+    # The row is committed together with the body, a 413 or a broken upload rolls both back
+    blob = await create_blob(db, context.user.id, iv, commit=False)
+    size = await append_encrypted_blob_body(request, db, blob)
+    if not complete:
+        return {"id": blob.id, "size": size}
+    seq = await complete_blob(db, context.user.id, blob.id)
+    return {"id": blob.id, "size": size, "seq": seq, "cursor": encode_cursor(seq)}
+
+
+@app.post("/encrypted-blobs/{blob_id}/append", tags=["Encryption Methods"])
+async def append_encrypted_blob(
+    request: Request,
+    blob_id: int = PathParam(..., ge=1, lt=2 ** 31),
+    offset: Optional[int] = None,
+    context: AuthContext = Depends(get_user_context),
+    db: AsyncSession = Depends(get_db)
+):
+    # offset is the size the client believes the blob has, a retried append is refused instead of duplicated
+    blob = await get_pending_blob(db, context.user.id, blob_id)
+    if blob is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return {"id": blob_id, "size": await append_encrypted_blob_body(request, db, blob, offset)}
+
+
+@app.post("/encrypted-blobs/{blob_id}/complete", tags=["Encryption Methods"])
+async def complete_encrypted_blob(blob_id: int = PathParam(..., ge=1, lt=2 ** 31),
+                                  context: AuthContext = Depends(get_user_context),
+                                  db: AsyncSession = Depends(get_db)):
+    try:
+        seq = await complete_blob(db, context.user.id, blob_id)
+    except BlobConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"id": blob_id, "seq": seq, "cursor": encode_cursor(seq)}
+
 
-    # Query encrypted data for the current user
-    query = await db.execute(
-        select(UserObservationsEncrypted.iv, UserObservationsEncrypted.encrypted_data)
-        .filter(UserObservationsEncrypted.user_id == current_user_id)
+@app.get("/encrypted-blobs", tags=["Encryption Methods"])
+async def sync_encrypted_blobs(cursor: Optional[str] = None, context: AuthContext = Depends(get_user_context)):
+    """
+    NDJSON of the blobs uploaded after `cursor`, one {"seq", "iv", "size", "cursor", "encryptedData"} per line.
+
+    A client stores the cursor of the last line it received and sends it on the next sync, so it only
+    downloads what is new; without a cursor everything is sent.
+    """
+    try:
+        after_seq = seq_from_cursor(cursor)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return StreamingResponse(stream_blobs_json(context.user.id, after_seq), media_type="application/x-ndjson")
+
+
+@app.get("/encrypted-blobs/{seq}", tags=["Encryption Methods"])
+async def download_encrypted_blob(seq: int = PathParam(..., ge=1, lt=2 ** 31),
+                                  context: AuthContext = Depends(get_user_context),
+                                  db: AsyncSession = Depends(get_db)):
+    # Raw ciphertext of a single blob, for blobs too large to take as base64 inside a JSON line
+    result = await db.execute(
+        select(UserObservationsEncrypted.size)
+        .where(UserObservationsEncrypted.user_id == context.user.id, UserObservationsEncrypted.seq == seq)
     )
+    if result.scalar_one_or_none() is None:
+        raise HTTPException(status_code=404, detail="Blob not found")
+    return StreamingResponse(stream_blob_bytes(context.user.id, seq), media_type="application/octet-stream")
 
-    # Extract iv and encrypted_data from query result
-    results = query.all()
-    encrypted_data_list = [
-        {
-            "iv": result.iv,
-            "encryptedData": result.encrypted_data
-        }
-        for result in results if result
-    ]
 
-    return encrypted_data_list
+async def append_encrypted_blob_body(request: Request, db: AsyncSession, blob, offset: Optional[int] = None) -> int:
+    try:
+        return await append_to_blob(db, blob, request.stream(), offset)
+    except BlobConflict as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
 
 
 @app.post("/verify-password-retrieve-salt")
-async def verify_password_retrieve_salt(password: PasswordRequest, request: Request, token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db) ):
-    # Verify the token is not blacklisted
-    await verify_token_not_blacklisted(request, token)
-    current_user = await get_current_user(token)
-
-    result = await db.execute(select(User).filter(User.username == current_user))
+async def verify_password_retrieve_salt(password: PasswordRequest, context: AuthContext = Depends(get_user_context), db: AsyncSession = Depends(get_db) ):
+    # The password hash is deliberately not cached, fetch it by primary key
+    result = await db.execute(select(User).filter(User.id == context.user.id))
     user = result.scalars().first()
 
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
 
     # Verify password
-    if not verify_password(password.password, user.password):
+    if not await password_pool.run(verify_password, password.password, user.password):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect password")
 
     return {"salt": user.salt}
 
 
 
-@app.post("/download-onnx-optimizer")
+@app.api_route("/download-onnx-optimizer", methods=["GET", "POST"])
 async def download_onnx_optimizer(request: Request, token: str = Depends(oauth2_scheme)):
     # Verify the token is not blacklisted
     await verify_token_not_blacklisted(request, token)
 
-    file_path = "ML/train_mlp_optimizer_model.onnx"
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename="train_mlp_optimizer_model.onnx", media_type='application/octet-stream')
-    else:
-        return {"error": "File not found"}
+    return await serve_artifact(request, "train_mlp_optimizer_model.onnx", filename="train_mlp_optimizer_model.onnx")
 
-@app.post("/download-onnx-training-model")
+
+@app.api_route("/download-onnx-training-model", methods=["GET", "POST"])
 async def download_onnx_training_model(request: Request, token: str = Depends(oauth2_scheme)):
     # Verify the token is not blacklisted
     await verify_token_not_blacklisted(request, token)
 
-    file_path = "ML/train_mlp_training_model.onnx"
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename="train_mlp_training_model.onnx", media_type='application/octet-stream')
-    else:
-        return {"error": "File not found"}
+    return await serve_artifact(request, "train_mlp_training_model.onnx", filename="train_mlp_training_model.onnx")
 
 
-@app.post("/download-onnx-training-eval-model")
+@app.api_route("/download-onnx-training-eval-model", methods=["GET", "POST"])
 async def download_onnx_training_eval_model(request: Request, token: str = Depends(oauth2_scheme)):
     # Verify the token is not blacklisted
     await verify_token_not_blacklisted(request, token)
 
-    file_path = "ML/train_mlp_eval_model.onnx"
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename="train_mlp_eval_model.onnx", media_type='application/octet-stream')
-    else:
-        return {"error": "File not found"}
-
+    return await serve_artifact(request, "train_mlp_eval_model.onnx", filename="train_mlp_eval_model.onnx")
 
 
-@app.post("/download-FL-checkpoint")
+@app.api_route("/download-FL-checkpoint", methods=["GET", "POST"])
 async def download_fl_checkpoint(request: Request, token: str = Depends(oauth2_scheme)):
     # Verify the token is not blacklisted
     await verify_token_not_blacklisted(request, token)
 
-    file_path = "FL/train_mlp_checkpoint"
-    if os.path.exists(file_path):
-        return FileResponse(path=file_path, filename="FL/train_mlp_checkpoint", media_type='application/octet-stream')
-    else:
+    artifact = await artifact_store.get("train_mlp_checkpoint")
+    if artifact is None:
         return {"error": "File not found"}
+    # Clients echo the hash in the header of binary updates so stale updates can be told apart
+    return artifact_response(request, artifact, filename="FL/train_mlp_checkpoint", headers={"X-Model-Hash": artifact.sha256[:32]})
 
 
-@app.post("/upload-json-floats")
-async def upload_json_floats(request: Request, file: UploadFile = File(...), token: str = Depends(oauth2_scheme)):
+@app.api_route("/download-FL-checkpoint-delta", methods=["GET", "POST"])
+async def download_fl_checkpoint_delta(request: Request, from_round: int = Query(...), dtype: str = "float32",
+                                       compress: bool = COMPRESSION_AVAILABLE, token: str = Depends(oauth2_scheme)):
+    """
+    Only the weight changes from the checkpoint published by `from_round` to the latest one.
+
+    The body is an update in the binary client format with the target round and the hash of the base
+    checkpoint in its header. float32 is exact up to rounding; float16/int8 are smaller but lossy, so clients applying them
+    should re-download the full checkpoint every few rounds. 204 if the client is already up to date, 404
+    if the round is too old and the full checkpoint has to be downloaded.
+    """
     await verify_token_not_blacklisted(request, token)
+
+    # The round being collected has no checkpoint yet, the latest one was published by the round before it
+    latest_round = await fl_rounds.current_round() - 1
+    if from_round == latest_round:
+        return Response(status_code=status.HTTP_204_NO_CONTENT, headers={"X-Target-Round": str(latest_round)})
+    try:
+        delta = await asyncio.to_thread(checkpoint_deltas.build, from_round, latest_round, dtype,
+                                        compress and COMPRESSION_AVAILABLE)
+    except DeltaUnavailable as e:
+        metrics.inc("fl_delta_responses_total", result="unavailable")
+        raise HTTPException(status_code=404, detail=f"{e}, download the full checkpoint")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {
+        "ETag": delta.etag(),
+        "Cache-Control": "no-cache",
+        "X-Target-Round": str(delta.to_round),
+        # Same value as X-Model-Hash of /download-FL-checkpoint once the delta is applied
+        "X-Model-Hash": delta.target_sha256[:32],
+    }
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and delta.etag() in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}:
+        metrics.inc("fl_delta_responses_total", result="not_modified")
+        return Response(status_code=304, headers=headers)
+    metrics.inc("fl_delta_responses_total", result="sent", dtype=dtype)
+    return Response(content=delta.data, media_type="application/octet-stream", headers=headers)
+
+
+@app.post("/upload-json-floats")
+async def upload_json_floats(file: UploadFile = File(...), context: AuthContext = Depends(get_user_context)):
+    current_username = context.username
+
+    # Register the upload on the current round, refused while that round is being aggregated
+    try:
+        current_round = str(await fl_rounds.begin_upload())
+    except RoundNotCollecting as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"{e}, upload again once the next round's checkpoint is published")
+
     try:
         # Read the uploaded file's content
         contents = await file.read()
 
-        # Save the file content to a local file
-        current_username = await get_current_user(token)
-        current_round = await redis_client.get('global_FL_round')
-        filename = f"round_{current_round}_{current_username}.json"
+        # Binary updates (FL_scripts/update_format.py) are validated now, JSON ones when the round is aggregated
+        extension = ".json"
+        if is_binary_update(contents):
+            try:
+                header = decode_header(contents)
+                decode_update(contents)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=f"Invalid binary update: {e}")
+            if str(header.round_number) != current_round:
+                raise HTTPException(status_code=400, detail=f"Update is for round {header.round_number}, the current round is {current_round}")
+            extension = BINARY_UPDATE_EXTENSION
+
+        filename = f"round_{current_round}_{current_username}{extension}"
         round_folder = Path(f"FL/round_{current_round}")
         round_folder.mkdir(parents=True, exist_ok=True)
 
+        # A client counts once per round, drop an earlier upload in the other format
+        for previous_extension in (".json", BINARY_UPDATE_EXTENSION):
+            if previous_extension != extension:
+                (round_folder / f"round_{current_round}_{current_username}{previous_extension}").unlink(missing_ok=True)
 
         file_location = round_folder / filename
 
@@ -746,17 +1024,30 @@ async def upload_json_floats(request: Request, file: UploadFile = File(...), tok
 
     except json.JSONDecodeError as e:
         raise HTTPException(status_code=400, detail=f"Invalid JSON format: {e}")
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"An error occurred: {e}")
+    finally:
+        await fl_rounds.end_upload(int(current_round))
 
 
-@app.post("/generate_checkpoint")
+@app.post("/generate_checkpoint", status_code=status.HTTP_202_ACCEPTED)
 async def generate_checkpoint():
-    create_global_checkpoint()
-    current_round = get_latest_round()
-    current_round = current_round + 1
-    await redis_client.set('global_FL_round', str(current_round))
-    return {"status": "triggered aggregator"}
+    # Aggregation and export run in the fl process pool, poll /generate_checkpoint/status for progress
+    try:
+        current_round = await fl_rounds.start()
+    except RoundNotCollecting as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return {"status": "triggered aggregator", "round": current_round}
+
+
+@app.get("/generate_checkpoint/status")
+async def generate_checkpoint_status(round: Optional[int] = None):
+    round_status = await fl_rounds.status(round)
+    if not round_status:
+        raise HTTPException(status_code=404, detail="Round not found")
+    return round_status
 
 
 
@@ -788,9 +1079,6 @@ async def is_user_federated_learning(username: str, db: AsyncSession = Depends(g
 
 
 
-# Dictionary to store WebSocket connections
-websockets = {}
-
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
@@ -801,76 +1089,57 @@ async def websocket_endpoint(websocket: WebSocket):
         return
 
     try:
-        user = await get_current_user(token)
+        context = await get_user_context(websocket, token)
     except HTTPException:
         await websocket.close(code=1008)  # Policy Violation
         return
+    user = context.username
+    session_id = context.payload.get("sid")
 
     client_id = f"user_{user}"
-    websockets[client_id] = websocket
-    await redis_client.sadd("connected_users", client_id)
+    await websocket_fanout.register(client_id, websocket)
 
     try:
+        last_heartbeat = time.monotonic()
         while True:
             # Receive data from WebSocket (if necessary)
             data = await websocket.receive_text()
+            # Any message (e.g. the client's ping) keeps the user online, at most a few Redis calls per TTL
+            if time.monotonic() - last_heartbeat > presence.ttl / 3:
+                last_heartbeat = time.monotonic()
+                await presence.touch(user, session_id)
 
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for client_id {client_id}")
     finally:
-        del websockets[client_id]
-        await redis_client.srem("connected_users", client_id)
+        await websocket_fanout.unregister(client_id, websocket)
         await websocket.close()
 
+@app.get("/online_users")
+async def get_online_users(request: Request, cursor: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000),
+                           token: str = Depends(oauth2_scheme)):
+    await verify_token_not_blacklisted(request, token)
+    next_cursor, users = await presence.page(cursor, limit)
+    return {"count": await presence.count(), "users": users, "next_cursor": next_cursor}
+
+
+@app.get("/online_users/count")
+async def get_online_users_count(request: Request, token: str = Depends(oauth2_scheme)):
+    await verify_token_not_blacklisted(request, token)
+    return {"count": await presence.count()}
+
+
 @app.get("/connected_users")
 async def get_connected_users():
     connected_users = await redis_client.smembers("connected_users")
     return {"connected_users": list(connected_users)}
 
 async def broadcast_message(message: str):
-    await redis_client.publish("websocket_channel", message)
+    # Routed to the workers holding the sampled clients' sockets, see fanout.py
+    return await websocket_fanout.broadcast(message)
 
 @app.post("/broadcast")
 async def broadcast_message_endpoint():
-    message = "trigger_learning_round_" + str(await redis_client.get('global_FL_round'))
+    message = "trigger_learning_round_" + str(await fl_rounds.current_round())
     await broadcast_message(message)
     return {"status": "trigger learning"}
-
-async def determine_clients_to_send(connected_users):
-    # Determine the number of clients to send the message to
-    num_clients_to_send = max(1, int(len(connected_users) * 0.5))
-
-    # Randomly select 50% of the clients
-    clients_to_send = random.sample(connected_users, num_clients_to_send)
-
-    return clients_to_send
-
-async def process_message(channel, msg, redis_client, websockets):
-    # Get the list of all connected WebSocket clients
-    connected_users = await redis_client.smembers("connected_users")
-    connected_users = list(connected_users)
-    print("Connected users list:", connected_users)
-
-    # Call the async function to determine the clients to send the message to
-    clients_to_send = await determine_clients_to_send(connected_users)
-
-    # Send message to the selected clients
-    for client_id in clients_to_send:
-        try:
-            websocket = websockets[client_id]
-            await websocket.send_text(msg)
-        except Exception as e:
-            print(f"Error sending message to a client: {e}")
-
-async def listen_for_messages():
-    pubsub = redis_client.pubsub()
-    await pubsub.subscribe("websocket_channel")
-
-    while True:
-        message = await pubsub.get_message(ignore_subscribe_messages=True)
-        if message:
-            channel = message["channel"]
-            msg = message["data"]
-            print(f"Received message on {channel}: {msg}")
-            # Call the async function to process the message
-            await process_message(channel, msg, redis_client, websockets)
\ No newline at end of file
@@ -0,0 +1,59 @@
+# metrics.py
+# Lightweight in-process metrics (counters, gauges and value summaries), exposed by the /metrics endpoint.
+
+import threading
+from typing import Dict, Tuple
+
+
+def _key(name: str, labels: dict) -> Tuple:
+    return (name,) + tuple(sorted(labels.items()))
+
+
+def _label_string(key: Tuple) -> str:
+    name, labels = key[0], key[1:]
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = {}
+        self._gauges: Dict[Tuple, float] = {}
+        self._summaries: Dict[Tuple, Dict[str, float]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = {"count": 1, "sum": value, "min": value, "max": value}
+            else:
+                summary["count"] += 1
+                summary["sum"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            summaries = {}
+            for key, summary in self._summaries.items():
+                summaries[_label_string(key)] = dict(summary, avg=summary["sum"] / summary["count"])
+            return {
+                "counters": {_label_string(k): v for k, v in self._counters.items()},
+                "gauges": {_label_string(k): v for k, v in self._gauges.items()},
+                "summaries": summaries,
+            }
+
+
+metrics = Metrics()
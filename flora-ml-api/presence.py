@@ -0,0 +1,170 @@
+# presence.py
+# Who is online: one Redis key per user session that expires unless it is refreshed by the client's activity.
+
+import asyncio
+import time
+from typing import List, Optional, Tuple
+
+from redis.exceptions import ResponseError, WatchError
+
+from config import PRESENCE_TTL, PRESENCE_SWEEP_INTERVAL
+from logger import logger
+from metrics import metrics
+
+KEY_PREFIX = "presence:user:"
+# Sorted set of online usernames scored by when their session expires, gives the count and the listing
+ONLINE_KEY = "presence:online"
+# Keyspace channel of the session keys only, so a worker is not woken by the expiry of every other key
+SESSION_EVENTS = f"__keyspace@*__:{KEY_PREFIX}*"
+
+
+def session_key(username: str) -> str:
+    return f"{KEY_PREFIX}{username}"
+
+
+class PresenceTracker:
+    """
+    Tracks online users with a key per session, `presence:user:{username}` -> session id, with a TTL.
+
+    Login claims the key (SET NX, so two concurrent logins cannot both succeed), activity on the session
+    (/verifyToken, /refreshToken, websocket messages) pushes the expiry out, logout deletes it. A client that
+    just disappears is offline once the TTL runs out, so no user stays locked out with "already online".
+    Every check is a single key lookup whatever the number of sessions.
+
+    `presence:online` mirrors the live sessions for an O(1) count (ZCARD) and cursor paginated listing.
+    Expired sessions are removed from it when Redis reports the expiry (keyspace notifications, enabled on
+    start if the server allows it) and by a periodic sweep of the entries whose expiry score has passed,
+    which bounds the staleness when notifications are unavailable or were missed.
+    """
+
+    def __init__(self, redis_client, ttl: int = PRESENCE_TTL, sweep_interval: float = PRESENCE_SWEEP_INTERVAL):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.sweep_interval = sweep_interval
+        self._pubsub = None
+        self._tasks = []
+
+    async def start(self) -> None:
+        await self._enable_expiry_notifications()
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.psubscribe(SESSION_EVENTS)
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._sweep_periodically())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.punsubscribe()
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def _enable_expiry_notifications(self) -> None:
+        try:
+            flags = (await self.redis.config_get("notify-keyspace-events")).get("notify-keyspace-events", "")
+            # "K" keyspace channel, "x" expired events ("A" already includes "x"); the flags other features
+            # rely on are kept
+            missing = "".join(flag for flag in "Kx" if flag not in flags and not (flag == "x" and "A" in flags))
+            if missing:
+                await self.redis.config_set("notify-keyspace-events", flags + missing)
+        except ResponseError as e:
+            # Managed Redis often forbids CONFIG, the periodic sweep still cleans up
+            logger.warning(f"Could not enable keyspace notifications, relying on the presence sweep: {e}")
+
+    async def claim(self, username: str, session_id: str) -> bool:
+        """Start a session for `username`, False if the user already has a live one."""
+        if not await self.redis.set(session_key(username), session_id, nx=True, ex=self.ttl):
+            return False
+        await self.redis.zadd(ONLINE_KEY, {username: time.time() + self.ttl})
+        metrics.inc("presence_sessions_started_total")
+        return True
+
+    async def is_online(self, username: str) -> bool:
+        return bool(await self.redis.exists(session_key(username)))
+
+    async def touch(self, username: str, session_id: Optional[str]) -> bool:
+        """Extend the session of `username` if `session_id` is still its live session, returns whether it is."""
+        key = session_key(username)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    current = await pipe.get(key)
+                    if current is None or (session_id is not None and current != session_id):
+                        return False
+                    pipe.multi()
+                    pipe.expire(key, self.ttl)
+                    pipe.zadd(ONLINE_KEY, {username: time.time() + self.ttl})
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    continue
+
+    async def release(self, username: str, session_id: Optional[str]) -> None:
+        """End the session, unless the user has logged in again since (tokens without a session id end any)."""
+        key = session_key(username)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(key)
+                    current = await pipe.get(key)
+                    if current is not None and session_id is not None and current != session_id:
+                        return
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.zrem(ONLINE_KEY, username)
+                    await pipe.execute()
+                    return
+                except WatchError:
+                    continue
+
+    async def count(self) -> int:
+        return await self.redis.zcard(ONLINE_KEY)
+
+    async def page(self, cursor: int = 0, limit: int = 100) -> Tuple[int, List[str]]:
+        """
+        At most `limit` online usernames and the cursor of the next page (0 when done).
+
+        The cursor is the offset among the live sessions ordered by expiry, so a user whose session is
+        refreshed or expires between pages may appear twice or be missed, as with SCAN.
+        """
+        # One extra entry tells whether there is a next page
+        usernames = await self.redis.zrangebyscore(ONLINE_KEY, f"({time.time()}", "+inf", start=cursor, num=limit + 1)
+        if len(usernames) > limit:
+            return cursor + limit, usernames[:limit]
+        return 0, usernames
+
+    async def sweep(self) -> int:
+        """Remove the users whose session expired from `presence:online`, returns how many were removed."""
+        removed = await self.redis.zremrangebyscore(ONLINE_KEY, "-inf", time.time())
+        if removed:
+            metrics.inc("presence_sessions_expired_total", removed, source="sweep")
+        metrics.set_gauge("presence_online_users", await self.count())
+        return removed
+
+    async def _sweep_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"Presence sweep failed: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    # The channel is __keyspace@{db}__:presence:user:{username}, the data is the event name
+                    if message["type"] != "pmessage" or message["data"] != "expired":
+                        continue
+                    username = message["channel"].split(KEY_PREFIX, 1)[1]
+                    # The user may have logged in again between the expiry and this message
+                    if not await self.is_online(username):
+                        await self.redis.zrem(ONLINE_KEY, username)
+                        metrics.inc("presence_sessions_expired_total", source="notification")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Presence expiry subscription failed: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,108 @@
+# registration_index.py
+# Redis sets of registered usernames and emails, kept across restarts and refreshed incrementally.
+
+import asyncio
+
+from sqlalchemy.future import select
+
+from config import REGISTRATION_INDEX_BATCH_SIZE
+from database.db_config import SessionLocal
+from database.models.user import User
+from logger import logger
+from metrics import metrics
+
+USERNAMES_KEY = "registered_usernames"
+EMAILS_KEY = "registered_emails"
+# Highest users.id already copied into the sets
+WATERMARK_KEY = "registered_users:last_id"
+# Present while the sets hold every user up to the watermark, i.e. a miss can be trusted
+COMPLETE_KEY = "registered_users:complete"
+
+FIELD_KEYS = {"username": USERNAMES_KEY, "email": EMAILS_KEY}
+
+
+class RegistrationIndex:
+    """
+    Answers "is this username/email taken?" without touching the database in the common case.
+
+    The sets are no longer rebuilt on every boot: `refresh` only copies users with an id above the stored
+    watermark, in pipelined batches, and runs in the background so startup does not grow with the user
+    base. Until a refresh has completed (fresh Redis, or Redis lost its data) a miss is confirmed against
+    the users table. Either way the table's unique constraints have the final word, see /register.
+    """
+
+    def __init__(self, redis_client, batch_size: int = REGISTRATION_INDEX_BATCH_SIZE):
+        self.redis = redis_client
+        self.batch_size = batch_size
+        self._refresh_task = None
+
+    def start(self) -> None:
+        self._refresh_task = asyncio.create_task(self.refresh())
+
+    async def stop(self) -> None:
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+
+    async def refresh(self) -> int:
+        """Copy users registered since the last refresh into the sets, returns how many were added."""
+        # If the sets were lost the watermark went with them, so this restarts from the beginning
+        last_id = int(await self.redis.get(WATERMARK_KEY) or 0)
+        added = 0
+        try:
+            while True:
+                async with SessionLocal() as db:
+                    result = await db.execute(
+                        select(User.id, User.username, User.email)
+                        .where(User.id > last_id).order_by(User.id).limit(self.batch_size)
+                    )
+                    rows = result.all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    pipe.sadd(USERNAMES_KEY, *(row.username for row in rows))
+                    pipe.sadd(EMAILS_KEY, *(row.email for row in rows))
+                    pipe.set(WATERMARK_KEY, last_id)
+                    await pipe.execute()
+                added += len(rows)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Refreshing the registration index failed: {e}")
+            return added
+
+        await self.redis.set(COMPLETE_KEY, 1)
+        metrics.inc("registration_index_refreshed_total", added)
+        logger.info(f"Registration index refreshed with {added} new users")
+        return added
+
+    async def is_taken(self, field: str, value: str) -> bool:
+        key = FIELD_KEYS[field]
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sismember(key, value)
+            pipe.exists(COMPLETE_KEY)
+            is_member, complete = await pipe.execute()
+        if is_member:
+            return True
+        if complete:
+            return False
+
+        # Cold index: ask the table (an index lookup on the unique column)
+        metrics.inc("registration_index_db_checks_total")
+        async with SessionLocal() as db:
+            result = await db.execute(select(User.id).where(getattr(User, field) == value).limit(1))
+            return result.first() is not None
+
+    async def add(self, username: str, email: str) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.sadd(USERNAMES_KEY, username)
+            pipe.sadd(EMAILS_KEY, email)
+            await pipe.execute()
+
+    async def replace_email(self, old_email: str, new_email: str) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.srem(EMAILS_KEY, old_email)
+            pipe.sadd(EMAILS_KEY, new_email)
+            await pipe.execute()
@@ -6,3 +6,8 @@ class PredictionResponseMLP(BaseModel):
 
 class PredictionResponseLR(BaseModel):
     labels: list[int]
+
+class PredictionResponseMLPColumnar(BaseModel):
+    labels: list[int]
+    probabilities_0: list[float]
+    probabilities_1: list[float]
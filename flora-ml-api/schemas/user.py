@@ -24,3 +24,15 @@ class UpdateUserRequest(BaseModel):
 
 
 
+
+
+class UserSnapshot(BaseModel):
+    # Cached, read-only view of a users row (no password hash) used by the authenticated user context
+    id: int
+    username: str
+    email: str
+    role: Optional[str] = None
+    access_type: Optional[str] = None
+    federated_learning: bool
+    sharing4good: bool
+    salt: str
@@ -0,0 +1,40 @@
+# streaming.py
+# Helpers for streamed JSON/NDJSON responses and opaque keyset pagination cursors.
+
+import base64
+import json
+from typing import AsyncIterator, List
+
+
+def encode_cursor(*values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor: str) -> List:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+async def ndjson_lines(batches: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    """Serialise batches of rows as newline delimited JSON, one network write per batch."""
+    async for rows in batches:
+        if rows:
+            yield "".join(json.dumps(row) + "\n" for row in rows)
+
+
+async def json_array(batches: AsyncIterator[List[dict]]) -> AsyncIterator[str]:
+    """Serialise batches of rows as a single JSON array without holding the whole array in memory."""
+    yield "["
+    first = True
+    async for rows in batches:
+        if not rows:
+            continue
+        body = ",".join(json.dumps(row) for row in rows)
+        yield body if first else "," + body
+        first = False
+    yield "]"
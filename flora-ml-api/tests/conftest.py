@@ -0,0 +1,13 @@
+import os
+
+import pytest
+
+# database/db_config.py builds its engine on import; the tests never connect, any file based URL works
+os.environ.setdefault("DB_URL", "sqlite+aiosqlite:///unused.db")
+
+
+# Coroutine tests run on the anyio plugin (anyio_mode = auto in pytest.ini), on asyncio only
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
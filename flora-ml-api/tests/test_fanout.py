@@ -0,0 +1,34 @@
+import fakeredis
+import pytest
+
+from fanout import WebSocketFanout, CONNECTED_USERS_KEY, CONNECTION_OWNERS_KEY, worker_alive_key, worker_clients_key
+
+
+@pytest.fixture
+async def redis_client():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    yield client
+    await client.aclose()
+
+
+async def test_sweep_removes_only_the_clients_of_dead_workers(redis_client):
+    dead, alive, sweeper = (WebSocketFanout(redis_client) for _ in range(3))
+    for worker in (dead, alive, sweeper):
+        await worker.start()
+    try:
+        await dead.register("a", object())
+        await dead.register("b", object())
+        await alive.register("c", object())
+        # "b" reconnected to the live worker before the dead one was noticed
+        await alive.register("b", object())
+        await redis_client.delete(worker_alive_key(dead.worker_id))
+
+        assert await sweeper.sweep_dead_workers() == 1
+        assert await redis_client.smembers(CONNECTED_USERS_KEY) == {"b", "c"}
+        assert await redis_client.hgetall(CONNECTION_OWNERS_KEY) == {"b": alive.worker_id, "c": alive.worker_id}
+        assert not await redis_client.exists(worker_clients_key(dead.worker_id))
+        assert await sweeper.sweep_dead_workers() == 0
+    finally:
+        for worker in (dead, alive, sweeper):
+            worker.sockets.clear()
+            await worker.stop()
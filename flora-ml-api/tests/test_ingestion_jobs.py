@@ -0,0 +1,40 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from ingestion.jobs import IngestionJobs, QUEUE_KEY, PROCESSING_KEY, job_key
+
+
+@pytest.fixture
+async def jobs():
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    yield IngestionJobs(redis_client, workers=0, lease_seconds=0.3)
+    await redis_client.aclose()
+
+
+async def test_claim_writes_the_heartbeat_with_the_move(jobs):
+    job_id = await jobs.enqueue("unused.csv", "alice")
+    # Queued for longer than the lease
+    await jobs.redis.hset(job_key(job_id), "heartbeat", 0)
+
+    assert await jobs._claim() == job_id
+    await jobs.requeue_stale()
+
+    assert await jobs.redis.lrange(PROCESSING_KEY, 0, -1) == [job_id]
+    assert await jobs.redis.llen(QUEUE_KEY) == 0
+    assert await jobs._claim() is None
+
+
+async def test_lease_is_refreshed_while_the_job_runs(jobs):
+    job_id = await jobs.enqueue("unused.csv", "alice")
+    assert await jobs._claim() == job_id
+    lease = asyncio.create_task(jobs._refresh_lease(job_id))
+    try:
+        # Three leases without any progress written by the job itself
+        await asyncio.sleep(0.9)
+        await jobs.requeue_stale()
+    finally:
+        lease.cancel()
+
+    assert await jobs.redis.lrange(PROCESSING_KEY, 0, -1) == [job_id]
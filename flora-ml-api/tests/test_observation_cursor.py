@@ -0,0 +1,25 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from database.observation_queries import decode_observation_cursor
+from streaming import encode_cursor
+
+DATE = "2024-01-01T01:00:00+00:00"
+
+
+def test_round_trip():
+    assert decode_observation_cursor(encode_cursor(DATE, 42)) == (datetime(2024, 1, 1, 1, tzinfo=timezone.utc), 42)
+
+
+@pytest.mark.parametrize("values", [
+    (DATE, "42"), (DATE, 4.2), (DATE, True), (DATE, -1), (DATE, 2 ** 40), ("not a date", 1), (1, 1), (DATE,),
+])
+def test_tampered_cursor_is_rejected(values):
+    with pytest.raises(ValueError):
+        decode_observation_cursor(encode_cursor(*values))
+
+
+def test_garbage_is_rejected():
+    with pytest.raises(ValueError):
+        decode_observation_cursor("not base64 json")
@@ -0,0 +1,54 @@
+import fakeredis
+import pytest
+
+from FL_scripts.orchestrator import RoundOrchestrator, RoundNotCollecting, CURRENT_ROUND_KEY, COLLECTING, round_key
+
+
+@pytest.fixture
+async def redis_client():
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    yield client
+    await client.aclose()
+
+
+async def start_worker(redis_client, latest_round_on_disk: int) -> RoundOrchestrator:
+    worker = RoundOrchestrator(redis_client)
+    await worker.init_round(latest_round_on_disk)
+    return worker
+
+
+async def test_worker_restart_keeps_the_round_in_progress(redis_client):
+    worker_a = await start_worker(redis_client, 3)
+    worker_b = await start_worker(redis_client, 3)
+    round_number = await worker_a.begin_upload()
+
+    # Worker A restarts while the upload it registered is still in flight, with an older round folder on disk
+    await worker_a.stop()
+    worker_a = await start_worker(redis_client, 2)
+
+    assert await worker_b.current_round() == 3
+    assert await worker_a.current_round() == 3
+    assert await worker_b.begin_upload() == 3
+    assert await redis_client.hget(round_key(3), "uploads_in_flight") == "2"
+    await worker_a.end_upload(round_number)
+    await worker_b.end_upload(3)
+    assert await redis_client.hget(round_key(3), "state") == COLLECTING
+
+
+async def test_missing_round_key_falls_back_to_the_initial_round(redis_client):
+    worker = await start_worker(redis_client, 5)
+    await redis_client.delete(CURRENT_ROUND_KEY)
+
+    assert await worker.current_round() == 5
+    assert await worker.begin_upload() == 5
+    # The upload seeded the key again for the other workers
+    assert await redis_client.get(CURRENT_ROUND_KEY) == "5"
+    await worker.end_upload(5)
+
+
+async def test_uploads_are_refused_once_the_round_is_aggregating(redis_client):
+    worker = await start_worker(redis_client, 1)
+    await redis_client.hset(round_key(1), "state", "aggregating")
+
+    with pytest.raises(RoundNotCollecting):
+        await worker.begin_upload()
@@ -0,0 +1,94 @@
+import fakeredis
+import numpy as np
+import pytest
+
+from ML.models import prediction_cache as prediction_cache_module
+from ML.models.prediction_cache import PredictionCache
+from ML.models.registry import ModelRegistry
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    """A registry with one fake model whose version is the content of its checkpoint file."""
+    checkpoint = tmp_path / "model.bin"
+    checkpoint.write_bytes(b"v1")
+    registry = ModelRegistry(check_interval=0)
+    registry.register("FAKE", lambda: object(), [str(checkpoint)])
+    registry.load_all()
+    monkeypatch.setattr(prediction_cache_module, "model_registry", registry)
+    registry.checkpoint = checkpoint
+    return registry
+
+
+class Scorer:
+    """Labels each row with its first feature > 0 and counts the rows it was asked to score."""
+
+    def __init__(self):
+        self.rows_scored = 0
+
+    async def __call__(self, rows):
+        self.rows_scored += len(rows)
+        return (rows[:, 0] > 0).astype(np.int64), np.full(len(rows), 0.75, dtype=np.float32)
+
+
+async def test_only_missing_rows_are_scored(registry):
+    cache, scorer = PredictionCache(max_size=100, redis_ttl=0), Scorer()
+    await cache.predict("FAKE", [[1.0, 2.0], [-1.0, 2.0]], scorer)
+    labels, probabilities = await cache.predict("FAKE", [[1.0, 2.0], [3.0, 4.0], [-1.00001, 2.0]], scorer)
+
+    assert scorer.rows_scored == 3
+    assert labels.tolist() == [1, 1, 0]
+    assert probabilities.tolist() == [0.75, 0.75, 0.75]
+
+
+async def test_local_tier_evicts_least_recently_used(registry):
+    cache, scorer = PredictionCache(max_size=2, redis_ttl=0), Scorer()
+    await cache.predict("FAKE", [[1.0], [2.0]], scorer)
+    # Touch [1.0] so [2.0] is the least recently used when [3.0] is added
+    await cache.predict("FAKE", [[1.0]], scorer)
+    await cache.predict("FAKE", [[3.0]], scorer)
+    assert scorer.rows_scored == 3
+
+    await cache.predict("FAKE", [[1.0], [3.0]], scorer)
+    assert scorer.rows_scored == 3
+    await cache.predict("FAKE", [[2.0]], scorer)
+    assert scorer.rows_scored == 4
+
+
+async def test_redis_tier_is_shared_between_workers(registry):
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    scorer = Scorer()
+    await PredictionCache(redis_client, max_size=100, redis_ttl=60).predict("FAKE", [[1.0], [-2.0]], scorer)
+
+    labels, probabilities = await PredictionCache(redis_client, max_size=100, redis_ttl=60).predict(
+        "FAKE", [[1.0], [-2.0]], scorer)
+    assert scorer.rows_scored == 2
+    assert labels.tolist() == [1, 0]
+    assert probabilities.tolist() == [0.75, 0.75]
+    keys = await redis_client.keys("prediction_cache:*")
+    assert len(keys) == 2
+    assert all([0 < await redis_client.ttl(key) <= 60 for key in keys])
+    await redis_client.aclose()
+
+
+async def test_reload_invalidates_cached_rows(registry):
+    cache, scorer = PredictionCache(max_size=100, redis_ttl=0), Scorer()
+    await cache.predict("FAKE", [[1.0]], scorer)
+    version = registry.loaded_version("FAKE")
+
+    registry.checkpoint.write_bytes(b"v2")
+    registry.get("FAKE")
+    assert registry.loaded_version("FAKE") != version
+
+    await cache.predict("FAKE", [[1.0]], scorer)
+    assert scorer.rows_scored == 2
+
+
+async def test_version_lookup_never_reloads(registry):
+    cache, scorer = PredictionCache(max_size=100, redis_ttl=0), Scorer()
+    version = registry.loaded_version("FAKE")
+    registry.checkpoint.write_bytes(b"v2")
+
+    await cache.predict("FAKE", [[1.0]], scorer)
+    # Reloads are left to the inference threads calling get()
+    assert registry.loaded_version("FAKE") == version
@@ -0,0 +1,60 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+from presence import PresenceTracker, ONLINE_KEY
+
+
+@pytest.fixture
+async def presence():
+    redis_client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    yield PresenceTracker(redis_client, ttl=60)
+    await redis_client.aclose()
+
+
+async def test_pages_honor_the_limit(presence):
+    for i in range(7):
+        assert await presence.claim(f"user{i}", f"session{i}")
+
+    pages, cursor = [], 0
+    while True:
+        cursor, usernames = await presence.page(cursor, limit=3)
+        pages.append(usernames)
+        if cursor == 0:
+            break
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sorted(sum(pages, [])) == [f"user{i}" for i in range(7)]
+
+
+async def test_expired_sessions_are_not_listed(presence):
+    await presence.claim("alice", "a")
+    await presence.claim("bob", "b")
+    await presence.redis.zadd(ONLINE_KEY, {"bob": 1})
+
+    assert await presence.page(0, limit=10) == (0, ["alice"])
+
+
+async def test_second_login_is_refused_until_release(presence):
+    assert await presence.claim("alice", "a")
+    assert not await presence.claim("alice", "b")
+    await presence.release("alice", "a")
+    assert await presence.claim("alice", "b")
+
+
+async def test_expiry_notification_removes_only_expired_sessions(presence):
+    # fakeredis sends no keyspace notifications, they are published the way Redis does
+    await presence.start()
+    try:
+        await presence.claim("alice", "a")
+        await presence.claim("bob", "b")
+        await presence.redis.delete("presence:user:bob")
+        await presence.redis.publish("__keyspace@0__:presence:user:bob", "expired")
+        await presence.redis.publish("__keyspace@0__:presence:user:alice", "expire")
+        await presence.redis.publish("__keyevent@0__:expired", "presence:user:alice")
+        await asyncio.sleep(0.1)
+    finally:
+        await presence.stop()
+
+    assert await presence.redis.zrange(ONLINE_KEY, 0, -1) == ["alice"]
@@ -0,0 +1,199 @@
+# token_revocation.py
+# Revoked JWTs keyed by their jti, expiring together with the token, with an in-process Bloom filter in front.
+
+import asyncio
+import hashlib
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from sqlalchemy import delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
+from config import TOKEN_REVOCATION_BLOOM_BITS, TOKEN_REVOCATION_BLOOM_HASHES, TOKEN_REVOCATION_REBUILD_INTERVAL
+from database.db_config import SessionLocal
+from database.models.blacklisted_tokens import BlacklistedTokens
+from logger import logger
+from metrics import metrics
+
+KEY_PREFIX = "revoked_token"
+CHANNEL = "token_revocations"
+
+
+def token_id(token: str, payload: dict) -> str:
+    """The revocation id of a token: its jti claim, or a hash of the token for tokens issued without one."""
+    jti = payload.get("jti")
+    if jti:
+        return jti
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class BloomFilter:
+    """Fixed size Bloom filter over strings, using double hashing of a single blake2b digest."""
+
+    def __init__(self, num_bits: int, num_hashes: int):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray((num_bits + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class TokenRevocationStore:
+    """
+    Revocation list for JWTs.
+
+    A revoked token is stored as `revoked_token:{jti}` with a TTL equal to the token's remaining lifetime,
+    so Redis only ever holds tokens that could still be presented. Every worker keeps a Bloom filter of
+    revoked ids, fed by a pub/sub channel, and only asks Redis when the filter says "maybe" - the common
+    "not revoked" answer needs no network call. The BlacklistedTokens table is the durable copy: it is
+    used to rebuild Redis and the filter on startup and to answer when Redis lost a key the filter knows.
+
+    Another worker's revocation becomes visible here once its pub/sub message arrives (normally milliseconds).
+    """
+
+    def __init__(self, redis_client, max_token_lifetime: timedelta, bloom_bits: int = TOKEN_REVOCATION_BLOOM_BITS,
+                 bloom_hashes: int = TOKEN_REVOCATION_BLOOM_HASHES,
+                 rebuild_interval: float = TOKEN_REVOCATION_REBUILD_INTERVAL):
+        self.redis = redis_client
+        self.max_token_lifetime = max_token_lifetime
+        self.bloom_bits = bloom_bits
+        self.bloom_hashes = bloom_hashes
+        self.rebuild_interval = rebuild_interval
+        self.bloom = BloomFilter(bloom_bits, bloom_hashes)
+        self._tasks = []
+        self._pubsub = None
+        # Ids revoked while a rebuild is reading the table, re-added to the new filter once it is swapped in
+        self._pending: Optional[set] = None
+
+    @staticmethod
+    def redis_key(jti: str) -> str:
+        return f"{KEY_PREFIX}:{jti}"
+
+    async def start(self) -> None:
+        self._pubsub = self.redis.pubsub()
+        await self._pubsub.subscribe(CHANNEL)
+        await self.rebuild()
+        self._tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._rebuild_periodically())]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(CHANNEL)
+            await self._pubsub.aclose()
+            self._pubsub = None
+
+    async def revoke(self, jti: str, expires_at: datetime) -> None:
+        now = datetime.now(timezone.utc)
+        ttl = int((expires_at - now).total_seconds()) + 1
+        if ttl <= 0:
+            # Already expired, jwt.decode rejects it anyway
+            return
+
+        async with SessionLocal() as db:
+            db.add(BlacklistedTokens(token=jti, blacklisted_at=now))
+            try:
+                await db.commit()
+            except IntegrityError:
+                await db.rollback()
+
+        await self.redis.set(self.redis_key(jti), now.isoformat(), ex=ttl)
+        self._remember(jti)
+        await self.redis.publish(CHANNEL, jti)
+        metrics.inc("token_revocations_total")
+
+    async def is_revoked(self, jti: str) -> bool:
+        if jti not in self.bloom:
+            metrics.inc("token_revocation_checks_total", result="bloom_negative")
+            return False
+
+        if await self.redis.exists(self.redis_key(jti)):
+            metrics.inc("token_revocation_checks_total", result="revoked")
+            return True
+
+        # Either a Bloom false positive or Redis lost the key (e.g. it was restarted), ask the durable copy
+        async with SessionLocal() as db:
+            result = await db.execute(select(BlacklistedTokens.blacklisted_at).where(BlacklistedTokens.token == jti))
+            blacklisted_at: Optional[datetime] = result.scalar_one_or_none()
+        if blacklisted_at is None:
+            metrics.inc("token_revocation_checks_total", result="false_positive")
+            return False
+
+        metrics.inc("token_revocation_checks_total", result="restored")
+        ttl = self._remaining_ttl(blacklisted_at)
+        if ttl > 0:
+            await self.redis.set(self.redis_key(jti), blacklisted_at.isoformat(), ex=ttl)
+        return True
+
+    def _remember(self, jti: str) -> None:
+        self.bloom.add(jti)
+        if self._pending is not None:
+            self._pending.add(jti)
+
+    def _remaining_ttl(self, blacklisted_at: datetime) -> int:
+        # The exp claim is not stored, but a token can never outlive its revocation by more than its full lifetime
+        if blacklisted_at.tzinfo is None:
+            blacklisted_at = blacklisted_at.replace(tzinfo=timezone.utc)
+        expires_at = blacklisted_at + self.max_token_lifetime
+        return int((expires_at - datetime.now(timezone.utc)).total_seconds()) + 1
+
+    async def rebuild(self) -> None:
+        """Prune expired rows, restore Redis from the table and replace the Bloom filter (which cannot forget)."""
+        cutoff = datetime.now(timezone.utc) - self.max_token_lifetime
+        self._pending = set()
+        async with SessionLocal() as db:
+            await db.execute(delete(BlacklistedTokens).where(BlacklistedTokens.blacklisted_at < cutoff))
+            await db.commit()
+            result = await db.execute(select(BlacklistedTokens.token, BlacklistedTokens.blacklisted_at))
+            rows = result.all()
+
+        bloom = BloomFilter(self.bloom_bits, self.bloom_hashes)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for jti, blacklisted_at in rows:
+                ttl = self._remaining_ttl(blacklisted_at)
+                if ttl > 0:
+                    bloom.add(jti)
+                    pipe.set(self.redis_key(jti), blacklisted_at.isoformat(), ex=ttl, nx=True)
+            await pipe.execute()
+
+        for jti in self._pending:
+            bloom.add(jti)
+        self.bloom = bloom
+        self._pending = None
+        metrics.set_gauge("token_revocations_active", len(rows))
+
+    async def _rebuild_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.rebuild_interval)
+            try:
+                await self.rebuild()
+            except Exception as e:
+                logger.error(f"Rebuilding the token revocation filter failed: {e}")
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Token revocation subscription failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message is not None:
+                self._remember(message["data"])
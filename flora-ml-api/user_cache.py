@@ -0,0 +1,97 @@
+# user_cache.py
+# Two tier cache (in-process LRU with TTL, then Redis) of user snapshots for authenticated requests.
+
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from sqlalchemy.future import select
+
+from config import USER_CACHE_SIZE, USER_CACHE_LOCAL_TTL, USER_CACHE_REDIS_TTL
+from database.db_config import SessionLocal
+from database.models.user import User
+from metrics import metrics
+from schemas.user import UserSnapshot
+
+CACHE_PREFIX = "user_snapshot"
+
+
+def snapshot_from_user(user: User) -> UserSnapshot:
+    return UserSnapshot(
+        id=user.id,
+        username=user.username,
+        email=user.email,
+        role=user.role,
+        access_type=user.access_type,
+        federated_learning=user.federated_learning,
+        sharing4good=user.sharing4good,
+        salt=user.salt,
+    )
+
+
+class UserContextCache:
+    """
+    Resolves a username to a UserSnapshot with as few round trips as possible.
+
+    Lookups go local LRU -> Redis -> database. The local tier has a short TTL because other worker
+    processes can only learn about an invalidation through Redis, so a stale local entry lives at
+    most USER_CACHE_LOCAL_TTL seconds after /update_user_info or /update_user_preferences.
+    """
+
+    def __init__(self, redis_client, max_size: int = USER_CACHE_SIZE, local_ttl: float = USER_CACHE_LOCAL_TTL,
+                 redis_ttl: int = USER_CACHE_REDIS_TTL):
+        self.redis = redis_client
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.redis_ttl = redis_ttl
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+
+    @staticmethod
+    def redis_key(username: str) -> str:
+        return f"{CACHE_PREFIX}:{username}"
+
+    def _get_local(self, username: str) -> Optional[UserSnapshot]:
+        entry = self._local.get(username)
+        if entry is None:
+            return None
+        expires_at, snapshot = entry
+        if expires_at < time.monotonic():
+            del self._local[username]
+            return None
+        self._local.move_to_end(username)
+        return snapshot
+
+    def _set_local(self, snapshot: UserSnapshot) -> None:
+        self._local[snapshot.username] = (time.monotonic() + self.local_ttl, snapshot)
+        self._local.move_to_end(snapshot.username)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    async def get(self, username: str) -> Optional[UserSnapshot]:
+        snapshot = self._get_local(username)
+        if snapshot is not None:
+            metrics.inc("user_cache_hits_total", tier="local")
+            return snapshot
+
+        cached = await self.redis.get(self.redis_key(username))
+        if cached is not None:
+            metrics.inc("user_cache_hits_total", tier="redis")
+            snapshot = UserSnapshot(**json.loads(cached))
+            self._set_local(snapshot)
+            return snapshot
+
+        metrics.inc("user_cache_misses_total")
+        async with SessionLocal() as db:
+            result = await db.execute(select(User).filter(User.username == username))
+            user = result.scalar_one_or_none()
+        if user is None:
+            return None
+        snapshot = snapshot_from_user(user)
+        await self.redis.set(self.redis_key(username), json.dumps(dict(snapshot)), ex=self.redis_ttl)
+        self._set_local(snapshot)
+        return snapshot
+
+    async def invalidate(self, username: str) -> None:
+        self._local.pop(username, None)
+        await self.redis.delete(self.redis_key(username))